@@ -0,0 +1,449 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import itertools
+import subprocess
+from datetime import datetime, timezone, timedelta
+
+from fakes import (
+    FakeWeatherServer, FakeTelegramServer, weather_payload, forecast_payload,
+    message_update, inline_query_update, city_names
+)
+
+logger = logging.getLogger('benchmark')
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(REPO_DIR, '.benchmarks')
+BENCH_SIZES = (1000, 100000, 1000000)
+
+# Замер длится не меньше BENCH_MIN_TIME секунд и BENCH_MIN_ROUNDS повторов;
+# быстрые функции вызываются пачками не короче BENCH_BATCH_TIME
+BENCH_MIN_TIME = 0.5
+BENCH_MIN_ROUNDS = 5
+BENCH_BATCH_TIME = 0.002
+BENCH_ASYNC_MIN_ROUNDS = 20
+# Замедление медианы больше этого процента при сравнении считается регрессией
+REGRESSION_THRESHOLD = 10.0
+
+# Синтетические данные: одинаковые при каждом запуске
+DATASET_SEED = 20240601
+SPOTS_PER_CITY = 200
+REPORT_BATCH_SIZE = 10000
+SPECIES = (
+    'щука', 'окунь', 'судак', 'лещ', 'плотва', 'карп', 'карась', 'сом',
+    'жерех', 'язь', 'голавль', 'налим', 'форель', 'хариус', 'линь',
+)
+BAITS = ('воблер', 'блесна', 'твистер', 'червь', 'опарыш', 'мотыль', 'кукуруза', 'живец', '')
+SPOT_TYPES = ('озеро', 'река', 'пруд', 'водохранилище', 'карьер')
+SEASONS = ('круглый год', 'апрель-октябрь', 'май-сентябрь', 'зима')
+
+
+def synthetic_spots(count, seed=DATASET_SEED):
+    """Места в городах по SPOTS_PER_CITY, с координатами вокруг центра города"""
+    rng = random.Random(seed)
+    cities = [(f"Посёлок {i}", rng.uniform(43, 68), rng.uniform(28, 135))
+              for i in range(max(1, count // SPOTS_PER_CITY))]
+    for i in range(count):
+        city, lat, lon = cities[i % len(cities)]
+        yield {
+            'name': f"Водоём {i}",
+            'type': rng.choice(SPOT_TYPES),
+            'city': city,
+            'latitude': round(lat + rng.gauss(0, 0.2), 5),
+            'longitude': round(lon + rng.gauss(0, 0.3), 5),
+            'fish_species': ', '.join(rng.sample(SPECIES, rng.randint(1, 4))),
+            'description': f"Синтетическое место {i}",
+            'best_season': rng.choice(SEASONS),
+            'access_type': rng.choice(('бесплатный', 'платный')),
+        }
+
+
+def synthetic_reports(count, max_spot_id, rng):
+    """Аргументы _write_fishing_report: каждый пятый отчёт без улова"""
+    for _ in range(count):
+        if rng.random() < 0.2:
+            fish_caught = ''
+        else:
+            fish_caught = ', '.join(f"{name} {rng.randint(1, 5)} шт" for name in rng.sample(SPECIES, rng.randint(1, 3)))
+        yield (rng.randint(1, max_spot_id), rng.randint(1, 50000), fish_caught, 'ясно',
+               rng.choice(BAITS), rng.randint(1, 5), '')
+
+
+def prepare_database(size, workdir, rebuild=False):
+    """
+    База на size мест, size отчётов и size подписок. Готовая база из прошлого
+    запуска используется повторно: на миллион строк она собирается минуты.
+    """
+    from cache import normalize_city
+    from database import FishingDatabase
+
+    path = os.path.join(workdir, f'spots-{size}.db')
+    if rebuild:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    db = FishingDatabase(path)
+    conn = db.connection()
+    count = lambda table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    rng = random.Random(DATASET_SEED + size)
+
+    if count('fishing_spots') < size:
+        logger.info(f"База {size}: загрузка мест")
+        db.import_spots(synthetic_spots(size))
+    missing = size - count('fishing_reports')
+    if missing > 0:
+        logger.info(f"База {size}: {missing} отчётов")
+        max_spot_id = conn.execute('SELECT MAX(id) FROM fishing_spots').fetchone()[0]
+        reports = synthetic_reports(missing, max_spot_id, rng)
+        while True:
+            batch = [(db._write_fishing_report, args) for args in itertools.islice(reports, REPORT_BATCH_SIZE)]
+            if not batch:
+                break
+            db.commit_batch(batch)
+    missing = size - count('subscriptions')
+    if missing > 0:
+        logger.info(f"База {size}: {missing} подписок")
+        # Одной транзакцией: add_subscription фиксирует каждую подписку отдельно
+        cities = [name for name, in conn.execute('SELECT DISTINCT city FROM fishing_spots LIMIT 1000')]
+        offset = count('subscriptions')
+        with conn:
+            conn.executemany(
+                '''INSERT OR IGNORE INTO subscriptions (chat_id, city, city_key, local_time, send_minute)
+                   VALUES (?, ?, ?, ?, ?)''',
+                ((offset + i, city, normalize_city(city), f"{minute // 60:02d}:{minute % 60:02d}", minute)
+                 for i, city, minute in ((i, rng.choice(cities), rng.randrange(1440)) for i in range(missing)))
+            )
+    conn.execute('PRAGMA optimize')
+    return db
+
+
+def database_cases(db, rng, samples=200):
+    """Запросы FishingDatabase с разными аргументами, чтобы не мерить один горячий путь"""
+    conn = db.connection()
+    max_spot_id = conn.execute('SELECT MAX(id) FROM fishing_spots').fetchone()[0]
+    spot_ids = [rng.randint(1, max_spot_id) for _ in range(samples)]
+    spots = conn.execute(
+        f"SELECT city, latitude, longitude FROM fishing_spots WHERE id IN ({','.join('?' * samples)})", spot_ids
+    ).fetchall()
+    max_report_id = conn.execute('SELECT MAX(id) FROM fishing_reports').fetchone()[0]
+    cursors = conn.execute(
+        f"SELECT created_at, id FROM fishing_reports WHERE id IN ({','.join('?' * samples)})",
+        [rng.randint(1, max_report_id) for _ in range(samples)]
+    ).fetchall()
+    chat_ids = [chat_id for chat_id, in conn.execute('SELECT chat_id FROM subscriptions ORDER BY random() LIMIT ?', (samples,))]
+    since = (datetime.now(timezone.utc).date() - timedelta(days=30)).isoformat()
+    today = datetime.now(timezone.utc).date().isoformat()
+    minutes = [rng.randrange(1440 - 5) for _ in range(samples)]
+
+    return [
+        ('get_spots_by_city', db.get_spots_by_city, [(city,) for city, _, _ in spots]),
+        ('get_spots_by_fish', db.get_spots_by_fish, [(name,) for name in SPECIES]),
+        ('get_cities', db.get_cities, [()]),
+        ('get_spots_near', db.get_spots_near,
+         [(lat, lon, 50, 5) for _, lat, lon in spots if lat is not None]),
+        ('get_reports_page', db.get_reports_page, [(None, None, 20)]),
+        ('get_reports_page_deep', db.get_reports_page, [(None, tuple(cursor), 20) for cursor in cursors]),
+        ('get_reports_page_spot', db.get_reports_page, [(spot_id, None, 20) for spot_id in spot_ids]),
+        ('get_spot_catch_stats', db.get_spot_catch_stats, [(spot_id, since, 5) for spot_id in spot_ids]),
+        ('get_species_hotspots', db.get_species_hotspots, [(name, since, 5) for name in SPECIES]),
+        ('get_subscriptions', db.get_subscriptions, [(chat_id,) for chat_id in chat_ids]),
+        ('get_due_subscriptions', db.get_due_subscriptions, [(m, m + 5, today) for m in minutes]),
+    ]
+
+
+def _summary(group, name, size, rounds, calls):
+    """Статистика по времени одного вызова в каждом повторе, в микросекундах"""
+    rounds = sorted(rounds)
+    mean = sum(rounds) / len(rounds)
+    return {
+        'group': group,
+        'name': name,
+        'size': size,
+        'rounds': len(rounds),
+        'calls': calls,
+        'min_us': rounds[0] * 1e6,
+        'median_us': rounds[len(rounds) // 2] * 1e6,
+        'p95_us': rounds[min(len(rounds) - 1, int(len(rounds) * 0.95))] * 1e6,
+        'mean_us': mean * 1e6,
+        'ops_per_sec': 1 / mean if mean else 0.0,
+    }
+
+
+def _label(result):
+    return f"{result['group']}.{result['name']}" + (f" [{result['size']}]" if result['size'] else '')
+
+
+def _run_batch(func, args, number):
+    batch = [next(args) for _ in range(number)]
+    started = time.perf_counter()
+    for item in batch:
+        func(*item)
+    return time.perf_counter() - started
+
+
+def bench(group, name, func, args, size=None, min_time=BENCH_MIN_TIME):
+    """
+    Замер синхронной функции по кругу аргументов. Число вызовов в пачке
+    подбирается так, чтобы пачка шла не меньше BENCH_BATCH_TIME (первые
+    пачки служат прогревом); результат — время одного вызова.
+    """
+    args = itertools.cycle(args)
+    number = 1
+    while True:
+        elapsed = _run_batch(func, args, number)
+        if elapsed >= BENCH_BATCH_TIME:
+            break
+        number *= max(2, min(10, int(BENCH_BATCH_TIME / max(elapsed, 1e-9)) + 1))
+    rounds = []
+    deadline = time.perf_counter() + min_time
+    while len(rounds) < BENCH_MIN_ROUNDS or time.perf_counter() < deadline:
+        rounds.append(_run_batch(func, args, number) / number)
+    result = _summary(group, name, size, rounds, number * len(rounds))
+    logger.info(f"{_label(result)}: {result['median_us']:.1f} мкс")
+    return result
+
+
+async def bench_async(group, name, operation, prepare=None, min_time=BENCH_MIN_TIME):
+    """Замер корутины: каждый вызов по отдельности, prepare() выполняется перед ним вне замера"""
+    for _ in range(3):
+        if prepare is not None:
+            await prepare()
+        await operation()
+    rounds = []
+    deadline = time.perf_counter() + min_time
+    while len(rounds) < BENCH_ASYNC_MIN_ROUNDS or time.perf_counter() < deadline:
+        if prepare is not None:
+            await prepare()
+        started = time.perf_counter()
+        await operation()
+        rounds.append(time.perf_counter() - started)
+    result = _summary(group, name, None, rounds, len(rounds))
+    logger.info(f"{_label(result)}: {result['median_us']:.1f} мкс")
+    return result
+
+
+async def run_bot_benchmarks(args):
+    """Оценка клёва, текст прогноза, клиент погоды и обработчики на синтетических обновлениях"""
+    # Модули бота читают адреса API и квоты из окружения при импорте
+    import bot
+    from telegram import Update
+    from weather import WeatherClient, QuotaGovernor
+    from scoring import rank_cities
+
+    rng = random.Random(DATASET_SEED)
+    cities = city_names()
+    results = []
+
+    fishing_bot = bot.FishingBot()
+    application = bot.build_application(fishing_bot, token='123456:BENCHMARK')
+    await application.initialize()
+    await fishing_bot.startup(application)
+    try:
+        conditions = [(rng.uniform(-10, 30), rng.uniform(980, 1040), rng.uniform(0, 15),
+                       rng.choice((None, rng.uniform(-8, 8)))) for _ in range(1000)]
+        results.append(bench('scoring', 'calculate_fishing_conditions',
+                             fishing_bot.calculate_fishing_conditions, conditions, min_time=args.min_time))
+        today = [(city, 'today', weather_payload({'q': city})) for city in cities]
+        forecast = [(city, 'forecast', forecast_payload({'q': city})) for city in cities]
+        results.append(bench('render', 'format_forecast_today', fishing_bot.format_forecast, today,
+                             min_time=args.min_time))
+        results.append(bench('render', 'format_forecast_5days', fishing_bot.format_forecast, forecast,
+                             min_time=args.min_time))
+        # Все интервалы прогнозов всех городов справочника — одним векторным вызовом
+        forecasts = {city: data for city, _, data in forecast}
+        results.append(bench('scoring', 'rank_cities', rank_cities, [(forecasts,)],
+                             size=len(forecasts), min_time=args.min_time))
+
+        # Клиент без справочника: каждый запрос идёт к заглушке по названию города
+        client = WeatherClient('benchmark', governor=QuotaGovernor(per_minute=10 ** 9, per_day=10 ** 12))
+        city_cycle = itertools.cycle(cities)
+        for url_type in ('today', 'forecast'):
+            results.append(await bench_async(
+                'weather', f'fetch_{url_type}',
+                lambda url_type=url_type: client.fetch(next(city_cycle), url_type),
+                min_time=args.min_time))
+        await client.close()
+
+        update_ids = itertools.count(1)
+        chat_id = 10 ** 6
+
+        def process(**kwargs):
+            data = message_update(next(update_ids), chat_id, **kwargs)
+            return application.process_update(Update.de_json(data, application.bot))
+
+        spots = await fishing_bot.db.get_cities()
+        locations = itertools.cycle([(city['latitude'], city['longitude']) for city in spots
+                                     if city['latitude'] is not None])
+        prefixes = itertools.cycle([city[:3].lower() for city in cities])
+        results.append(await bench_async('handler', 'start', lambda: process(text='/start'),
+                                         min_time=args.min_time))
+        for label, button in (('city_today', '🎣 Прогноз на сегодня'), ('city_5days', '🎣 Прогноз на 5 дней')):
+            results.append(await bench_async(
+                'handler', label, lambda: process(text=next(city_cycle)),
+                prepare=lambda button=button: process(text=button), min_time=args.min_time))
+        results.append(await bench_async(
+            'handler', 'location', lambda: process(location=next(locations)), min_time=args.min_time))
+        results.append(await bench_async(
+            'handler', 'inline_query',
+            lambda: application.process_update(Update.de_json(
+                inline_query_update(next(update_ids), chat_id, next(prefixes)), application.bot)),
+            min_time=args.min_time))
+    finally:
+        await fishing_bot.shutdown(application)
+        await application.shutdown()
+    return results
+
+
+def run_database_benchmarks(size, args):
+    db = prepare_database(size, args.workdir, args.rebuild)
+    try:
+        rng = random.Random(DATASET_SEED)
+        return [bench('database', name, func, cases, size=size, min_time=args.min_time)
+                for name, func, cases in database_cases(db, rng)]
+    finally:
+        db.close()
+
+
+def environment():
+    """Коммит, версии и машина, на которых выполнен замер"""
+    import sqlite3
+    import numpy
+
+    def git(*command):
+        try:
+            return subprocess.run(('git',) + command, cwd=REPO_DIR, capture_output=True,
+                                  text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ''
+
+    return {
+        'commit': git('rev-parse', 'HEAD') or None,
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'sqlite': sqlite3.sqlite_version,
+        'numpy': numpy.__version__,
+    }
+
+
+def metadata(args):
+    """Условия замера: окружение и параметры заглушек"""
+    return {
+        **environment(),
+        'sizes': args.sizes,
+        'min_time': args.min_time,
+        'owm_latency': args.owm_latency,
+        'owm_jitter': args.owm_jitter,
+        'owm_error_rate': args.owm_error_rate,
+        'telegram_latency': args.telegram_latency,
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Изменение медиан относительно прошлого запуска; возвращает список регрессий"""
+    previous = {(item['group'], item['name'], item['size']): item for item in baseline['results']}
+    regressions = []
+    for item in results:
+        before = previous.get((item['group'], item['name'], item['size']))
+        if before is None or not before['median_us']:
+            item['change_pct'] = None
+            continue
+        item['change_pct'] = (item['median_us'] - before['median_us']) / before['median_us'] * 100
+        if item['change_pct'] > threshold:
+            regressions.append(item)
+    return regressions
+
+
+def print_table(results, file=sys.stdout):
+    print(f"{'замер':<42} {'размер':>8} {'медиана, мкс':>13} {'p95, мкс':>12} {'оп/с':>11} {'изм.':>8}", file=file)
+    for item in results:
+        change = item.get('change_pct')
+        print(f"{item['group'] + '.' + item['name']:<42} {item['size'] or '':>8} {item['median_us']:>13.1f} "
+              f"{item['p95_us']:>12.1f} {item['ops_per_sec']:>11.0f} "
+              f"{'' if change is None else f'{change:+.1f}%':>8}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Замеры производительности бота без сети: заглушки OpenWeatherMap и Telegram, синтетические данные"
+    )
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=list(BENCH_SIZES), help="размеры базы через запятую (по умолчанию 1000,100000,1000000)")
+    parser.add_argument('--min-time', type=float, default=BENCH_MIN_TIME, help="минимальная длительность замера, с")
+    parser.add_argument('--skip-bot', action='store_true', help="только запросы к базе")
+    parser.add_argument('--skip-db', action='store_true', help="без запросов к базе")
+    parser.add_argument('--owm-latency', type=float, default=0.0, help="задержка заглушки OpenWeatherMap, с")
+    parser.add_argument('--owm-jitter', type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument('--owm-error-rate', type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="задержка заглушки Telegram, с")
+    parser.add_argument('--workdir', default=BENCH_DIR, help="каталог для баз и результатов")
+    parser.add_argument('--rebuild', action='store_true', help="пересобрать синтетические базы")
+    parser.add_argument('--output', help="файл результатов JSON (по умолчанию <workdir>/<коммит>.json)")
+    parser.add_argument('--compare', help="файл результатов прошлого запуска для сравнения")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="допустимое замедление медианы при сравнении, %%")
+    parser.add_argument('-v', '--verbose', action='store_true', help="журнал бота и заглушек")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        level=logging.INFO if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+    args.workdir = os.path.abspath(args.workdir)
+    args.output = args.output and os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    owm = FakeWeatherServer(latency=args.owm_latency, jitter=args.owm_jitter,
+                            error_rate=args.owm_error_rate, seed=DATASET_SEED).start()
+    telegram = FakeTelegramServer(latency=args.telegram_latency, seed=DATASET_SEED).start()
+    # Окружение задаётся до импорта модулей бота; файлы кэша и базы мест — в рабочем каталоге
+    os.environ.update({
+        'WEATHER_API_BASE': owm.api_base,
+        'TELEGRAM_API_URL': telegram.url,
+        'OWM_CALLS_PER_MINUTE': str(10 ** 9),
+        'OWM_CALLS_PER_DAY': str(10 ** 12),
+    })
+    os.chdir(args.workdir)
+
+    results = []
+    try:
+        if not args.skip_bot:
+            results += asyncio.run(run_bot_benchmarks(args))
+        if not args.skip_db:
+            for size in args.sizes:
+                results += run_database_benchmarks(size, args)
+    finally:
+        owm.stop()
+        telegram.stop()
+
+    report = {'meta': metadata(args), 'results': results}
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+    output = args.output or os.path.join(
+        args.workdir, f"{(report['meta']['commit'] or 'local')[:12]}{'-dirty' if report['meta']['dirty'] else ''}.json"
+    )
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_table(results)
+    print(f"\nРезультаты: {output}")
+    if regressions:
+        print(f"Регрессии больше {args.threshold:.0f}%: " + ', '.join(
+            f"{_label(item)} ({item['change_pct']:+.1f}%)" for item in regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
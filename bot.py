@@ -1,101 +1,236 @@
 import os
+import time
+import asyncio
 import logging
-import requests
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from datetime import datetime
+import functools
+
+# Таймер создаётся до тяжёлых импортов, чтобы в отчёт о старте попало и их время
+from timing import StartupTimer
+startup_timer = StartupTimer()
+
+from telegram import (
+    Update, ReplyKeyboardMarkup, KeyboardButton, InlineQueryResultArticle, InputTextMessageContent
+)
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, InlineQueryHandler, filters, ContextTypes
+)
+from datetime import datetime, timezone, timedelta
 import math
+startup_timer.mark('импорт telegram')
+
+from weather import WeatherClient, QuotaExceeded, INTERACTIVE, BACKGROUND
+from cache import WeatherCache, WeatherStore
+from prefetch import PrefetchScheduler
+from gazetteer import Gazetteer, place_key
+from observations import ObservationStore
+from database import fishing_db, AsyncFishingDatabase
+from dispatch import ChatOrderedUpdateProcessor
+from webhook import serve_webhook
+from subscriptions import SubscriptionEngine, parse_local_time, utc_send_minute
+from metrics import (
+    registry, instrumented, metrics_routes, HANDLER_PHASE_SECONDS, ERRORS
+)
+from scoring import (
+    hpa_to_mmhg, fishing_score, fishing_verdict, score_forecast, pressure_trend_label, preload as preload_scoring
+)
+startup_timer.mark('импорт модулей бота')
 
 # Настройка логирования
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+# httpx пишет на INFO каждый запрос с полным адресом, а в нём ключ API погоды
+# (appid=...) и токен бота; такие строки нужны только при отладке
+logging.getLogger('httpx').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # Конфигурация с вашими токенами
 BOT_TOKEN = os.getenv('BOT_TOKEN', "8199190847:AAFFnG2fYEd3Zurne8yP1alevSsSeKh5VRk")
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY', "d192e284d050cbe679c3641f372e7a02")
 WEBHOOK_URL = os.getenv('WEBHOOK_URL', "https://spin-fm-bot-pgjh.onrender.com")
+# Другой адрес Bot API (например, локальная заглушка при нагрузочных замерах)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
 
-WEATHER_API_URL_TODAY = "http://api.openweathermap.org/data/2.5/weather"
-WEATHER_API_URL_FORECAST = "http://api.openweathermap.org/data/2.5/forecast"
+NEARBY_RADIUS_KM = float(os.getenv('NEARBY_RADIUS_KM', 50))
+NEARBY_LIMIT = int(os.getenv('NEARBY_LIMIT', 5))
 
-def hpa_to_mmhg(hpa):
-    """Конвертирует гектопаскали в миллиметры ртутного столба."""
-    return hpa * 0.750062
+# Инлайн-режим: число подсказок и время кэширования ответа на стороне Telegram
+INLINE_RESULTS_LIMIT = int(os.getenv('INLINE_RESULTS_LIMIT', 8))
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 60))
+INLINE_PENDING_CACHE_TIME = 5
+INLINE_MAX_PREFETCH = 3
 
 class FishingBot:
     def __init__(self):
-        self.weather_cache = {}
         self.cache_timeout = 1800
+        self.weather_cache = WeatherCache(ttl=self.cache_timeout, store=WeatherStore())
+        self.gazetteer = Gazetteer()
+        self.weather_client = WeatherClient(WEATHER_API_KEY, gazetteer=self.gazetteer)
+        self.observations = ObservationStore()
+        self.background_fetch = functools.partial(self.fetch_weather, priority=BACKGROUND)
+        self.prefetcher = PrefetchScheduler(self.weather_cache, self.background_fetch)
+        self.db = AsyncFishingDatabase(fishing_db)
+        self.update_processor = ChatOrderedUpdateProcessor()
+        self.subscriptions = SubscriptionEngine(self.db, self.get_background_weather, self.format_forecast)
+        self.register_metrics()
 
-    def get_weather_data(self, city, url_type='forecast'):
-        """Получение прогноза погоды."""
-        try:
-            params = {
-                'q': city,
-                'appid': WEATHER_API_KEY,
-                'units': 'metric',
-                'lang': 'ru'
-            }
-            api_url = WEATHER_API_URL_FORECAST if url_type == 'forecast' else WEATHER_API_URL_TODAY
-            response = requests.get(api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            return data
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка запроса к API погоды: {e}")
-            return None
-
-    def calculate_fishing_conditions(self, temp, pressure, wind_speed):
+    def register_metrics(self):
+        """Счётчики компонентов бота в /metrics: значения берутся из их stats() при выгрузке."""
+        registry.add_stats(
+            'weather_cache', 'Кэш погоды', self.weather_cache.stats,
+            counters=('hits', 'misses', 'store_hits', 'coalesced', 'refreshes', 'stale_served', 'evictions'),
+            gauges=('size', 'inflight'))
+        registry.add_stats(
+            'weather_quota', 'Квота API погоды', self.weather_client.governor.stats,
+            counters=('granted', 'denied'), gauges=('tokens', 'day_used'))
+        registry.add_stats(
+            'bot_updates', 'Очередь обновлений', self.update_processor.stats,
+            counters=('processed',), gauges=('waiting', 'processing', 'active_chats', 'avg_wait', 'max_wait'))
+        registry.add_stats(
+            'gazetteer', 'Справочник городов', self.gazetteer.stats,
+            counters=('lookups', 'exact_hits', 'fuzzy_hits'), gauges=('keys',))
+        registry.add_stats(
+            'observations', 'История наблюдений', self.observations.stats,
+            counters=('recorded',), gauges=('cities', 'bytes'))
+        registry.add_stats(
+            'subscriptions', 'Рассылка прогнозов', self.subscriptions.stats,
+            counters=('sent', 'failed'))
+
+    async def get_weather_data(self, city, url_type='forecast'):
         """
-        Прогнозирование клёва на основе погоды с тремя простыми советами.
+        Получение прогноза погоды через кэш без блокировки цикла событий.
+        Возвращает CachedWeather или None, если город не найден.
         """
-        score = 0
-        
-        # Влияние температуры
-        if 10 <= temp <= 20:
-            score += 2
-        elif temp > 20:
-            score += 1
-        else:
-            score -= 1
-
-        # Влияние давления (нормальное давление ~760 мм рт. ст.)
-        pressure_mmhg = hpa_to_mmhg(pressure)
-        if 755 <= pressure_mmhg <= 765:
-            score += 2
-        elif pressure_mmhg < 755:
-            score += 1
-        else:
-            score -= 1
-
-        # Влияние ветра
-        if wind_speed < 5:
-            score += 2
-        elif wind_speed >= 5:
-            score += 1
-
-        # Определение иконки и единого совета на основе очков
-        if score >= 4:
-            icon = "🟢"
-            advice = "Клевать будет так, что клиент позабудет обо всём на свете! *Бриллиантовая рука."
-        elif score >= 2:
-            icon = "🟡"
-            advice = "Если очень хочется и делать все равно нечего, то можно и порыбачить."
+        return await self.weather_cache.get_or_fetch(city, url_type, self.fetch_weather)
+
+    async def get_background_weather(self, city, url_type='forecast'):
+        """
+        Погода для рассылки: запрос к API расходует только фоновую квоту,
+        а при её нехватке отдаются последние известные данные.
+        """
+        return await self.weather_cache.get_background(city, url_type, self.background_fetch)
+
+    async def fetch_weather(self, city, url_type='forecast', priority=INTERACTIVE):
+        """Запрос к API погоды; фактическая погода заодно попадает в историю наблюдений."""
+        data = await self.weather_client.fetch(city, url_type, priority)
+        if data and url_type == 'today':
+            self.observations.record(city, data)
+        return data
+
+    async def startup(self, application: Application):
+        """
+        Подготовка перед приёмом обновлений: прогрев кэша погоды, справочника
+        городов и схемы базы. Шаги независимы и выполняются параллельно в потоках.
+        """
+        startup_timer.mark('инициализация Telegram')
+
+        def measured(phase, func):
+            with startup_timer.measure(phase):
+                return func()
+
+        _, _, _, cities = await asyncio.gather(
+            asyncio.to_thread(measured, 'кэш погоды', self.weather_cache.warm_up),
+            asyncio.to_thread(measured, 'справочник городов', self.gazetteer.load),
+            asyncio.to_thread(measured, 'история наблюдений', self.observations.load),
+            asyncio.to_thread(measured, 'база мест', self.db.db.get_cities),
+        )
+        # Города из базы мест тоже попадают в подсказки инлайн-режима
+        for city in cities:
+            if city['latitude'] is not None and city['longitude'] is not None:
+                self.gazetteer.add_place(city['city'].capitalize(), city['latitude'], city['longitude'])
+        if application.job_queue is not None:
+            self.prefetcher.start(application.job_queue)
+            self.subscriptions.start(application.job_queue)
         else:
-            icon = "🔴"
-            advice = "Лучше остаться дома и посмотреть сериальчик😜"
+            logger.warning("JobQueue недоступна, фоновое обновление погоды и рассылка отключены")
+        startup_timer.mark('подготовка данных')
+        startup_timer.report()
+
+        # NumPy нужен только прогнозу на 5 дней: загружаем его уже после старта
+        asyncio.get_running_loop().run_in_executor(None, preload_scoring)
+
+    async def shutdown(self, application: Application):
+        """Освобождение ресурсов при остановке приложения."""
+        await self.weather_client.close()
+        await self.weather_cache.store.close()
+        await self.observations.close()
+        await self.db.close()
+
+    def calculate_fishing_conditions(self, temp, pressure, wind_speed, pressure_change=None):
+        """
+        Прогнозирование клёва на основе погоды с тремя простыми советами.
+        pressure_change — изменение давления за сутки (гПа) по истории наблюдений.
+        """
+        return fishing_verdict(fishing_score(temp, pressure, wind_speed, pressure_change))
+
+    def format_forecast(self, city, forecast_type, weather_data):
+        """Текст прогноза погоды и клёва для ответа пользователю."""
+        if forecast_type == 'today':
+            main_data = weather_data['main']
+            wind_speed = weather_data['wind']['speed']
+            pressure_mmhg = hpa_to_mmhg(main_data['pressure'])
+            # Тренд давления по уже накопленным наблюдениям, без лишних запросов к API
+            trend = self.observations.pressure_trend(city, weather_data)
+            pressure_change = trend[0] if trend else None
+
+            fishing_icon, fishing_advice = self.calculate_fishing_conditions(
+                main_data['temp'],
+                main_data['pressure'],
+                wind_speed,
+                pressure_change
+            )
             
-        return icon, advice
+            forecast_text = f"**Прогноз на сегодня для {city.capitalize()}:**\n"
+            forecast_text += f"🌡️ **Температура**: {main_data['temp']:.1f}°C\n"
+            forecast_text += f"🌬️ **Ветер**: {wind_speed:.1f} м/с\n"
+            forecast_text += f"💧 **Влажность**: {main_data['humidity']}%\n"
+            forecast_text += f"📉 **Давление**: {pressure_mmhg:.1f} мм рт. ст.\n"
+            if trend:
+                change, hours = trend
+                forecast_text += (f"📈 **Давление за {hours:.0f} ч**: {hpa_to_mmhg(change):+.1f} мм рт. ст. "
+                                  f"({pressure_trend_label(change)})\n")
+            forecast_text += f"🐟 **Клёв**: **{fishing_icon} {fishing_advice}**"
+            return forecast_text
+
+        forecast_text = f"Прогноз клёва и погоды на 5 дней для города **{city.capitalize()}**:\n\n"
+        
+        current_hour = datetime.now().hour
+        if 5 <= current_hour < 10 or 17 <= current_hour < 22:
+            forecast_text += "✨ **Сейчас лучшее время для рыбалки! Утренний и вечерний клёв самые активные.**\n\n"
+        
+        # Оцениваются все 3-часовые интервалы, для каждого дня показывается лучшее окно
+        for day in score_forecast(weather_data):
+            fishing_icon, fishing_advice = fishing_verdict(day['best_score'])
+            window = f"{day['window_start'].strftime('%H:%M')}–{day['window_end'].strftime('%H:%M')}"
+
+            forecast_text += f"**{day['date'].strftime('%A, %d %B')}**\n"
+            forecast_text += f"⏰ **Лучшее время**: {window}\n"
+            forecast_text += f"🌡️ **Температура**: {day['temp']:.1f}°C, ощущается как {day['feels_like']:.1f}°C "
+            forecast_text += f"(за день {day['min_temp']:.0f}…{day['max_temp']:.0f}°C)\n"
+            forecast_text += f"🌬️ **Ветер**: {day['wind']:.1f} м/с\n"
+            forecast_text += f"☁️ **Облачность**: {day['clouds']}%\n"
+            forecast_text += f"💧 **Влажность**: {day['humidity']}%\n"
+            forecast_text += f"📉 **Давление**: {hpa_to_mmhg(day['pressure']):.1f} мм рт. ст.\n"
+            forecast_text += f"🐟 **Клёв**: **{fishing_icon} {fishing_advice}**\n"
+            forecast_text += "––––––––––––––––––––\n"
+        return forecast_text
+
+    def not_found_text(self, city):
+        """Ответ на неизвестный город: с подсказкой, если в справочнике есть похожее название."""
+        suggestion = self.gazetteer.suggest(city)
+        if suggestion is not None:
+            return f"Не могу найти такой город. Вы имели в виду «{suggestion.name}»?"
+        return "Не могу найти такой город. Попробуйте еще раз."
 
+    @instrumented('start')
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
         keyboard = [
             [KeyboardButton('🎣 Прогноз на сегодня')],
             [KeyboardButton('🎣 Прогноз на 5 дней')],
+            [KeyboardButton('📍 Места рядом', request_location=True)],
             [KeyboardButton('📊 Помощь')]
         ]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
@@ -109,16 +244,21 @@ class FishingBot:
         await update.message.reply_text(welcome_text, reply_markup=reply_markup)
         logger.info(f"Команда /start выполнена для пользователя {user.first_name}")
 
+    @instrumented('send_help')
     async def send_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отправка справочной информации"""
         help_text = """
 Помощь по боту:
 * Нажми кнопку "**Прогноз на сегодня**" или "**Прогноз на 5 дней**".
 * Введи название города, когда я попрошу.
+* Нажми "**Места рядом**" или отправь геопозицию, чтобы найти ближайшие водоёмы.
 * Используй команду /start, чтобы перезапустить бота и снова увидеть кнопки.
+* /subscribe Москва 7:00 — присылать прогноз каждое утро в указанное время (местное время города).
+* /unsubscribe Москва — отписаться от города, /unsubscribe — от всех; /subscriptions — мои подписки.
 """
         await update.message.reply_text(help_text)
 
+    @instrumented('prompt_city')
     async def prompt_city(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отправляет запрос на ввод города и сохраняет тип прогноза в контекст."""
         button_text = update.message.text
@@ -129,6 +269,7 @@ class FishingBot:
         
         await update.message.reply_text("Отлично! Теперь введи название города, для которого нужно сделать прогноз.")
 
+    @instrumented('handle_city_input')
     async def handle_city_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обрабатывает введенное название города и отправляет прогноз."""
         city = update.message.text
@@ -138,68 +279,184 @@ class FishingBot:
             await update.message.reply_text("Пожалуйста, сначала выбери тип прогноза, нажав на одну из кнопок.")
             return
             
+        # Разные написания одного города ("г. Москва", "Moscow") сводятся к одному названию
+        place = self.gazetteer.resolve(city)
+        if place is not None:
+            city = place.name
+
         await update.message.reply_text(f"Ищу прогноз для города **{city}**...")
         
-        weather_data = self.get_weather_data(city, url_type=forecast_type)
+        try:
+            with HANDLER_PHASE_SECONDS.time('handle_city_input', 'weather'):
+                weather = await self.get_weather_data(city, url_type=forecast_type)
+        except QuotaExceeded:
+            await update.message.reply_text("Сервис погоды сейчас перегружен. Попробуйте через пару минут.")
+            return
         
-        if not weather_data:
-            await update.message.reply_text("Не могу найти такой город. Попробуйте еще раз.")
+        if not weather:
+            await update.message.reply_text(self.not_found_text(city))
             return
 
-        if forecast_type == 'today':
-            main_data = weather_data['main']
-            wind_speed = weather_data['wind']['speed']
-            clouds = weather_data['clouds']['all']
-            pressure_mmhg = hpa_to_mmhg(main_data['pressure'])
+        self.prefetcher.record(city)
 
-            fishing_icon, fishing_advice = self.calculate_fishing_conditions(
-                main_data['temp'],
-                main_data['pressure'],
-                wind_speed
+        with HANDLER_PHASE_SECONDS.time('handle_city_input', 'render'):
+            forecast_text = self.format_forecast(city, forecast_type, weather.data)
+        if weather.stale:
+            minutes = max(1, int((time.time() - weather.fetched_at) // 60))
+            forecast_text += f"\n\n⏳ Данные обновлены {minutes} мин назад: сервис погоды сейчас перегружен."
+        with HANDLER_PHASE_SECONDS.time('handle_city_input', 'reply'):
+            await update.message.reply_text(forecast_text)
+        context.user_data.pop('forecast_type', None)
+
+    @instrumented('subscribe')
+    async def subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /subscribe <город> <ЧЧ:ММ> — ежедневный прогноз в местное время города."""
+        args = context.args or []
+        local_minute = parse_local_time(args[-1]) if len(args) >= 2 else None
+        if local_minute is None:
+            await update.message.reply_text("Формат: /subscribe Москва 7:00")
+            return
+
+        city = ' '.join(args[:-1])
+        place = self.gazetteer.resolve(city)
+        if place is not None:
+            city = place.name
+
+        # Заодно проверяем город и узнаём его часовой пояс
+        try:
+            weather = await self.get_weather_data(city, url_type='today')
+        except QuotaExceeded:
+            weather = None
+        if not weather:
+            await update.message.reply_text(self.not_found_text(city))
+            return
+
+        send_minute = utc_send_minute(local_minute, weather.data.get('timezone', 0))
+        now = datetime.now(timezone.utc)
+        # Если время сегодня уже прошло, первая рассылка будет завтра. Иначе отмечаем
+        # вчерашний день, чтобы досылка после полуночи не прислала вчерашний прогноз
+        last_sent = now.date() if send_minute <= now.hour * 60 + now.minute else now.date() - timedelta(days=1)
+        last_sent_date = last_sent.isoformat()
+        local_time = f"{local_minute // 60:02d}:{local_minute % 60:02d}"
+        saved = await self.db.add_subscription(update.effective_chat.id, city, local_time, send_minute, last_sent_date)
+        if not saved:
+            await update.message.reply_text("⚠️ Не удалось сохранить подписку. Попробуйте позже.")
+            return
+        await update.message.reply_text(f"Готово! Прогноз для города {city} будет приходить каждый день в {local_time}.")
+
+    @instrumented('unsubscribe')
+    async def unsubscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /unsubscribe [город]."""
+        city = ' '.join(context.args or []) or None
+        if city is not None:
+            place = self.gazetteer.resolve(city)
+            if place is not None:
+                city = place.name
+        removed = await self.db.remove_subscriptions(update.effective_chat.id, city)
+        if removed:
+            await update.message.reply_text("Подписка отменена.")
+        else:
+            await update.message.reply_text("Подписок не найдено.")
+
+    @instrumented('list_subscriptions')
+    async def list_subscriptions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /subscriptions — список подписок чата."""
+        subscriptions = await self.db.get_subscriptions(update.effective_chat.id)
+        if not subscriptions:
+            await update.message.reply_text("Подписок пока нет. Пример: /subscribe Москва 7:00")
+            return
+        lines = [f"• {item['city']} в {item['local_time']}" for item in subscriptions]
+        await update.message.reply_text("Твои подписки:\n" + "\n".join(lines))
+
+    @instrumented('handle_location')
+    async def handle_location(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Отвечает на геопозицию списком ближайших рыболовных мест."""
+        location = update.message.location
+        spots = await self.db.get_spots_near(
+            location.latitude, location.longitude, NEARBY_RADIUS_KM, NEARBY_LIMIT
+        )
+
+        if not spots:
+            await update.message.reply_text(
+                f"В радиусе {NEARBY_RADIUS_KM:.0f} км я не знаю рыболовных мест. Попробуй другую точку."
             )
-            
-            forecast_text = f"**Прогноз на сегодня для {city.capitalize()}:**\n"
-            forecast_text += f"🌡️ **Температура**: {main_data['temp']:.1f}°C\n"
-            forecast_text += f"🌬️ **Ветер**: {wind_speed:.1f} м/с\n"
-            forecast_text += f"💧 **Влажность**: {main_data['humidity']}%\n"
-            forecast_text += f"📉 **Давление**: {pressure_mmhg:.1f} мм рт. ст.\n"
-            forecast_text += f"🐟 **Клёв**: **{fishing_icon} {fishing_advice}**"
+            return
 
-        else: # forecast_type == 'forecast'
-            forecast_text = f"Прогноз клёва и погоды на 5 дней для города **{city.capitalize()}**:\n\n"
-            
-            current_hour = datetime.now().hour
-            if 5 <= current_hour < 10 or 17 <= current_hour < 22:
-                forecast_text += "✨ **Сейчас лучшее время для рыбалки! Утренний и вечерний клёв самые активные.**\n\n"
-            
-            for item in weather_data['list'][::8]:
-                date_time = datetime.fromtimestamp(item['dt'])
-                main_data = item['main']
-                wind_speed = item['wind']['speed']
-                clouds = item['clouds']['all']
-                pressure_mmhg = hpa_to_mmhg(main_data['pressure'])
-                
-                fishing_icon, fishing_advice = self.calculate_fishing_conditions(
-                    main_data['temp'],
-                    main_data['pressure'],
-                    wind_speed
-                )
-                
-                forecast_text += f"**{date_time.strftime('%A, %d %B')}**\n"
-                forecast_text += f"🌡️ **Температура**: {main_data['temp']:.1f}°C, ощущается как {main_data['feels_like']:.1f}°C\n"
-                forecast_text += f"🌬️ **Ветер**: {wind_speed:.1f} м/с\n"
-                forecast_text += f"☁️ **Облачность**: {clouds}%\n"
-                forecast_text += f"💧 **Влажность**: {main_data['humidity']}%\n"
-                forecast_text += f"📉 **Давление**: {pressure_mmhg:.1f} мм рт. ст.\n"
-                forecast_text += f"🐟 **Клёв**: **{fishing_icon} {fishing_advice}**\n"
-                forecast_text += "––––––––––––––––––––\n"
-            
-        await update.message.reply_text(forecast_text)
-        context.user_data.pop('forecast_type', None)
+        spots_text = "📍 **Ближайшие рыболовные места:**\n\n"
+        for spot in spots:
+            spots_text += f"**{spot['name']}** ({spot['type']}) — {spot['distance_km']:.1f} км\n"
+            if spot['fish_species']:
+                spots_text += f"🐟 **Рыба**: {spot['fish_species']}\n"
+            if spot['rating_count']:
+                spots_text += f"⭐ **Рейтинг**: {spot['avg_rating']} ({spot['rating_count']})\n"
+            spots_text += f"💰 **Доступ**: {spot['access_type']}\n"
+            spots_text += "––––––––––––––––––––\n"
+
+        await update.message.reply_text(spots_text)
+
+    @instrumented('handle_inline_query')
+    async def handle_inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Инлайн-режим: "@бот моск" возвращает карточки прогноза для подходящих городов.
+        Подсказки берутся из индекса справочника, прогнозы только из кэша;
+        для городов без прогноза в кэше запускается фоновая загрузка.
+        """
+        inline_query = update.inline_query
+        places = self.gazetteer.complete(inline_query.query, limit=INLINE_RESULTS_LIMIT)
+
+        results = []
+        pending = []
+        for place in places:
+            key = WeatherCache.make_key(place.name, 'today')
+            weather = self.weather_cache.get(key) or self.weather_cache.get_stale(key)
+            if weather is None:
+                pending.append(place)
+                continue
+            main_data = weather.data['main']
+            trend = self.observations.pressure_trend(place.name, weather.data)
+            fishing_icon, _ = self.calculate_fishing_conditions(
+                main_data['temp'], main_data['pressure'], weather.data['wind']['speed'],
+                trend[0] if trend else None
+            )
+            results.append(InlineQueryResultArticle(
+                id=f"today:{key[0]}",
+                title=f"{place.name}: {main_data['temp']:.0f}°C, клёв {fishing_icon}",
+                description=f"Ветер {weather.data['wind']['speed']:.1f} м/с, давление "
+                            f"{hpa_to_mmhg(main_data['pressure']):.0f} мм рт. ст.",
+                input_message_content=InputTextMessageContent(
+                    self.format_forecast(place.name, 'today', weather.data)
+                ),
+            ))
+
+        for place in pending[:INLINE_MAX_PREFETCH]:
+            # Приложение хранит ссылку на задачу и дожидается её при остановке
+            context.application.create_task(self._prefetch_inline(place.name), name=f"inline_prefetch:{place.name}")
+        for place in pending:
+            results.append(InlineQueryResultArticle(
+                id=f"pending:{place_key(place.name)}",
+                title=f"{place.name}: прогноз загружается…",
+                description="Продолжи ввод или повтори запрос через пару секунд",
+                input_message_content=InputTextMessageContent(
+                    f"Прогноз для города {place.name} можно получить у бота: нажми «🎣 Прогноз на сегодня»."
+                ),
+            ))
+
+        # Пока прогнозы загружаются, ответ кэшируется ненадолго
+        cache_time = INLINE_PENDING_CACHE_TIME if pending else INLINE_CACHE_TIME
+        await inline_query.answer(results, cache_time=cache_time)
+
+    async def _prefetch_inline(self, city):
+        try:
+            await self.weather_cache.refresh(city, 'today', self.background_fetch)
+        except QuotaExceeded:
+            pass
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
         logger.error(f"Ошибка: {context.error}")
+        if not isinstance(update, Update):
+            # Ошибки обработчиков уже посчитаны декоратором instrumented, здесь — фоновые задачи
+            ERRORS.inc('background', type(context.error).__name__)
         if update and update.message:
             await update.message.reply_text("⚠️ Произошла ошибка. Попробуйте позже.")
 
@@ -217,28 +474,49 @@ def main():
     
     # Создание бота
     fishing_bot = FishingBot()
-    
-    # Создание приложения
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = build_application(fishing_bot)
+    startup_timer.mark('сборка приложения')
+
+    # Вебхук и /metrics обслуживаются одним HTTP-сервером на порту веб-сервиса
+    port = int(os.environ.get('PORT', 8080))
+    asyncio.run(serve_webhook(
+        application,
+        listen="0.0.0.0",
+        port=port,
+        url_path=BOT_TOKEN,
+        webhook_url=f"{WEBHOOK_URL}/{BOT_TOKEN}",
+        routes=metrics_routes()
+    ))
+
+def build_application(fishing_bot, token=BOT_TOKEN, api_url=TELEGRAM_API_URL):
+    """Приложение Telegram с обработчиками бота (используется и замерами производительности)."""
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(fishing_bot.update_processor)
+        .post_init(fishing_bot.startup)
+        .post_shutdown(fishing_bot.shutdown)
+    )
+    if api_url:
+        builder = builder.base_url(f"{api_url.rstrip('/')}/bot")
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", fishing_bot.start))
     application.add_handler(CommandHandler("help", fishing_bot.send_help))
+    application.add_handler(CommandHandler("subscribe", fishing_bot.subscribe))
+    application.add_handler(CommandHandler("unsubscribe", fishing_bot.unsubscribe))
+    application.add_handler(CommandHandler("subscriptions", fishing_bot.list_subscriptions))
     
     application.add_handler(MessageHandler(filters.Regex('^🎣 Прогноз на сегодня$'), fishing_bot.prompt_city))
     application.add_handler(MessageHandler(filters.Regex('^🎣 Прогноз на 5 дней$'), fishing_bot.prompt_city))
     application.add_handler(MessageHandler(filters.Regex('^📊 Помощь$'), fishing_bot.send_help))
     
+    application.add_handler(InlineQueryHandler(fishing_bot.handle_inline_query))
+    application.add_handler(MessageHandler(filters.LOCATION, fishing_bot.handle_location))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, fishing_bot.handle_city_input))
 
     application.add_error_handler(fishing_bot.error_handler)
-
-    port = int(os.environ.get('PORT', 8080))
-    application.run_webhook(
-        listen="0.0.0.0",
-        port=port,
-        url_path=BOT_TOKEN,
-        webhook_url=f"{WEBHOOK_URL}/{BOT_TOKEN}"
-    )
+    return application
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+from weather import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 1800))
+WEATHER_CACHE_MAX_SIZE = int(os.getenv('WEATHER_CACHE_MAX_SIZE', 1000))
+WEATHER_CACHE_DB = os.getenv('WEATHER_CACHE_DB', 'weather_cache.db')
+WEATHER_CACHE_FLUSH_INTERVAL = float(os.getenv('WEATHER_CACHE_FLUSH_INTERVAL', 5))
+# Минимальное время жизни записи, даже если данные у источника уже старые
+WEATHER_CACHE_MIN_TTL = 60
+# Сколько хранить устаревшие данные на случай исчерпания квоты или сбоя API
+WEATHER_CACHE_STALE_MAX_AGE = int(os.getenv('WEATHER_CACHE_STALE_MAX_AGE', 6 * 60 * 60))
+
+# Результат запроса к кэшу: данные, время их получения и признак устаревших данных
+CachedWeather = namedtuple('CachedWeather', ['data', 'fetched_at', 'stale'])
+
+
+def normalize_city(city):
+    """Нормализация названия города для ключа кэша: регистр, пробелы, ё."""
+    return ' '.join(city.casefold().replace('ё', 'е').split())
+
+
+class WeatherStore:
+    """
+    Второй уровень кэша погоды в SQLite, переживающий перезапуски процесса.
+    Запись отложенная: новые данные копятся в памяти и сбрасываются пачкой.
+    """
+
+    def __init__(self, db_path=WEATHER_CACHE_DB, flush_interval=WEATHER_CACHE_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> (fetched_at, expires_at, data)
+        self._flush_task = None
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS weather_cache (
+                city_key TEXT NOT NULL,
+                url_type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (city_key, url_type)
+            )
+        ''')
+        self._conn.commit()
+
+    def load(self, key, allow_stale=False):
+        """
+        Чтение одной записи: (expires_at, fetched_at, data) или None.
+        Истёкшие записи возвращаются только при allow_stale.
+        """
+        now = time.time()
+        pending = self._pending.get(key)
+        if pending is not None and (allow_stale or pending[1] > now):
+            return pending[1], pending[0], pending[2]
+        min_expires = now - WEATHER_CACHE_STALE_MAX_AGE if allow_stale else now
+        with self._lock:
+            row = self._conn.execute(
+                '''SELECT expires_at, fetched_at, data FROM weather_cache
+                   WHERE city_key = ? AND url_type = ? AND expires_at > ?''',
+                (key[0], key[1], min_expires)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def load_fresh(self, limit):
+        """Все неистёкшие записи, самые свежие первыми, для прогрева памяти."""
+        with self._lock:
+            rows = self._conn.execute(
+                '''SELECT city_key, url_type, expires_at, fetched_at, data FROM weather_cache
+                   WHERE expires_at > ? ORDER BY fetched_at DESC LIMIT ?''',
+                (time.time(), limit)
+            ).fetchall()
+        return [((city_key, url_type), expires_at, fetched_at, json.loads(data))
+                for city_key, url_type, expires_at, fetched_at, data in rows]
+
+    def save(self, key, data, expires_at, fetched_at):
+        """Ставит запись в очередь на запись и планирует сброс на диск."""
+        self._pending[key] = (fetched_at, expires_at, data)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await asyncio.to_thread(self.flush)
+
+    def flush(self):
+        """Сбрасывает накопленные записи на диск одной транзакцией."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        rows = [(key[0], key[1], json.dumps(data, ensure_ascii=False), fetched_at, expires_at)
+                for key, (fetched_at, expires_at, data) in pending.items()]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO weather_cache (city_key, url_type, data, fetched_at, expires_at) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+                self._conn.execute(
+                    'DELETE FROM weather_cache WHERE expires_at <= ?',
+                    (time.time() - WEATHER_CACHE_STALE_MAX_AGE,)
+                )
+        logger.debug(f"Кэш погоды: записано на диск {len(rows)} записей")
+
+    async def close(self):
+        """Дописывает отложенные записи и закрывает соединение."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await asyncio.to_thread(self.flush)
+        with self._lock:
+            self._conn.close()
+
+
+class WeatherCache:
+    """
+    Кэш погоды в памяти процесса: TTL, ограничение размера по LRU
+    и объединение одновременных промахов по одному ключу в один запрос.
+    Истёкшие записи не удаляются сразу: если квота API исчерпана или источник
+    недоступен, пользователю отдаются последние известные данные.
+    """
+
+    def __init__(self, ttl=WEATHER_CACHE_TTL, max_size=WEATHER_CACHE_MAX_SIZE, store=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.store = store
+        self._entries = OrderedDict()  # key -> (expires_at, fetched_at, data)
+        self._inflight = {}  # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.store_hits = 0
+        self.refreshes = 0
+        self.stale_served = 0
+
+    @staticmethod
+    def make_key(city, url_type):
+        return (normalize_city(city), url_type)
+
+    def expires_for(self, data):
+        """
+        Время истечения записи отсчитывается от момента наблюдения у источника
+        (поле dt текущей погоды), а не от момента нашего запроса.
+        """
+        now = time.time()
+        observed_at = data.get('dt') if isinstance(data, dict) else None
+        if not isinstance(observed_at, (int, float)) or observed_at > now:
+            observed_at = now
+        return max(observed_at + self.ttl, now + WEATHER_CACHE_MIN_TTL)
+
+    def warm_up(self):
+        """Прогрев памяти свежими записями с диска после перезапуска."""
+        if self.store is None:
+            return 0
+        entries = self.store.load_fresh(self.max_size)
+        for key, expires_at, fetched_at, data in reversed(entries):
+            self.set(key, data, expires_at, fetched_at)
+        logger.info(f"Кэш погоды прогрет с диска: {len(entries)} записей")
+        return len(entries)
+
+    def get(self, key):
+        """Возвращает актуальную запись CachedWeather или None."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        self._entries.move_to_end(key)
+        return CachedWeather(entry[2], entry[1], False)
+
+    def get_stale(self, key):
+        """Последние известные данные, даже истёкшие (но не старше WEATHER_CACHE_STALE_MAX_AGE)."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time() - WEATHER_CACHE_STALE_MAX_AGE:
+            return None
+        return CachedWeather(entry[2], entry[1], entry[0] <= time.time())
+
+    def set(self, key, data, expires_at=None, fetched_at=None):
+        """Сохраняет данные в кэш, вытесняя самые давно использованные записи."""
+        if fetched_at is None:
+            fetched_at = time.time()
+        if expires_at is None:
+            expires_at = fetched_at + self.ttl
+        self._entries[key] = (expires_at, fetched_at, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def expires_at(self, key):
+        """Время истечения записи в памяти или None, если её нет."""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    async def get_or_fetch(self, city, url_type, fetch):
+        """
+        Возвращает CachedWeather из кэша, а при промахе вызывает fetch(city, url_type).
+        Параллельные промахи по одному ключу ждут один и тот же запрос.
+        Если источник недоступен или квота исчерпана, отдаются устаревшие данные;
+        если их нет, возвращается None или пробрасывается QuotaExceeded.
+        """
+        key = self.make_key(city, url_type)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        return await self._single_flight(key, city, url_type, fetch, interactive=True)
+
+    async def refresh(self, city, url_type, fetch):
+        """Принудительное обновление записи из источника (для фонового прогрева)."""
+        key = self.make_key(city, url_type)
+        return await self._single_flight(key, city, url_type, fetch, interactive=False)
+
+    async def get_background(self, city, url_type, fetch):
+        """
+        CachedWeather для фоновых задач (рассылки): свежая запись из кэша, иначе
+        обновление через refresh(), где fetch расходует фоновую квоту. Если квоты
+        не хватило или источник недоступен, отдаются устаревшие данные или None.
+        """
+        key = self.make_key(city, url_type)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        try:
+            result = await self.refresh(city, url_type, fetch)
+        except QuotaExceeded:
+            result = None
+        if result is None:
+            return await self._load_stale(key)
+        return result
+
+    async def _single_flight(self, key, city, url_type, fetch, interactive):
+        task = self._inflight.get(key)
+        joined = task is not None
+        if joined:
+            self.coalesced += 1
+        else:
+            if interactive:
+                self.misses += 1
+            else:
+                self.refreshes += 1
+            task = asyncio.ensure_future(self._fetch_and_store(key, city, url_type, fetch, interactive))
+            self._inflight[key] = task
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        if not (interactive and joined):
+            return await asyncio.shield(task)
+        # Общий запрос мог начать фоновый refresh(), который не подставляет
+        # устаревшие данные: пользовательский запрос подставляет их сам
+        try:
+            result = await asyncio.shield(task)
+        except QuotaExceeded:
+            stale = await self._load_stale(key)
+            if stale is None:
+                raise
+            return stale
+        if result is None:
+            return await self._load_stale(key)
+        return result
+
+    async def _fetch_and_store(self, key, city, url_type, fetch, interactive):
+        try:
+            if interactive and self.store is not None:
+                stored = await asyncio.to_thread(self.store.load, key)
+                if stored is not None:
+                    self.store_hits += 1
+                    expires_at, fetched_at, data = stored
+                    self.set(key, data, expires_at, fetched_at)
+                    return CachedWeather(data, fetched_at, False)
+
+            try:
+                data = await fetch(city, url_type)
+            except QuotaExceeded:
+                if not interactive:
+                    raise
+                stale = await self._load_stale(key)
+                if stale is None:
+                    raise
+                return stale
+
+            if data is None:
+                return await self._load_stale(key) if interactive else None
+            fetched_at = time.time()
+            expires_at = self.expires_for(data)
+            self.set(key, data, expires_at, fetched_at)
+            if self.store is not None:
+                self.store.save(key, data, expires_at, fetched_at)
+            return CachedWeather(data, fetched_at, False)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_stale(self, key):
+        stale = self.get_stale(key)
+        if stale is None and self.store is not None:
+            stored = await asyncio.to_thread(self.store.load, key, True)
+            if stored is not None:
+                expires_at, fetched_at, data = stored
+                stale = CachedWeather(data, fetched_at, True)
+        if stale is not None:
+            self.stale_served += 1
+        return stale
+
+    def stats(self):
+        """Счётчики кэша для логов и мониторинга."""
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'store_hits': self.store_hits,
+            'coalesced': self.coalesced,
+            'refreshes': self.refreshes,
+            'stale_served': self.stale_served,
+            'evictions': self.evictions,
+            'inflight': len(self._inflight)
+        }
@@ -1,20 +1,256 @@
+import os
+import math
+import time
+import heapq
+import functools
+import itertools
+import asyncio
 import sqlite3
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import normalize_city
+from metrics import DB_QUERY_SECONDS
 from datetime import datetime
 import json
 
 logger = logging.getLogger(__name__)
 
+# Настройки SQLite (можно переопределить через переменные окружения)
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 16384))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHED_STATEMENTS = 256
+DB_READ_WORKERS = int(os.getenv('DB_READ_WORKERS', 4))
+DB_COMMIT_INTERVAL = float(os.getenv('DB_COMMIT_INTERVAL', 0.05))
+DB_MAX_BATCH = int(os.getenv('DB_MAX_BATCH', 500))
+DB_WRITE_QUEUE_SIZE = int(os.getenv('DB_WRITE_QUEUE_SIZE', 10000))
+# Режим synchronous соединения потока-писателя: FULL — fsync на каждую фиксацию пачки
+DB_WRITE_SYNCHRONOUS = os.getenv('DB_WRITE_SYNCHRONOUS', 'FULL')
+
+# Массовый импорт мест: строк в одной транзакции и кэш страниц на время загрузки
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 50000))
+IMPORT_CACHE_SIZE_KB = int(os.getenv('IMPORT_CACHE_SIZE_KB', 65536))
+# Индексы снимаются и строятся заново, только если импорт больше этой доли уже загруженных мест
+IMPORT_REBUILD_INDEX_RATIO = float(os.getenv('IMPORT_REBUILD_INDEX_RATIO', 0.1))
+# Столбцы места, которые задаются при импорте (и выгружаются при экспорте)
+SPOT_FIELDS = ('name', 'type', 'city', 'latitude', 'longitude', 'fish_species',
+               'description', 'best_season', 'access_type')
+
+# Столбцы места в порядке, который ожидает FishingDatabase._row_to_spot
+SPOT_COLUMNS = '''fs.id, fs.name, fs.type, fs.city, fs.latitude, fs.longitude, fs.fish_species,
+               fs.description, fs.best_season, fs.access_type, fs.avg_rating, fs.rating_count'''
+
+# Столбцы отчета в порядке, который ожидает FishingDatabase._row_to_report
+REPORT_COLUMNS = '''fr.id, fr.spot_id, fr.user_id, fr.report_date, fr.fish_caught, fr.weather_conditions,
+                 fr.bait_used, fr.rating, fr.comment, fr.created_at, fs.name'''
+# Понедельник недели даты в SQLite: ключ недели в сводках уловов
+SQL_WEEK_START = "'-6 days', 'weekday 1'"
+REPORTS_PAGE_SIZE = 20
+# Сколько мест с видом рыбы отдаёт один запрос (лучшие по оценке)
+SPOTS_BY_FISH_LIMIT = 50
+
+# Поиск мест рядом: начальный радиус поиска и средний радиус Земли
+NEARBY_INITIAL_RADIUS_KM = 5
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Расстояние по большому кругу между двумя точками в километрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_boxes(lat, lon, radius_km):
+    """
+    Прямоугольники (min_lat, max_lat, min_lon, max_lon), покрывающие круг радиуса radius_km.
+    При пересечении меридиана 180° возвращается два прямоугольника.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE_LAT * cos_lat) >= 180:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    dlon = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+# Падежные окончания, отбрасываемые при нормализации названия вида: "щуку" -> "щук"
+SPECIES_ENDINGS = ('ами', 'ями', 'ов', 'ев', 'ей', 'ой', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях',
+                   'а', 'я', 'у', 'ю', 'ы', 'и', 'е', 'о', 'ь', 'й')
+SPECIES_MIN_STEM = 2
+
+@functools.lru_cache(maxsize=4096)
+def species_key(name):
+    """Ключ вида рыбы: нормализованные слова без падежных окончаний"""
+    words = []
+    for word in normalize_city(name or '').split():
+        for ending in SPECIES_ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= SPECIES_MIN_STEM:
+                word = word[:-len(ending)]
+                break
+        words.append(word)
+    return ' '.join(words)
+
+def split_species(fish_species):
+    """Разбор списка видов через запятую в множество ключей"""
+    keys = {species_key(name) for name in (fish_species or '').split(',')}
+    keys.discard('')
+    return keys
+
+# Слова в тексте улова, не относящиеся к виду рыбы: "щука 3 кг", "окунь 5 шт"
+CATCH_UNITS = {'кг', 'г', 'гр', 'грамм', 'шт', 'штук', 'штуки', 'x', 'х'}
+
+def catch_species(fish_caught):
+    """Виды рыбы из текста улова: {ключ вида: название}, без количеств и единиц"""
+    species = {}
+    for part in (fish_caught or '').split(','):
+        words = [word for word in normalize_city(part).split()
+                 if word not in CATCH_UNITS and not any(char.isdigit() for char in word)]
+        name = ' '.join(words)
+        key = species_key(name)
+        if key:
+            species.setdefault(key, name)
+    return species
+
+class ConnectionManager:
+    """
+    Долгоживущие соединения SQLite, по одному на поток.
+    Соединение настраивается один раз: WAL, synchronous=NORMAL, кэш страниц и mmap,
+    а подготовленные запросы переиспользуются через кэш выражений sqlite3.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=DB_CACHED_STATEMENTS,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        # Чтобы INSERT OR REPLACE в spot_ratings тоже запускал DELETE-триггеры агрегатов
+        conn.execute('PRAGMA recursive_triggers=ON')
+        return conn
+
+    def get(self):
+        """Соединение текущего потока (создаётся при первом обращении)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        """Закрывает все открытые соединения (при остановке приложения)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
 class FishingDatabase:
+    """
+    База рыболовных мест. Схема создаётся и обновляется лениво, при первом
+    обращении к соединению: импорт модуля и создание экземпляра не трогают диск.
+    """
+
+    # Шаги миграции по порядку; номер версии схемы (PRAGMA user_version) равен
+    # числу выполненных шагов. Новые шаги добавляются только в конец.
+    MIGRATIONS = (
+        '_create_base_tables',
+        '_create_rating_aggregates',
+        '_create_city_index',
+        '_create_species_index',
+        '_create_spatial_index',
+        '_create_subscriptions',
+        'add_initial_data',
+        '_create_spot_identity',
+        '_create_report_feeds',
+        '_create_bait_stats',
+    )
+    # Шаги, создающие вторичные индексы, которые снимаются на время импорта;
+    # с первого из них схема пересоздаёт эти индексы
+    BULK_INDEX_STEPS = ('_create_city_index', '_create_species_index', '_create_spatial_index')
+    BULK_INDEX_STEP = MIGRATIONS.index(BULK_INDEX_STEPS[0])
+    SCHEMA_VERSION = len(MIGRATIONS)
+
     def __init__(self, db_path='fishing_spots.db'):
         self.db_path = db_path
-        self.init_database()
+        self.connections = ConnectionManager(db_path)
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def connection(self):
+        """Соединение с базой для текущего потока (при первом вызове проверяется схема)"""
+        conn = self.connections.get()
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self.init_database(conn)
+                    self._ready = True
+        return conn
+
+    def close(self):
+        """Закрытие всех соединений с базой"""
+        self.connections.close_all()
     
-    def init_database(self):
-        """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
+    def init_database(self, conn=None):
+        """
+        Приведение схемы к текущей версии. Если PRAGMA user_version уже равна
+        SCHEMA_VERSION, не выполняется ни одного запроса к таблицам. Иначе
+        недостающие шаги MIGRATIONS и начальные данные применяются в одной транзакции.
+        """
+        conn = conn or self.connections.get()
         cursor = conn.cursor()
-        
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            if version > self.SCHEMA_VERSION:
+                logger.warning(f"Версия схемы базы {version} новее ожидаемой {self.SCHEMA_VERSION}")
+            return
+
+        started = time.perf_counter()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            # Другой процесс мог обновить схему, пока мы ждали блокировку
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            self._migrate(cursor, version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(
+            f"Схема базы обновлена с версии {version} до {self.SCHEMA_VERSION} "
+            f"за {(time.perf_counter() - started) * 1000:.0f} мс"
+        )
+
+    def _migrate(self, cursor, version):
+        """Шаги миграции после version в уже открытой транзакции"""
+        for step in self.MIGRATIONS[version:]:
+            getattr(self, step)(cursor)
+        cursor.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def _create_base_tables(self, cursor):
+        """Исходные таблицы: места, отчеты о рыбалке и оценки мест"""
         # Таблица рыболовных мест
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS fishing_spots (
@@ -61,15 +297,529 @@ class FishingDatabase:
                 FOREIGN KEY (spot_id) REFERENCES fishing_spots (id)
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-        
-        # Добавляем начальные данные
-        self.add_initial_data()
-    
-    def add_initial_data(self):
-        """Добавление начальных данных в базу"""
+
+    def _create_rating_aggregates(self, cursor):
+        """
+        Агрегаты оценок (сумма, количество, среднее) хранятся прямо в fishing_spots
+        и поддерживаются триггерами на spot_ratings, поэтому выборки мест
+        не пересчитывают AVG/COUNT по всем оценкам.
+        """
+        cursor.execute("PRAGMA table_info(fishing_spots)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'rating_sum' not in columns:
+            # Миграция старой базы: добавляем столбцы и заполняем их по текущим оценкам
+            cursor.execute("ALTER TABLE fishing_spots ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0")
+            cursor.execute("ALTER TABLE fishing_spots ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0")
+            cursor.execute("ALTER TABLE fishing_spots ADD COLUMN avg_rating REAL NOT NULL DEFAULT 0")
+            cursor.execute('''
+                UPDATE fishing_spots SET
+                    rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM spot_ratings WHERE spot_id = fishing_spots.id),
+                    rating_count = (SELECT COUNT(*) FROM spot_ratings WHERE spot_id = fishing_spots.id)
+            ''')
+            cursor.execute('''
+                UPDATE fishing_spots
+                SET avg_rating = CASE WHEN rating_count > 0 THEN rating_sum * 1.0 / rating_count ELSE 0 END
+            ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS spot_ratings_after_insert
+            AFTER INSERT ON spot_ratings
+            BEGIN
+                UPDATE fishing_spots SET
+                    rating_sum = rating_sum + NEW.rating,
+                    rating_count = rating_count + 1,
+                    avg_rating = (rating_sum + NEW.rating) * 1.0 / (rating_count + 1)
+                WHERE id = NEW.spot_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS spot_ratings_after_delete
+            AFTER DELETE ON spot_ratings
+            BEGIN
+                UPDATE fishing_spots SET
+                    rating_sum = rating_sum - OLD.rating,
+                    rating_count = rating_count - 1,
+                    avg_rating = CASE WHEN rating_count > 1
+                                      THEN (rating_sum - OLD.rating) * 1.0 / (rating_count - 1)
+                                      ELSE 0 END
+                WHERE id = OLD.spot_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS spot_ratings_after_update
+            AFTER UPDATE OF spot_id, rating ON spot_ratings
+            BEGIN
+                UPDATE fishing_spots SET
+                    rating_sum = rating_sum - OLD.rating,
+                    rating_count = rating_count - 1,
+                    avg_rating = CASE WHEN rating_count > 1
+                                      THEN (rating_sum - OLD.rating) * 1.0 / (rating_count - 1)
+                                      ELSE 0 END
+                WHERE id = OLD.spot_id;
+                UPDATE fishing_spots SET
+                    rating_sum = rating_sum + NEW.rating,
+                    rating_count = rating_count + 1,
+                    avg_rating = (rating_sum + NEW.rating) * 1.0 / (rating_count + 1)
+                WHERE id = NEW.spot_id;
+            END
+        ''')
+
+    def _create_city_index(self, cursor):
+        """
+        Нормализованный ключ города (Unicode casefold, ё -> е) с индексом.
+        SQLite LOWER() не переводит кириллицу в нижний регистр и не использует индекс,
+        поэтому ключ вычисляется в Python при записи.
+        """
+        cursor.execute("PRAGMA table_info(fishing_spots)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'city_key' not in columns:
+            cursor.execute("ALTER TABLE fishing_spots ADD COLUMN city_key TEXT")
+        cursor.execute("SELECT id, city FROM fishing_spots WHERE city_key IS NULL")
+        rows = cursor.fetchall()
+        if rows:
+            cursor.executemany(
+                "UPDATE fishing_spots SET city_key = ? WHERE id = ?",
+                [(normalize_city(city), spot_id) for spot_id, city in rows]
+            )
+            logger.info(f"Заполнен ключ города для {len(rows)} мест")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fishing_spots_city_key
+            ON fishing_spots (city_key, avg_rating DESC)
+        ''')
+
+    def _create_species_index(self, cursor):
+        """
+        Нормализованный индекс видов рыбы: по строке на пару (место, вид)
+        вместо LIKE по списку через запятую.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'spot_species'")
+        exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS spot_species (
+                species_key TEXT NOT NULL,
+                spot_id INTEGER NOT NULL,
+                PRIMARY KEY (species_key, spot_id),
+                FOREIGN KEY (spot_id) REFERENCES fishing_spots (id)
+            ) WITHOUT ROWID
+        ''')
+        if not exists:
+            # Заполнение одним executemany по потоку строк, без запроса на каждое место;
+            # вторичный индекс строится уже по заполненной таблице
+            rows = cursor.connection.execute("SELECT id, fish_species FROM fishing_spots")
+            cursor.executemany(
+                "INSERT OR IGNORE INTO spot_species (species_key, spot_id) VALUES (?, ?)",
+                ((key, spot_id) for spot_id, fish_species in rows for key in split_species(fish_species))
+            )
+            if cursor.rowcount > 0:
+                logger.info(f"Построен индекс видов рыбы: {cursor.rowcount} записей")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_spot_species_spot_id
+            ON spot_species (spot_id)
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS fishing_spots_after_delete_species
+            AFTER DELETE ON fishing_spots
+            BEGIN
+                DELETE FROM spot_species WHERE spot_id = OLD.id;
+            END
+        ''')
+
+    def _create_spatial_index(self, cursor):
+        """
+        Пространственный индекс R*Tree по координатам мест для поиска рядом.
+        Синхронизируется с fishing_spots триггерами.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'spot_locations'")
+        exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS spot_locations USING rtree(
+                id, min_lat, max_lat, min_lon, max_lon
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS fishing_spots_after_insert_location
+            AFTER INSERT ON fishing_spots
+            WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+            BEGIN
+                INSERT INTO spot_locations VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS fishing_spots_after_update_location
+            AFTER UPDATE OF latitude, longitude ON fishing_spots
+            BEGIN
+                DELETE FROM spot_locations WHERE id = OLD.id;
+                INSERT INTO spot_locations
+                SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+                WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS fishing_spots_after_delete_location
+            AFTER DELETE ON fishing_spots
+            BEGIN
+                DELETE FROM spot_locations WHERE id = OLD.id;
+            END
+        ''')
+        if not exists:
+            cursor.execute('''
+                INSERT INTO spot_locations
+                SELECT id, latitude, latitude, longitude, longitude FROM fishing_spots
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ''')
+
+    def _create_subscriptions(self, cursor):
+        """
+        Подписки на ежедневный прогноз. Время отправки хранится в минутах от
+        полуночи UTC, last_sent_date отмечает уже выполненную отправку за день.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                chat_id INTEGER NOT NULL,
+                city TEXT NOT NULL,
+                city_key TEXT NOT NULL,
+                local_time TEXT NOT NULL,
+                send_minute INTEGER NOT NULL,
+                last_sent_date TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, city_key)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_subscriptions_send_minute
+            ON subscriptions (send_minute, city_key)
+        ''')
+
+    def _create_spot_identity(self, cursor):
+        """
+        Уникальность места по (ключ города, название): по ней массовый импорт
+        обновляет уже загруженные места вместо создания дубликатов.
+        """
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_fishing_spots_identity
+            ON fishing_spots (city_key, name)
+        ''')
+
+    def _create_report_feeds(self, cursor):
+        """
+        Ленты отчетов и сводки уловов. Индексы (created_at, id) по всей таблице
+        и по месту отдают страницу ленты без сортировки. catch_stats хранит число
+        отчетов и сумму оценок по месту, неделе, виду рыбы и наживке и обновляется
+        вместе с каждым отчетом, так что вопрос "что клюёт на месте в этом месяце"
+        не перебирает сами отчеты.
+        """
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fishing_reports_created
+            ON fishing_reports (created_at, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fishing_reports_spot_created
+            ON fishing_reports (spot_id, created_at, id)
+        ''')
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catch_stats'")
+        exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catch_stats (
+                spot_id INTEGER NOT NULL,
+                week TEXT NOT NULL,
+                species_key TEXT NOT NULL,
+                bait_key TEXT NOT NULL,
+                species_name TEXT NOT NULL,
+                reports INTEGER NOT NULL DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (spot_id, week, species_key, bait_key)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_catch_stats_species
+            ON catch_stats (species_key, week)
+        ''')
+        if not exists:
+            rows = cursor.connection.execute(f'''
+                SELECT spot_id, DATE(COALESCE(report_date, created_at), {SQL_WEEK_START}),
+                       fish_caught, bait_used, rating
+                FROM fishing_reports
+                WHERE spot_id IS NOT NULL
+            ''')
+            cursor.executemany(
+                self._catch_stats_upsert('?'),
+                (item for spot_id, week, fish_caught, bait, rating in rows
+                 for item in self._catch_stats_rows(spot_id, week, fish_caught, bait, rating))
+            )
+            if cursor.rowcount > 0:
+                logger.info(f"Построены сводки уловов: {cursor.rowcount} записей")
+
+    @staticmethod
+    def _catch_stats_upsert(week):
+        """UPSERT строки catch_stats; week — SQL-выражение недели"""
+        return f'''
+            INSERT INTO catch_stats
+            (spot_id, week, species_key, bait_key, species_name, reports, rating_sum, rating_count)
+            VALUES (?, {week}, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT(spot_id, week, species_key, bait_key) DO UPDATE SET
+                reports = reports + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_count = rating_count + excluded.rating_count
+        '''
+
+    @staticmethod
+    def _catch_stats_rows(spot_id, week, fish_caught, bait, rating):
+        """
+        Параметры UPSERT в catch_stats для одного отчета: по строке на вид рыбы
+        (пустой ключ — без улова). Неделя передаётся, только если week не None.
+        """
+        if spot_id is None:
+            return []
+        bait_key = normalize_city(bait or '')
+        rated = 1 if rating is not None else 0
+        prefix = (spot_id,) if week is None else (spot_id, week)
+        species = catch_species(fish_caught) or {'': ''}
+        return [prefix + (key, bait_key, name, rating or 0, rated) for key, name in species.items()]
+
+    def _create_bait_stats(self, cursor):
+        """
+        Сводка наживок: число отчетов и сумма оценок по месту, неделе и наживке,
+        по одной строке на отчет. Строки catch_stats разбиты ещё и по виду рыбы,
+        поэтому отчет с несколькими видами в них учитывается несколько раз.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bait_stats'")
+        exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bait_stats (
+                spot_id INTEGER NOT NULL,
+                week TEXT NOT NULL,
+                bait_key TEXT NOT NULL,
+                reports INTEGER NOT NULL DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (spot_id, week, bait_key)
+            ) WITHOUT ROWID
+        ''')
+        if not exists:
+            rows = cursor.connection.execute(f'''
+                SELECT spot_id, DATE(COALESCE(report_date, created_at), {SQL_WEEK_START}),
+                       bait_used, rating
+                FROM fishing_reports
+                WHERE spot_id IS NOT NULL
+            ''')
+            cursor.executemany(
+                self._bait_stats_upsert('?'),
+                (item for spot_id, week, bait, rating in rows
+                 for item in self._bait_stats_rows(spot_id, week, bait, rating))
+            )
+            if cursor.rowcount > 0:
+                logger.info(f"Построена сводка наживок: {cursor.rowcount} записей")
+
+    @staticmethod
+    def _bait_stats_upsert(week):
+        """UPSERT строки bait_stats; week — SQL-выражение недели"""
+        return f'''
+            INSERT INTO bait_stats (spot_id, week, bait_key, reports, rating_sum, rating_count)
+            VALUES (?, {week}, ?, 1, ?, ?)
+            ON CONFLICT(spot_id, week, bait_key) DO UPDATE SET
+                reports = reports + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_count = rating_count + excluded.rating_count
+        '''
+
+    @staticmethod
+    def _bait_stats_rows(spot_id, week, bait, rating):
+        """
+        Параметры UPSERT в bait_stats для одного отчета: одна строка или ни одной,
+        если наживка не указана. Неделя передаётся, только если week не None.
+        """
+        bait_key = normalize_city(bait or '')
+        if spot_id is None or not bait_key:
+            return []
+        prefix = (spot_id,) if week is None else (spot_id, week)
+        return [prefix + (bait_key, rating or 0, 1 if rating is not None else 0)]
+
+    def _index_species(self, cursor, spot_id, fish_species):
+        """Перестроение строк spot_species для одного места"""
+        cursor.execute("DELETE FROM spot_species WHERE spot_id = ?", (spot_id,))
+        cursor.executemany(
+            "INSERT OR IGNORE INTO spot_species (species_key, spot_id) VALUES (?, ?)",
+            [(key, spot_id) for key in split_species(fish_species)]
+        )
+
+    def _insert_spot(self, cursor, spot):
+        """Вставка места вместе с ключом города и индексом видов рыбы"""
+        cursor.execute('''
+            INSERT INTO fishing_spots 
+            (name, type, city, city_key, latitude, longitude, fish_species, description, best_season, access_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            spot['name'], spot['type'], spot['city'], normalize_city(spot['city']), spot.get('latitude'),
+            spot.get('longitude'), spot.get('fish_species'), spot.get('description'),
+            spot.get('best_season'), spot.get('access_type', 'бесплатный')
+        ))
+        spot_id = cursor.lastrowid
+        self._index_species(cursor, spot_id, spot.get('fish_species'))
+        return spot_id
+
+    def add_spot(self, spot):
+        """Добавить место. Возвращает id нового места или None при ошибке"""
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        try:
+            spot_id = self._insert_spot(cursor, spot)
+            conn.commit()
+            return spot_id
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка добавления места: {e}")
+            return None
+
+    def update_spot_species(self, spot_id, fish_species):
+        """Изменить список видов рыбы места с обновлением индекса"""
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("UPDATE fishing_spots SET fish_species = ? WHERE id = ?", (fish_species, spot_id))
+            self._index_species(cursor, spot_id, fish_species)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка обновления видов рыбы: {e}")
+            return False
+
+    def _drop_bulk_indexes(self, cursor):
+        """
+        Снятие вторичных индексов и поддерживающих их триггеров перед загрузкой:
+        их дешевле построить один раз по готовой таблице. Версия схемы откатывается
+        к BULK_INDEX_STEP, поэтому при сбое импорта индексы пересоздаст обычная миграция.
+        """
+        cursor.execute(f'PRAGMA user_version = {self.BULK_INDEX_STEP}')
+        cursor.execute('DROP INDEX IF EXISTS idx_fishing_spots_city_key')
+        cursor.execute('DROP TRIGGER IF EXISTS fishing_spots_after_delete_species')
+        cursor.execute('DROP TABLE IF EXISTS spot_species')
+        for trigger in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS fishing_spots_after_{trigger}_location')
+        cursor.execute('DROP TABLE IF EXISTS spot_locations')
+
+    def _create_bulk_indexes(self, cursor):
+        """
+        Построение индексов, снятых _drop_bulk_indexes, и возврат версии схемы.
+        Остальные шаги миграции не повторяются: они уже выполнены на этой базе.
+        """
+        for step in self.BULK_INDEX_STEPS:
+            getattr(self, step)(cursor)
+        cursor.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def _index_batch_species(self, cursor, batch):
+        """Индекс видов рыбы для пачки импорта, загруженной при неснятых индексах"""
+        for row in batch:
+            cursor.execute("SELECT id FROM fishing_spots WHERE city_key = ? AND name = ?", (row[3], row[0]))
+            self._index_species(cursor, cursor.fetchone()[0], row[6])
+
+    def import_spots(self, spots, batch_size=IMPORT_BATCH_SIZE):
+        """
+        Массовая загрузка мест из итератора словарей (поля SPOT_FIELDS).
+        Места с уже известными городом и названием обновляются, оценки сохраняются.
+        Строки пишутся executemany пачками по batch_size в одной транзакции на пачку,
+        с ослабленными на время загрузки pragma. Небольшой импорт (до
+        IMPORT_REBUILD_INDEX_RATIO от числа мест в базе) идёт при живых индексах;
+        как только загружено больше, индексы видов, координат и городов снимаются
+        и строятся в конце заново. Возвращает число загруженных строк.
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+        upsert = '''
+            INSERT INTO fishing_spots
+            (name, type, city, city_key, latitude, longitude, fish_species, description, best_season, access_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(city_key, name) DO UPDATE SET
+                type = excluded.type,
+                city = excluded.city,
+                latitude = excluded.latitude,
+                longitude = excluded.longitude,
+                fish_species = excluded.fish_species,
+                description = excluded.description,
+                best_season = excluded.best_season,
+                access_type = excluded.access_type
+        '''
+        rows = (
+            (spot['name'], spot['type'], spot['city'], normalize_city(spot['city']), spot.get('latitude'),
+             spot.get('longitude'), spot.get('fish_species'), spot.get('description'),
+             spot.get('best_season'), spot.get('access_type') or 'бесплатный')
+            for spot in spots
+        )
+
+        started = time.perf_counter()
+        total = 0
+        cursor.execute('SELECT COUNT(*) FROM fishing_spots')
+        rebuild_after = cursor.fetchone()[0] * IMPORT_REBUILD_INDEX_RATIO
+        indexes_dropped = False
+        # Надёжность записи на время загрузки не нужна: при сбое импорт просто повторяют
+        cursor.execute('PRAGMA synchronous=OFF')
+        cursor.execute(f'PRAGMA cache_size=-{IMPORT_CACHE_SIZE_KB}')
+        cursor.execute('PRAGMA wal_autocheckpoint=0')
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                if not indexes_dropped and total + len(batch) > rebuild_after:
+                    cursor.execute('BEGIN IMMEDIATE')
+                    self._drop_bulk_indexes(cursor)
+                    conn.commit()
+                    indexes_dropped = True
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.executemany(upsert, batch)
+                if not indexes_dropped:
+                    self._index_batch_species(cursor, batch)
+                conn.commit()
+                total += len(batch)
+                elapsed = time.perf_counter() - started
+                logger.info(f"Импорт мест: {total} строк, {total / elapsed:.0f} строк/с")
+
+            load_time = time.perf_counter() - started
+            if indexes_dropped:
+                cursor.execute('BEGIN IMMEDIATE')
+                self._create_bulk_indexes(cursor)
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            # Загруженные пачки остаются, а индексы возвращаем сразу, не дожидаясь перезапуска
+            if indexes_dropped:
+                cursor.execute('BEGIN IMMEDIATE')
+                self._create_bulk_indexes(cursor)
+                conn.commit()
+            raise
+        finally:
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+            cursor.execute('PRAGMA wal_autocheckpoint=1000')
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Импорт мест завершён: {total} строк за {elapsed:.1f} с "
+            f"({total / elapsed:.0f} строк/с; загрузка {load_time:.1f} с, индексы {elapsed - load_time:.1f} с)"
+        )
+        return total
+
+    def iter_spots(self, batch_size=1000):
+        """Все места по порядку id, без чтения таблицы в память целиком"""
+        cursor = self.connection().cursor()
+        cursor.execute(f'''
+            SELECT {SPOT_COLUMNS}
+            FROM fishing_spots fs
+            ORDER BY fs.id
+        ''')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self._row_to_spot(row)
+
+    def add_initial_data(self, cursor):
+        """Добавление начальных данных в пустую базу (шаг миграции, в общей транзакции)"""
         initial_spots = [
             # Москва
             {
@@ -157,181 +907,513 @@ class FishingDatabase:
             }
         ]
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Проверяем, есть ли уже данные
-        cursor.execute("SELECT COUNT(*) FROM fishing_spots")
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
+        cursor.execute("SELECT 1 FROM fishing_spots LIMIT 1")
+        if cursor.fetchone() is None:
             for spot in initial_spots:
-                cursor.execute('''
-                    INSERT INTO fishing_spots 
-                    (name, type, city, latitude, longitude, fish_species, description, best_season, access_type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    spot['name'], spot['type'], spot['city'], spot['latitude'],
-                    spot['longitude'], spot['fish_species'], spot['description'],
-                    spot['best_season'], spot['access_type']
-                ))
-        
-        conn.commit()
-        conn.close()
-        logger.info("База данных инициализирована с начальными данными")
+                self._insert_spot(cursor, spot)
+            logger.info("База данных инициализирована с начальными данными")
     
+    def _row_to_spot(self, row):
+        """Преобразование строки SPOT_COLUMNS в словарь"""
+        return {
+            'id': row[0],
+            'name': row[1],
+            'type': row[2],
+            'city': row[3],
+            'latitude': row[4],
+            'longitude': row[5],
+            'fish_species': row[6],
+            'description': row[7],
+            'best_season': row[8],
+            'access_type': row[9],
+            'avg_rating': round(row[10], 1) if row[10] else 0,
+            'rating_count': row[11] or 0
+        }
+
     def get_spots_by_city(self, city):
         """Получить места по городу"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT fs.*, 
-                   COALESCE(AVG(sr.rating), 0) as avg_rating,
-                   COUNT(sr.id) as rating_count
+        cursor.execute(f'''
+            SELECT {SPOT_COLUMNS}
             FROM fishing_spots fs
-            LEFT JOIN spot_ratings sr ON fs.id = sr.spot_id
-            WHERE LOWER(fs.city) = LOWER(?)
-            GROUP BY fs.id
-            ORDER BY avg_rating DESC
-        ''', (city,))
+            WHERE fs.city_key = ?
+            ORDER BY fs.avg_rating DESC
+        ''', (normalize_city(city),))
         
-        spots = []
-        for row in cursor.fetchall():
-            spot = {
-                'id': row[0],
-                'name': row[1],
-                'type': row[2],
-                'city': row[3],
-                'latitude': row[4],
-                'longitude': row[5],
-                'fish_species': row[6],
-                'description': row[7],
-                'best_season': row[8],
-                'access_type': row[9],
-                'avg_rating': round(row[10], 1) if row[10] else 0,
-                'rating_count': row[11] or 0
-            }
-            spots.append(spot)
-        
-        conn.close()
-        return spots
+        return [self._row_to_spot(row) for row in cursor.fetchall()]
     
-    def get_spots_by_fish(self, fish_species):
-        """Получить места по виду рыбы"""
-        conn = sqlite3.connect(self.db_path)
+    def get_spots_by_fish(self, fish_species, limit=SPOTS_BY_FISH_LIMIT):
+        """Лучшие по оценке места с видом рыбы, не больше limit"""
+        conn = self.connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT fs.*, 
-                   COALESCE(AVG(sr.rating), 0) as avg_rating
-            FROM fishing_spots fs
-            LEFT JOIN spot_ratings sr ON fs.id = sr.spot_id
-            WHERE LOWER(fs.fish_species) LIKE LOWER(?)
-            GROUP BY fs.id
-            ORDER BY avg_rating DESC
-        ''', (f'%{fish_species}%',))
+        cursor.execute(f'''
+            SELECT {SPOT_COLUMNS}
+            FROM spot_species ss
+            JOIN fishing_spots fs ON fs.id = ss.spot_id
+            WHERE ss.species_key = ?
+            ORDER BY fs.avg_rating DESC, fs.id
+            LIMIT ?
+        ''', (species_key(fish_species), limit))
         
+        return [self._row_to_spot(row) for row in cursor.fetchall()]
+    
+    def get_cities(self):
+        """Города, для которых есть места: название, средние координаты мест и их число"""
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT MIN(city), AVG(latitude), AVG(longitude), COUNT(*) FROM fishing_spots
+            GROUP BY city_key
+            ORDER BY city_key
+        ''')
+        return [
+            {'city': row[0], 'latitude': row[1], 'longitude': row[2], 'spot_count': row[3]}
+            for row in cursor.fetchall()
+        ]
+
+    def get_spots_near(self, latitude, longitude, radius_km=50, limit=5):
+        """
+        Ближайшие места в радиусе radius_km, по возрастанию расстояния.
+        R*Tree отбирает кандидатов по ограничивающему прямоугольнику, точное
+        расстояние считается только для них. Радиус поиска растёт от малого,
+        пока не наберётся limit мест, чтобы в густых районах не перебирать лишнее.
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        search_radius = min(radius_km, NEARBY_INITIAL_RADIUS_KM)
+        while True:
+            candidates = []
+            for min_lat, max_lat, min_lon, max_lon in bounding_boxes(latitude, longitude, search_radius):
+                cursor.execute(f'''
+                    SELECT {SPOT_COLUMNS}
+                    FROM spot_locations sl
+                    JOIN fishing_spots fs ON fs.id = sl.id
+                    WHERE sl.max_lat >= ? AND sl.min_lat <= ?
+                      AND sl.max_lon >= ? AND sl.min_lon <= ?
+                ''', (min_lat, max_lat, min_lon, max_lon))
+                for row in cursor.fetchall():
+                    distance = haversine_km(latitude, longitude, row[4], row[5])
+                    if distance <= search_radius:
+                        candidates.append((distance, row))
+            if len(candidates) >= limit or search_radius >= radius_km:
+                break
+            search_radius = min(radius_km, search_radius * 4)
+
         spots = []
-        for row in cursor.fetchall():
-            spot = {
-                'id': row[0],
-                'name': row[1],
-                'type': row[2],
-                'city': row[3],
-                'latitude': row[4],
-                'longitude': row[5],
-                'fish_species': row[6],
-                'description': row[7],
-                'best_season': row[8],
-                'access_type': row[9],
-                'avg_rating': round(row[10], 1) if row[10] else 0
-            }
+        for distance, row in heapq.nsmallest(limit, candidates, key=lambda item: item[0]):
+            spot = self._row_to_spot(row)
+            spot['distance_km'] = round(distance, 1)
             spots.append(spot)
-        
-        conn.close()
         return spots
-    
+
+    def _write_spot_rating(self, cursor, spot_id, user_id, rating):
+        """Запись оценки места в рамках уже открытой транзакции"""
+        # UPSERT вместо INSERT OR REPLACE: повторная оценка идёт через UPDATE-триггер
+        cursor.execute('''
+            INSERT INTO spot_ratings (spot_id, user_id, rating)
+            VALUES (?, ?, ?)
+            ON CONFLICT(spot_id, user_id) DO UPDATE SET
+                rating = excluded.rating,
+                created_at = CURRENT_TIMESTAMP
+        ''', (spot_id, user_id, rating))
+
+    def _write_fishing_report(self, cursor, spot_id, user_id, fish_caught, weather, bait, rating, comment):
+        """Запись отчета о рыбалке в рамках уже открытой транзакции"""
+        cursor.execute('''
+            INSERT INTO fishing_reports 
+            (spot_id, user_id, report_date, fish_caught, weather_conditions, bait_used, rating, comment)
+            VALUES (?, ?, DATE('now'), ?, ?, ?, ?, ?)
+        ''', (spot_id, user_id, fish_caught, weather, bait, rating, comment))
+        # Сводка уловов обновляется в той же транзакции, что и сам отчет
+        cursor.executemany(
+            self._catch_stats_upsert(f"DATE('now', {SQL_WEEK_START})"),
+            self._catch_stats_rows(spot_id, None, fish_caught, bait, rating)
+        )
+        cursor.executemany(
+            self._bait_stats_upsert(f"DATE('now', {SQL_WEEK_START})"),
+            self._bait_stats_rows(spot_id, None, bait, rating)
+        )
+
     def add_spot_rating(self, spot_id, user_id, rating):
         """Добавить оценку места"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO spot_ratings (spot_id, user_id, rating)
-                VALUES (?, ?, ?)
-            ''', (spot_id, user_id, rating))
-            
+            self._write_spot_rating(cursor, spot_id, user_id, rating)
             conn.commit()
             return True
         except Exception as e:
+            conn.rollback()
             logger.error(f"Ошибка добавления оценки: {e}")
             return False
-        finally:
-            conn.close()
     
     def add_fishing_report(self, spot_id, user_id, fish_caught, weather, bait, rating, comment):
         """Добавить отчет о рыбалке"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT INTO fishing_reports 
-                (spot_id, user_id, report_date, fish_caught, weather_conditions, bait_used, rating, comment)
-                VALUES (?, ?, DATE('now'), ?, ?, ?, ?, ?)
-            ''', (spot_id, user_id, fish_caught, weather, bait, rating, comment))
-            
+            self._write_fishing_report(cursor, spot_id, user_id, fish_caught, weather, bait, rating, comment)
             conn.commit()
             return True
         except Exception as e:
+            conn.rollback()
             logger.error(f"Ошибка добавления отчета: {e}")
             return False
-        finally:
-            conn.close()
+
+    def commit_batch(self, writes):
+        """
+        Групповая фиксация: все записи пачки в одной транзакции. На соединении
+        с synchronous=FULL (поток-писатель AsyncFishingDatabase) это один fsync
+        на пачку; при synchronous=NORMAL в режиме WAL фиксация не ждёт диска
+        и при отключении питания может пропасть.
+        Каждая запись изолирована точкой сохранения, чтобы ошибка одной
+        не откатывала остальные. Возвращает по записи её результат (если
+        функция записи его вернула) или True, а при ошибке False.
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+        results = []
+        try:
+            cursor.execute('BEGIN')
+            for write, args in writes:
+                cursor.execute('SAVEPOINT batch_item')
+                try:
+                    result = write(cursor, *args)
+                    results.append(True if result is None else result)
+                except sqlite3.Error as e:
+                    cursor.execute('ROLLBACK TO batch_item')
+                    logger.error(f"Ошибка записи в пакете: {e}")
+                    results.append(False)
+                cursor.execute('RELEASE batch_item')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка фиксации пакета записей: {e}")
+            return [False] * len(writes)
+        return results
     
-    def get_recent_reports(self, spot_id=None, limit=5):
-        """Получить последние отчеты"""
-        conn = sqlite3.connect(self.db_path)
+    def _write_subscription(self, cursor, chat_id, city, local_time, send_minute, last_sent_date=None):
+        """Запись подписки в рамках уже открытой транзакции"""
+        cursor.execute('''
+            INSERT INTO subscriptions (chat_id, city, city_key, local_time, send_minute, last_sent_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, city_key) DO UPDATE SET
+                city = excluded.city,
+                local_time = excluded.local_time,
+                send_minute = excluded.send_minute,
+                last_sent_date = excluded.last_sent_date
+        ''', (chat_id, city, normalize_city(city), local_time, send_minute, last_sent_date))
+
+    def add_subscription(self, chat_id, city, local_time, send_minute, last_sent_date=None):
+        """Добавить или изменить подписку чата на ежедневный прогноз"""
+        conn = self.connection()
         cursor = conn.cursor()
-        
+
+        try:
+            self._write_subscription(cursor, chat_id, city, local_time, send_minute, last_sent_date)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка добавления подписки: {e}")
+            return False
+
+    def _write_remove_subscriptions(self, cursor, chat_id, city=None):
+        """Удаление подписок в рамках уже открытой транзакции. Возвращает число удалённых"""
+        if city is None:
+            cursor.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        else:
+            cursor.execute(
+                "DELETE FROM subscriptions WHERE chat_id = ? AND city_key = ?",
+                (chat_id, normalize_city(city))
+            )
+        return cursor.rowcount
+
+    def remove_subscriptions(self, chat_id, city=None):
+        """Удалить подписку чата на город или все подписки чата. Возвращает число удалённых"""
+        conn = self.connection()
+        removed = self._write_remove_subscriptions(conn.cursor(), chat_id, city)
+        conn.commit()
+        return removed
+
+    def get_subscriptions(self, chat_id):
+        """Подписки чата"""
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT city, local_time FROM subscriptions
+            WHERE chat_id = ?
+            ORDER BY send_minute
+        ''', (chat_id,))
+        return [{'city': row[0], 'local_time': row[1]} for row in cursor.fetchall()]
+
+    def get_due_subscriptions(self, from_minute, to_minute, send_date):
+        """Подписки со временем отправки в [from_minute, to_minute], ещё не отправленные за send_date"""
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT chat_id, city, city_key, send_minute FROM subscriptions
+            WHERE send_minute BETWEEN ? AND ?
+              AND (last_sent_date IS NULL OR last_sent_date < ?)
+            ORDER BY send_minute, city_key
+        ''', (from_minute, to_minute, send_date))
+        return [
+            {'chat_id': row[0], 'city': row[1], 'city_key': row[2], 'send_minute': row[3]}
+            for row in cursor.fetchall()
+        ]
+
+    def _write_subscription_sent(self, cursor, chat_id, city_key, send_date):
+        """Отметка об отправке прогноза подписчику в рамках уже открытой транзакции"""
+        cursor.execute(
+            "UPDATE subscriptions SET last_sent_date = ? WHERE chat_id = ? AND city_key = ?",
+            (send_date, chat_id, city_key)
+        )
+
+    def _row_to_report(self, row):
+        """Преобразование строки REPORT_COLUMNS в словарь"""
+        return {
+            'id': row[0],
+            'spot_id': row[1],
+            'user_id': row[2],
+            'report_date': row[3],
+            'fish_caught': row[4],
+            'weather_conditions': row[5],
+            'bait_used': row[6],
+            'rating': row[7],
+            'comment': row[8],
+            'created_at': row[9],
+            'spot_name': row[10]
+        }
+
+    def get_reports_page(self, spot_id=None, before=None, limit=REPORTS_PAGE_SIZE):
+        """
+        Страница ленты отчетов от новых к старым, по всем местам или по одному.
+        before — курсор (created_at, id) последнего отчета предыдущей страницы.
+        Страница ищется по индексу без сортировки и без OFFSET, поэтому дальние
+        страницы не дороже первой. Возвращает (отчеты, курсор следующей страницы или None).
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        conditions, params = [], []
         if spot_id:
-            cursor.execute('''
-                SELECT fr.*, fs.name as spot_name
-                FROM fishing_reports fr
-                JOIN fishing_spots fs ON fr.spot_id = fs.id
-                WHERE fr.spot_id = ?
-                ORDER BY fr.created_at DESC
+            conditions.append('spot_id = ?')
+            params.append(spot_id)
+        if before is not None:
+            conditions.append('(created_at, id) < (?, ?)')
+            params.extend(before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        # Сначала id страницы по индексу, затем сами строки по первичному ключу
+        cursor.execute(f'''
+            SELECT {REPORT_COLUMNS}
+            FROM (
+                SELECT id FROM fishing_reports
+                {where}
+                ORDER BY created_at DESC, id DESC
                 LIMIT ?
-            ''', (spot_id, limit))
-        else:
-            cursor.execute('''
-                SELECT fr.*, fs.name as spot_name
-                FROM fishing_reports fr
-                JOIN fishing_spots fs ON fr.spot_id = fs.id
-                ORDER BY fr.created_at DESC
+            ) page
+            JOIN fishing_reports fr ON fr.id = page.id
+            JOIN fishing_spots fs ON fr.spot_id = fs.id
+            ORDER BY fr.created_at DESC, fr.id DESC
+        ''', params + [limit])
+
+        reports = [self._row_to_report(row) for row in cursor.fetchall()]
+        next_cursor = None
+        if len(reports) == limit:
+            next_cursor = (reports[-1]['created_at'], reports[-1]['id'])
+        return reports, next_cursor
+
+    def get_recent_reports(self, spot_id=None, limit=5):
+        """Получить последние отчеты"""
+        return self.get_reports_page(spot_id, None, limit)[0]
+
+    def get_spot_catch_stats(self, spot_id, since, limit=5):
+        """
+        Что и на что ловится на месте с даты since (строка YYYY-MM-DD) по сводкам
+        catch_stats и bait_stats: виды рыбы и наживки с числом отчетов и средней
+        оценкой, а также число отчетов без улова.
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        result = {}
+        for name, table, column, label in (('species', 'catch_stats', 'species_key', 'MIN(species_name)'),
+                                           ('baits', 'bait_stats', 'bait_key', 'bait_key')):
+            cursor.execute(f'''
+                SELECT {label}, SUM(reports), SUM(rating_sum), SUM(rating_count)
+                FROM {table}
+                WHERE spot_id = ? AND week >= DATE(?, {SQL_WEEK_START}) AND {column} != ''
+                GROUP BY {column}
+                ORDER BY SUM(reports) DESC, {column}
                 LIMIT ?
-            ''', (limit,))
-        
-        reports = []
-        for row in cursor.fetchall():
-            report = {
-                'id': row[0],
-                'spot_id': row[1],
-                'user_id': row[2],
-                'report_date': row[3],
-                'fish_caught': row[4],
-                'weather_conditions': row[5],
-                'bait_used': row[6],
-                'rating': row[7],
-                'comment': row[8],
-                'spot_name': row[10]
-            }
-            reports.append(report)
-        
-        conn.close()
-        return reports
+            ''', (spot_id, since, limit))
+            result[name] = [
+                {'name': row[0], 'reports': row[1],
+                 'avg_rating': round(row[2] / row[3], 1) if row[3] else None}
+                for row in cursor.fetchall()
+            ]
+        cursor.execute(f'''
+            SELECT COALESCE(SUM(reports), 0) FROM catch_stats
+            WHERE spot_id = ? AND week >= DATE(?, {SQL_WEEK_START}) AND species_key = ''
+        ''', (spot_id, since))
+        result['blank_reports'] = cursor.fetchone()[0]
+        return result
+
+    def get_species_hotspots(self, fish_species, since, limit=5):
+        """Места, где вид рыбы чаще всего попадался в отчетах с даты since"""
+        conn = self.connection()
+        cursor = conn.cursor()
+
+        cursor.execute(f'''
+            SELECT fs.id, fs.name, fs.city, SUM(cs.reports) AS reports
+            FROM catch_stats cs
+            JOIN fishing_spots fs ON fs.id = cs.spot_id
+            WHERE cs.species_key = ? AND cs.week >= DATE(?, {SQL_WEEK_START})
+            GROUP BY cs.spot_id
+            ORDER BY reports DESC
+            LIMIT ?
+        ''', (species_key(fish_species), since, limit))
+        return [
+            {'spot_id': row[0], 'name': row[1], 'city': row[2], 'reports': row[3]}
+            for row in cursor.fetchall()
+        ]
+
+class AsyncFishingDatabase:
+    """
+    Асинхронная обёртка над FishingDatabase для обработчиков бота.
+    Чтения выполняются в пуле потоков, записи складываются в очередь и
+    фиксируются пачками одним потоком-писателем раз в commit_interval.
+    Соединение писателя работает с synchronous=DB_WRITE_SYNCHRONOUS (по умолчанию
+    FULL), поэтому ожидание записи завершается после fsync её пачки на диск.
+    """
+
+    def __init__(self, db, commit_interval=DB_COMMIT_INTERVAL, max_batch=DB_MAX_BATCH,
+                 read_workers=DB_READ_WORKERS):
+        self.db = db
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self._read_executor = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix='db-read')
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write',
+                                                  initializer=self._init_writer)
+        self._queue = None
+        self._writer_task = None
+
+    def _init_writer(self):
+        """Настройка соединения потока-писателя: фиксация пачки ждёт записи на диск"""
+        self.db.connections.get().execute(f'PRAGMA synchronous={DB_WRITE_SYNCHRONOUS}')
+
+    @staticmethod
+    def _timed(method, *args):
+        """Вызов метода базы с замером времени выполнения (без ожидания в очереди пула)"""
+        with DB_QUERY_SECONDS.time(method.__name__):
+            return method(*args)
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._timed, method, *args)
+
+    async def get_spots_by_city(self, city):
+        return await self._call(self.db.get_spots_by_city, city)
+
+    async def get_spots_by_fish(self, fish_species, limit=SPOTS_BY_FISH_LIMIT):
+        return await self._call(self.db.get_spots_by_fish, fish_species, limit)
+
+    async def get_cities(self):
+        return await self._call(self.db.get_cities)
+
+    async def get_spots_near(self, latitude, longitude, radius_km=50, limit=5):
+        return await self._call(self.db.get_spots_near, latitude, longitude, radius_km, limit)
+
+    async def get_recent_reports(self, spot_id=None, limit=5):
+        return await self._call(self.db.get_recent_reports, spot_id, limit)
+
+    async def get_reports_page(self, spot_id=None, before=None, limit=REPORTS_PAGE_SIZE):
+        return await self._call(self.db.get_reports_page, spot_id, before, limit)
+
+    async def get_spot_catch_stats(self, spot_id, since, limit=5):
+        return await self._call(self.db.get_spot_catch_stats, spot_id, since, limit)
+
+    async def get_species_hotspots(self, fish_species, since, limit=5):
+        return await self._call(self.db.get_species_hotspots, fish_species, since, limit)
+
+    async def add_spot_rating(self, spot_id, user_id, rating):
+        return await self._write(self.db._write_spot_rating, spot_id, user_id, rating)
+
+    async def add_subscription(self, chat_id, city, local_time, send_minute, last_sent_date=None):
+        return await self._write(self.db._write_subscription, chat_id, city, local_time, send_minute, last_sent_date)
+
+    async def remove_subscriptions(self, chat_id, city=None):
+        return await self._write(self.db._write_remove_subscriptions, chat_id, city)
+
+    async def get_subscriptions(self, chat_id):
+        return await self._call(self.db.get_subscriptions, chat_id)
+
+    async def get_due_subscriptions(self, from_minute, to_minute, send_date):
+        return await self._call(self.db.get_due_subscriptions, from_minute, to_minute, send_date)
+
+    async def mark_subscription_sent(self, chat_id, city_key, send_date):
+        return await self._write(self.db._write_subscription_sent, chat_id, city_key, send_date)
+
+    async def add_fishing_report(self, spot_id, user_id, fish_caught, weather, bait, rating, comment):
+        return await self._write(
+            self.db._write_fishing_report, spot_id, user_id, fish_caught, weather, bait, rating, comment
+        )
+
+    async def _write(self, write, *args):
+        """Ставит запись в очередь и ждёт фиксации её пачки."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=DB_WRITE_QUEUE_SIZE)
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.ensure_future(self._writer_loop())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((write, args, future))
+        return await future
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Даём накопиться конкурентным записям, чтобы зафиксировать их вместе
+            await asyncio.sleep(self.commit_interval)
+            while not self._queue.empty() and len(batch) < self.max_batch:
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            writes = [(write, args) for write, args, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._write_executor, self._timed, self.db.commit_batch, writes)
+            except Exception as e:
+                logger.error(f"Ошибка групповой записи: {e}")
+                results = [False] * len(batch)
+            for (_, _, future), ok in zip(batch, results):
+                if not future.done():
+                    future.set_result(ok)
+
+    async def close(self):
+        """Дожидается записи очереди, останавливает потоки и закрывает их соединения."""
+        if self._writer_task is not None and not self._writer_task.done():
+            await self._queue.put(None)
+            await self._writer_task
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        self.db.close()
 
-# Глобальный экземпляр базы данных
+# Глобальный экземпляр базы данных (схема создаётся при первом запросе)
 fishing_db = FishingDatabase()
@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывается одновременно
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 16))
+# Сколько обновлений может ждать в очереди, прежде чем приём новых притормозится
+MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', 1024))
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений из разных чатов с сохранением порядка
+    внутри одного чата: обработчики одного чата (выбор типа прогноза, затем город)
+    выполняются строго друг за другом.
+
+    Обновление сначала ждёт свою очередь в чате и только потом занимает один из
+    max_workers рабочих слотов, поэтому чат с пачкой сообщений не держит слоты
+    впустую и не тормозит остальных пользователей.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_UPDATES, max_pending=MAX_PENDING_UPDATES):
+        super().__init__(max_concurrent_updates=max(max_pending, max_workers))
+        self.max_workers = max_workers
+        self._workers = asyncio.Semaphore(max_workers)
+        self._chat_locks = {}  # chat_id -> [asyncio.Lock, число ожидающих]
+        self.pending = 0  # принятые и ещё не обработанные обновления
+        self.processing = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+            if update.effective_user is not None:
+                return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        arrived = time.monotonic()
+        self.pending += 1
+        try:
+            if key is None:
+                async with self._workers:
+                    await self._run(coroutine, arrived)
+                return
+
+            entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0], self._workers:
+                    await self._run(coroutine, arrived)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chat_locks[key]
+        finally:
+            self.pending -= 1
+
+    async def _run(self, coroutine, arrived):
+        wait = time.monotonic() - arrived
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.processing += 1
+        try:
+            await coroutine
+        finally:
+            self.processing -= 1
+            self.processed += 1
+
+    async def initialize(self):
+        logger.info(f"Параллельная обработка обновлений: до {self.max_workers} одновременно")
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        """Глубина очереди и время ожидания для подбора лимита под нагрузкой."""
+        return {
+            'max_workers': self.max_workers,
+            'waiting': self.pending - self.processing,
+            'processing': self.processing,
+            'processed': self.processed,
+            'active_chats': len(self._chat_locks),
+            'avg_wait': self.total_wait / self.processed if self.processed else 0.0,
+            'max_wait': self.max_wait,
+        }
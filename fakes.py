@@ -0,0 +1,335 @@
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import logging
+import argparse
+import threading
+
+import tornado.web
+import tornado.netutil
+import tornado.httpserver
+
+from gazetteer import GAZETTEER_PATH
+
+logger = logging.getLogger(__name__)
+
+# Шаг интервалов прогноза /forecast и их число (5 дней по 3 часа), как у OpenWeatherMap
+FORECAST_STEP = 3 * 3600
+FORECAST_SLOTS = 40
+# Фактическая погода у OpenWeatherMap обновляется примерно раз в 10 минут
+OBSERVATION_STEP = 600
+
+BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': 'Рыболов', 'username': 'fishing_bench_bot'}
+
+
+def _place(params):
+    """Ключ, название и стабильный генератор случайных чисел для параметров запроса"""
+    if params.get('id'):
+        key, name = f"id:{params['id']}", f"Город {params['id']}"
+    elif params.get('lat') and params.get('lon'):
+        key = f"{float(params['lat']):.2f},{float(params['lon']):.2f}"
+        name = f"Точка {key}"
+    else:
+        key = name = (params.get('q') or 'Москва').strip()
+    seed = zlib.crc32(key.lower().encode('utf-8'))
+    return key, name, random.Random(seed), seed
+
+
+def weather_payload(params, now=None):
+    """Ответ /weather: погода у каждого места своя и меняется только со временем"""
+    now = int(now or time.time())
+    key, name, rng, seed = _place(params)
+    dt = now // OBSERVATION_STEP * OBSERVATION_STEP
+    # Медленное колебание давления, чтобы у истории наблюдений был тренд
+    drift = zlib.crc32(f"{key}:{dt // 3600}".encode('utf-8')) % 40 / 10 - 2
+    lat = float(params.get('lat') or rng.uniform(43, 68))
+    lon = float(params.get('lon') or rng.uniform(28, 135))
+    temp = round(rng.uniform(-5, 25), 2)
+    return {
+        'coord': {'lon': lon, 'lat': lat},
+        'weather': [{'id': 800, 'main': 'Clear', 'description': 'ясно', 'icon': '01d'}],
+        'main': {
+            'temp': temp,
+            'feels_like': round(temp - rng.uniform(0, 3), 2),
+            'pressure': round(rng.uniform(995, 1030) + drift),
+            'humidity': rng.randint(30, 95),
+        },
+        'wind': {'speed': round(rng.uniform(0, 12), 1), 'deg': rng.randint(0, 359)},
+        'clouds': {'all': rng.randint(0, 100)},
+        'dt': dt,
+        'timezone': rng.choice((2, 3, 4, 5, 6, 7, 8, 9, 10)) * 3600,
+        'id': int(params['id']) if params.get('id') else seed % 10000000,
+        'name': name,
+        'cod': 200,
+    }
+
+
+def forecast_payload(params, now=None):
+    """Ответ /forecast: 40 трёхчасовых интервалов начиная с ближайшего"""
+    now = int(now or time.time())
+    current = weather_payload(params, now)
+    rng = random.Random(current['id'])
+    start = now // FORECAST_STEP * FORECAST_STEP + FORECAST_STEP
+    slots = []
+    temp, pressure, wind = current['main']['temp'], current['main']['pressure'], current['wind']['speed']
+    for i in range(FORECAST_SLOTS):
+        temp += rng.uniform(-2, 2)
+        pressure += rng.uniform(-2, 2)
+        wind = max(0.0, wind + rng.uniform(-1.5, 1.5))
+        slots.append({
+            'dt': start + i * FORECAST_STEP,
+            'main': {
+                'temp': round(temp, 2),
+                'feels_like': round(temp - rng.uniform(0, 3), 2),
+                'temp_min': round(temp - 1, 2),
+                'temp_max': round(temp + 1, 2),
+                'pressure': round(pressure),
+                'humidity': rng.randint(30, 95),
+            },
+            'weather': [{'id': 800, 'main': 'Clear', 'description': 'ясно', 'icon': '01d'}],
+            'clouds': {'all': rng.randint(0, 100)},
+            'wind': {'speed': round(wind, 1), 'deg': rng.randint(0, 359)},
+            'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start + i * FORECAST_STEP)),
+        })
+    return {
+        'cod': '200',
+        'cnt': FORECAST_SLOTS,
+        'list': slots,
+        'city': {
+            'id': current['id'],
+            'name': current['name'],
+            'coord': current['coord'],
+            'timezone': current['timezone'],
+        },
+    }
+
+
+def city_places(path=GAZETTEER_PATH):
+    """Города справочника (название, широта, долгота) — то, что пользователи вводят чаще всего"""
+    places = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                _, name, lat, lon = line.rstrip('\n').split('\t')[:4]
+                places.append((name, float(lat), float(lon)))
+    return places
+
+
+def city_names(path=GAZETTEER_PATH):
+    return [name for name, _, _ in city_places(path)]
+
+
+def message_update(update_id, chat_id, text=None, location=None):
+    """Обновление Telegram с сообщением пользователя: текст, команда или геопозиция"""
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'Рыбак {chat_id}', 'language_code': 'ru'}
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+        'from': user,
+    }
+    if text is not None:
+        message['text'] = text
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    if location is not None:
+        message['location'] = {'latitude': location[0], 'longitude': location[1]}
+    return {'update_id': update_id, 'message': message}
+
+
+def inline_query_update(update_id, user_id, query):
+    """Обновление Telegram с инлайн-запросом"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'Рыбак {user_id}', 'language_code': 'ru'}
+    return {
+        'update_id': update_id,
+        'inline_query': {'id': str(update_id), 'from': user, 'query': query, 'offset': ''},
+    }
+
+
+class FakeServer:
+    """
+    Локальный HTTP-сервер в отдельном потоке со своим циклом событий, чтобы
+    заглушка не делила цикл с измеряемым кодом. Задержка ответа — latency
+    плюс случайная добавка до jitter секунд, доля ошибок — error_rate.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+
+    def routes(self):
+        raise NotImplementedError
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def respond_delay(self):
+        """Задержка ответа; возвращает True, если на этот запрос нужно ответить ошибкой"""
+        self.requests += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    def start(self):
+        """Запуск в фоновом потоке; возвращает сервер, когда порт уже слушается"""
+        sockets = tornado.netutil.bind_sockets(self.port, self.host)
+        self.port = sockets[0].getsockname()[1]
+        ready = threading.Event()
+
+        async def serve():
+            server = tornado.httpserver.HTTPServer(tornado.web.Application(self.routes()))
+            server.add_sockets(sockets)
+            self._loop = asyncio.get_running_loop()
+            self._stopped = asyncio.Event()
+            ready.set()
+            await self._stopped.wait()
+            server.stop()
+
+        self._thread = threading.Thread(target=asyncio.run, args=(serve(),), name=type(self).__name__, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors}
+
+
+class _WeatherHandler(tornado.web.RequestHandler):
+    def initialize(self, server, payload):
+        self.server = server
+        self.payload = payload
+
+    async def get(self):
+        if await self.server.respond_delay():
+            self.set_status(503)
+            self.write({'cod': 503, 'message': 'service unavailable'})
+            return
+        params = {name: self.get_argument(name, None) for name in ('q', 'id', 'lat', 'lon')}
+        self.write(self.payload(params))
+
+    def log_exception(self, *args):
+        pass
+
+
+class FakeWeatherServer(FakeServer):
+    """
+    Заглушка OpenWeatherMap: /data/2.5/weather и /data/2.5/forecast по q, id
+    или lat/lon. Адрес для WEATHER_API_BASE — свойство api_base.
+    """
+
+    @property
+    def api_base(self):
+        return f"{self.url}/data/2.5"
+
+    def routes(self):
+        return [
+            (r'/data/2\.5/weather', _WeatherHandler, {'server': self, 'payload': weather_payload}),
+            (r'/data/2\.5/forecast', _WeatherHandler, {'server': self, 'payload': forecast_payload}),
+        ]
+
+
+class _TelegramHandler(tornado.web.RequestHandler):
+    def initialize(self, server):
+        self.server = server
+
+    async def post(self, token, method):
+        if await self.server.respond_delay():
+            self.set_status(502)
+            self.write({'ok': False, 'error_code': 502, 'description': 'Bad Gateway'})
+            return
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(self.request.body or b'{}')
+        else:
+            params = {name: self.get_body_argument(name) for name in self.request.body_arguments}
+        self.write({'ok': True, 'result': self.server.handle(method, params)})
+
+    get = post
+
+    def log_exception(self, *args):
+        pass
+
+
+class FakeTelegramServer(FakeServer):
+    """
+    Заглушка Telegram Bot API: принимает sendMessage, answerInlineQuery и
+    служебные методы и считает их. listener(method, params) вызывается
+    на каждый вызов в потоке сервера. Адрес для TELEGRAM_API_URL — свойство url.
+    """
+
+    def __init__(self, *args, listener=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listener = listener
+        self.methods = {}
+        self._message_id = 0
+
+    def routes(self):
+        return [(r'/bot([^/]+)/(\w+)', _TelegramHandler, {'server': self})]
+
+    def handle(self, method, params):
+        self.methods[method] = self.methods.get(method, 0) + 1
+        if self.listener is not None:
+            self.listener(method, params)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method in ('sendMessage', 'editMessageText'):
+            self._message_id += 1
+            chat_id = int(params.get('chat_id', 0))
+            return {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        return True
+
+    def stats(self):
+        return {**super().stats(), 'methods': dict(self.methods)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Заглушки OpenWeatherMap и Telegram Bot API для локального запуска бота")
+    parser.add_argument('--owm-port', type=int, default=8081)
+    parser.add_argument('--telegram-port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа OpenWeatherMap, с")
+    parser.add_argument('--jitter', type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов OpenWeatherMap с ошибкой 503")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    owm = FakeWeatherServer(port=args.owm_port, latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate).start()
+    telegram = FakeTelegramServer(port=args.telegram_port).start()
+    print(f"WEATHER_API_BASE={owm.api_base}")
+    print(f"TELEGRAM_API_URL={telegram.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        owm.stop()
+        telegram.stop()
+        print(f"OpenWeatherMap: {owm.stats()}, Telegram: {telegram.stats()}", file=sys.stderr)
@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import bisect
+import logging
+import sqlite3
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.getenv(
+    'GAZETTEER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cities.tsv')
+)
+# Выученные у OpenWeatherMap соответствия хранятся рядом с кэшем погоды
+GEOCODE_CACHE_DB = os.getenv('GEOCODE_CACHE_DB', os.getenv('WEATHER_CACHE_DB', 'weather_cache.db'))
+
+# Место: отображаемое название, координаты и id города в OpenWeatherMap (если известен)
+Place = namedtuple('Place', ['name', 'lat', 'lon', 'owm_id'])
+
+# Слова перед названием, которые не относятся к самому городу
+CITY_PREFIXES = {'г', 'гор', 'город', 'city'}
+PUNCTUATION = str.maketrans({char: ' ' for char in '.,-–—_/()"\'«»'})
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's',
+    'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+# Второй распространённый вариант латиницы: "h", "ja", "ju", "j", "c"
+TRANSLIT_ALT = dict(TRANSLIT, **{'х': 'h', 'ю': 'ju', 'я': 'ja', 'й': 'j', 'ц': 'c', 'щ': 'sch'})
+
+
+def place_key(text):
+    """Ключ поиска: регистр, ё, пунктуация и приставки вроде "г." не учитываются."""
+    words = (text or '').casefold().replace('ё', 'е').translate(PUNCTUATION).split()
+    while len(words) > 1 and words[0] in CITY_PREFIXES:
+        words = words[1:]
+    return ' '.join(words)
+
+
+def transliterate(text, table=TRANSLIT):
+    return ''.join(table.get(char, char) for char in text)
+
+
+def edit_distance(a, b, max_distance):
+    """Расстояние Левенштейна с отсечкой: при превышении max_distance возвращает max_distance + 1."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class Gazetteer:
+    """
+    Локальный справочник городов: названия, синонимы и транслитерация
+    сопоставлены с координатами и id OpenWeatherMap. Загружается при первом
+    обращении; поиск точный и по префиксу. Похожие по написанию города только
+    предлагаются пользователю: "Орск" и "Омск" — разные города.
+
+    Индекс меняется только в потоке цикла событий (resolve, complete и learn
+    вызываются оттуда), поэтому чтение обходится без блокировки.
+    """
+
+    def __init__(self, path=GAZETTEER_PATH, cache_db=GEOCODE_CACHE_DB):
+        self.path = path
+        self.cache_db = cache_db
+        self._lock = threading.Lock()
+        self._index = None  # ключ -> Place
+        self._keys = []  # отсортированные ключи для поиска по префиксу
+        self.lookups = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+
+    def load(self):
+        """Загрузка справочника и выученных соответствий (однократно)."""
+        if self._index is not None:
+            return
+        with self._lock:
+            if self._index is not None:
+                return
+            index = {}
+            if os.path.exists(self.path):
+                with open(self.path, encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip() or line.startswith('#'):
+                            continue
+                        owm_id, name, lat, lon, aliases = (line.rstrip('\n').split('\t') + [''] * 5)[:5]
+                        place = Place(name, float(lat), float(lon), int(owm_id) if owm_id else None)
+                        for key in self._place_keys(name, aliases.split('|') if aliases else []):
+                            index.setdefault(key, place)
+            for key, place in self._load_learned():
+                index.setdefault(key, place)
+            self._keys = sorted(index)
+            self._index = index
+            logger.info(f"Справочник городов загружен: {len(index)} ключей")
+
+    @staticmethod
+    def _place_keys(name, aliases):
+        keys = set()
+        for variant in [name] + aliases:
+            key = place_key(variant)
+            if key:
+                keys.update((key, transliterate(key), transliterate(key, TRANSLIT_ALT)))
+        return keys
+
+    def _connect(self):
+        conn = sqlite3.connect(self.cache_db)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                query_key TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                owm_id INTEGER
+            )
+        ''')
+        return conn
+
+    def _load_learned(self):
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute('SELECT query_key, name, lat, lon, owm_id FROM geocode_cache').fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения кэша геокодирования: {e}")
+            return []
+        return [(key, Place(name, lat, lon, owm_id)) for key, name, lat, lon, owm_id in rows]
+
+    def resolve(self, text):
+        """Place для введённого названия или None, если такого написания в справочнике нет."""
+        self.load()
+        self.lookups += 1
+        key = place_key(text)
+        if not key:
+            return None
+        place = self._index.get(key)
+        if place is not None:
+            self.exact_hits += 1
+        return place
+
+    def suggest(self, text):
+        """
+        Город с похожим названием для подсказки "Вы имели в виду …?", когда
+        OpenWeatherMap не нашёл введённое. Сам запрос не подменяется.
+        """
+        self.load()
+        key = place_key(text)
+        if not key or key in self._index:
+            return None
+        place = self._fuzzy(key)
+        if place is not None:
+            self.fuzzy_hits += 1
+        return place
+
+    def _fuzzy(self, key):
+        """Единственный ближайший по написанию ключ на ту же букву."""
+        max_distance = 1 if len(key) <= 5 else 2
+        start = bisect.bisect_left(self._keys, key[0])
+        best, best_distance, ambiguous = None, max_distance + 1, False
+        for i in range(start, len(self._keys)):
+            candidate = self._keys[i]
+            if candidate[0] != key[0]:
+                break
+            distance = edit_distance(key, candidate, max_distance)
+            if distance < best_distance:
+                best, best_distance, ambiguous = candidate, distance, False
+            elif distance == best_distance and best is not None and self._index[candidate] != self._index[best]:
+                ambiguous = True
+        if best is None or ambiguous:
+            return None
+        return self._index[best]
+
+    def complete(self, prefix, limit=10):
+        """Города, ключи которых начинаются с введённого префикса."""
+        self.load()
+        key = place_key(prefix)
+        if not key:
+            return []
+        places = []
+        for i in range(bisect.bisect_left(self._keys, key), len(self._keys)):
+            candidate = self._keys[i]
+            if not candidate.startswith(key):
+                break
+            place = self._index[candidate]
+            if place not in places:
+                places.append(place)
+                if len(places) >= limit:
+                    break
+        return places
+
+    def add_place(self, name, lat, lon, owm_id=None):
+        """Добавляет город в индекс в памяти, если такого названия ещё нет."""
+        self.load()
+        place = Place(name, lat, lon, owm_id)
+        with self._lock:
+            if place_key(name) in self._index:
+                return self._index[place_key(name)]
+            for key in self._place_keys(name, []):
+                if key not in self._index:
+                    self._index[key] = place
+                    bisect.insort(self._keys, key)
+        return place
+
+    def learn(self, query, data):
+        """
+        Запоминает в памяти соответствие введённого названия городу из ответа
+        OpenWeatherMap, чтобы следующие запросы с тем же написанием шли по id.
+        Вызывается в потоке цикла событий; на диск соответствие записывает save_learned.
+        """
+        self.load()
+        city = data.get('city', data)
+        coord = city.get('coord') or {}
+        if 'lat' not in coord or 'lon' not in coord or not city.get('name'):
+            return None
+        place = Place(city['name'], coord['lat'], coord['lon'], city.get('id'))
+        with self._lock:
+            for key in self._learned_keys(query, place):
+                if key not in self._index:
+                    self._index[key] = place
+                    bisect.insort(self._keys, key)
+        return place
+
+    @staticmethod
+    def _learned_keys(query, place):
+        return {place_key(query), place_key(place.name)} - {''}
+
+    def save_learned(self, query, place):
+        """Запись выученного соответствия в кэш геокодирования (в потоке)."""
+        keys = self._learned_keys(query, place)
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO geocode_cache (query_key, name, lat, lon, owm_id) VALUES (?, ?, ?, ?, ?)',
+                        [(key, place.name, place.lat, place.lon, place.owm_id) for key in keys]
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи кэша геокодирования: {e}")
+        return place
+
+    def stats(self):
+        return {
+            'keys': len(self._keys),
+            'lookups': self.lookups,
+            'exact_hits': self.exact_hits,
+            'fuzzy_hits': self.fuzzy_hits,
+        }
+
+
+def attach_owm_ids(city_list_path, path=GAZETTEER_PATH, max_distance_deg=0.3):
+    """
+    Проставляет id OpenWeatherMap в справочнике по официальному списку городов
+    (city.list.json): совпадение по транслитерированному названию или синониму
+    и близость координат.
+    """
+    with open(city_list_path, encoding='utf-8') as f:
+        owm_cities = json.load(f)
+    by_name = {}
+    for item in owm_cities:
+        by_name.setdefault(place_key(item['name']), []).append(item)
+
+    lines = []
+    matched = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                lines.append(line)
+                continue
+            owm_id, name, lat, lon, aliases = (line.rstrip('\n').split('\t') + [''] * 5)[:5]
+            if not owm_id:
+                for key in Gazetteer._place_keys(name, aliases.split('|') if aliases else []):
+                    found = [item for item in by_name.get(key, [])
+                             if abs(item['coord']['lat'] - float(lat)) <= max_distance_deg
+                             and abs(item['coord']['lon'] - float(lon)) <= max_distance_deg]
+                    if found:
+                        owm_id = str(found[0]['id'])
+                        matched += 1
+                        break
+            lines.append('\t'.join([owm_id, name, lat, lon, aliases]) + '\n')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    return matched
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(f"Использование: python {sys.argv[0]} city.list.json")
+        sys.exit(1)
+    print(f"Проставлено id OpenWeatherMap: {attach_owm_ids(sys.argv[1])}")
@@ -0,0 +1,437 @@
+import os
+import sys
+import json
+import math
+import time
+import bisect
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import itertools
+import subprocess
+
+import httpx
+
+from fakes import FakeWeatherServer, FakeTelegramServer, message_update, inline_query_update, city_places
+from benchmark import REPO_DIR, BENCH_DIR, environment
+
+logger = logging.getLogger('loadtest')
+
+LOAD_LEVELS = (1, 2, 4, 8, 16, 32, 64, 128)
+LOAD_DURATION = 20.0
+LOAD_WARMUP = 3.0
+LOAD_TIMEOUT = 30.0
+# Цель по задержке: p99 от отправки обновления до последнего ответа бота, мс
+LOAD_SLO_P99_MS = 1000.0
+
+# Популярность городов по закону Ципфа: справочник, а за ним длинный хвост посёлков
+LOAD_CITIES = 1000
+LOAD_ZIPF_EXPONENT = 1.1
+# Доли действий пользователей: /start, прогноз на сегодня и на 5 дней
+# (нажатие кнопки и ввод города), геопозиция, инлайн-запрос
+LOAD_MIX = (('start', 10), ('today', 45), ('5days', 15), ('location', 20), ('inline', 10))
+
+LOAD_TOKEN = '123456:LOADTEST'
+BOT_START_TIMEOUT = 60.0
+
+# Ответы бота, которые считаются ошибкой обработки
+ERROR_REPLIES = (
+    ('⚠️ Произошла ошибка', 'handler_error'),
+    ('Сервис погоды сейчас перегружен', 'quota'),
+    ('Не могу найти такой город', 'not_found'),
+)
+# Промежуточный ответ на ввод города: за ним следует сам прогноз
+INTERIM_REPLY = 'Ищу прогноз для города'
+
+
+def percentile(values, q):
+    """Перцентиль q (0..100) по отсортированному списку, метод ближайшего ранга"""
+    if not values:
+        return None
+    return values[min(len(values), max(1, math.ceil(q / 100 * len(values)))) - 1]
+
+
+class ZipfCities:
+    """Выбор города с вероятностью, обратной рангу в степени exponent"""
+
+    def __init__(self, places, count=LOAD_CITIES, exponent=LOAD_ZIPF_EXPONENT, rng=None):
+        self.rng = rng or random.Random()
+        self.places = list(places[:count])
+        for i in range(len(self.places), count):
+            # Хвост: посёлки, которых нет в справочнике, рядом с городами из него
+            name, lat, lon = places[i % len(places)]
+            self.places.append((f"Посёлок {i}", lat + self.rng.uniform(-1, 1), lon + self.rng.uniform(-1, 1)))
+        weights = [1 / rank ** exponent for rank in range(1, len(self.places) + 1)]
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def choice(self):
+        index = bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+        return self.places[min(index, len(self.places) - 1)]
+
+
+class ReplyTracker:
+    """
+    Сопоставление вызовов заглушки Telegram с ожидающими обновлениями.
+    Пользователь шлёт следующее обновление только после ответа на предыдущее,
+    поэтому ответ в чат относится к единственному ожидающему обновлению этого чата.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.chats = {}  # chat_id -> (future, ждать ли прогноз после промежуточного ответа)
+        self.inline = {}  # id инлайн-запроса -> future
+
+    def listener(self, method, params):
+        """Вызывается в потоке заглушки: передаёт ответ в цикл генератора нагрузки"""
+        self.loop.call_soon_threadsafe(self._on_call, method, params)
+
+    def _on_call(self, method, params):
+        if method == 'sendMessage':
+            entry = self.chats.get(int(params.get('chat_id', 0)))
+            if entry is None:
+                return
+            future, expects_forecast = entry
+            text = params.get('text', '')
+            if expects_forecast and text.startswith(INTERIM_REPLY):
+                return
+            if not future.done():
+                future.set_result(text)
+        elif method == 'answerInlineQuery':
+            future = self.inline.get(params.get('inline_query_id'))
+            if future is not None and not future.done():
+                future.set_result('')
+
+    def expect_message(self, chat_id, expects_forecast=False):
+        future = self.loop.create_future()
+        self.chats[chat_id] = (future, expects_forecast)
+        return future
+
+    def expect_inline(self, query_id):
+        future = self.loop.create_future()
+        self.inline[query_id] = future
+        return future
+
+    def forget(self, chat_id=None, query_id=None):
+        self.chats.pop(chat_id, None)
+        self.inline.pop(query_id, None)
+
+
+class LoadLevel:
+    """Замкнутая нагрузка: concurrency пользователей, каждый шлёт обновление и ждёт ответа"""
+
+    def __init__(self, client, webhook_url, tracker, cities, rng, concurrency, args, chat_base):
+        self.client = client
+        self.webhook_url = webhook_url
+        self.tracker = tracker
+        self.cities = cities
+        self.rng = rng
+        self.concurrency = concurrency
+        self.args = args
+        self.chat_ids = itertools.count(chat_base)
+        self.update_ids = itertools.count(chat_base * 10)
+        self.actions = [name for name, weight in LOAD_MIX for _ in range(weight)]
+        self.samples = []  # (действие, задержка в секундах, ошибка или None)
+        self.recording_from = None
+        self.stop_at = None
+
+    async def send(self, kind, data, reply):
+        """Отправка обновления на вебхук и ожидание ответа бота; False — пользователя надо сменить"""
+        started = time.perf_counter()
+        error = None
+        try:
+            response = await self.client.post(self.webhook_url, json=data)
+            if response.status_code != 200:
+                error = f'http_{response.status_code}'
+            else:
+                text = await asyncio.wait_for(reply, self.args.timeout)
+                for prefix, label in ERROR_REPLIES:
+                    if text.startswith(prefix):
+                        error = label
+        except asyncio.TimeoutError:
+            error = 'timeout'
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        if self.recording_from <= started and finished <= self.stop_at:
+            self.samples.append((kind, finished - started, error))
+        return error not in ('timeout', 'ConnectError')
+
+    async def user(self):
+        """Виртуальный пользователь; после таймаута заменяется новым, чтобы поздний ответ не спутать"""
+        while time.perf_counter() < self.stop_at:
+            chat_id = next(self.chat_ids)
+            alive = True
+            while alive and time.perf_counter() < self.stop_at:
+                action = self.rng.choice(self.actions)
+                if action == 'inline':
+                    update_id = next(self.update_ids)
+                    query = self.cities.choice()[0][:self.rng.randint(2, 5)].lower()
+                    reply = self.tracker.expect_inline(str(update_id))
+                    alive = await self.send('inline', inline_query_update(update_id, chat_id, query), reply)
+                    self.tracker.forget(query_id=str(update_id))
+                    continue
+                if action == 'start':
+                    steps = [('start', {'text': '/start'}, False)]
+                elif action == 'location':
+                    _, lat, lon = self.cities.choice()
+                    location = (lat + self.rng.uniform(-0.3, 0.3), lon + self.rng.uniform(-0.3, 0.3))
+                    steps = [('location', {'location': location}, False)]
+                else:
+                    button = '🎣 Прогноз на сегодня' if action == 'today' else '🎣 Прогноз на 5 дней'
+                    steps = [('button', {'text': button}, False),
+                             (f'city_{action}', {'text': self.cities.choice()[0]}, True)]
+                for kind, message, expects_forecast in steps:
+                    reply = self.tracker.expect_message(chat_id, expects_forecast)
+                    alive = await self.send(kind, message_update(next(self.update_ids), chat_id, **message), reply)
+                    self.tracker.forget(chat_id=chat_id)
+                    if not alive:
+                        break
+                if self.args.think_time:
+                    await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+    async def run(self):
+        now = time.perf_counter()
+        self.recording_from = now + self.args.warmup
+        self.stop_at = self.recording_from + self.args.duration
+        await asyncio.gather(*(self.user() for _ in range(self.concurrency)))
+
+    def summary(self):
+        latencies = sorted(latency for _, latency, _ in self.samples)
+        errors = {}
+        for _, _, error in self.samples:
+            if error is not None:
+                errors[error] = errors.get(error, 0) + 1
+        by_kind = {}
+        for kind in sorted({kind for kind, _, _ in self.samples}):
+            values = sorted(latency for item_kind, latency, _ in self.samples if item_kind == kind)
+            by_kind[kind] = {
+                'count': len(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+            }
+        to_ms = lambda value: value * 1000 if value is not None else None
+        return {
+            'concurrency': self.concurrency,
+            'duration': self.args.duration,
+            'updates': len(self.samples),
+            'throughput': len(self.samples) / self.args.duration,
+            'p50_ms': to_ms(percentile(latencies, 50)),
+            'p90_ms': to_ms(percentile(latencies, 90)),
+            'p99_ms': to_ms(percentile(latencies, 99)),
+            'max_ms': to_ms(latencies[-1] if latencies else None),
+            'errors': errors,
+            'error_rate': sum(errors.values()) / len(self.samples) if self.samples else 0.0,
+            'by_kind': by_kind,
+        }
+
+
+def process_usage(pid):
+    """Процессорное время (с) и резидентная память (МБ) процесса по /proc; None, если недоступно"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm') as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None, None
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return cpu, rss_pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_bot(port, owm, telegram, workdir):
+    """Запуск bot.py (main() и serve_webhook) с API, направленными на заглушки"""
+    # Файлы кэша и базы мест от прошлого прогона исказили бы первые уровни нагрузки
+    for name in os.listdir(workdir):
+        if name.endswith(('.db', '.db-wal', '.db-shm')):
+            os.remove(os.path.join(workdir, name))
+    env = dict(os.environ)
+    env.update({
+        'BOT_TOKEN': LOAD_TOKEN,
+        'PORT': str(port),
+        'WEBHOOK_URL': f'http://127.0.0.1:{port}',
+        'TELEGRAM_API_URL': telegram.url,
+        'WEATHER_API_BASE': owm.api_base,
+    })
+    # Квоты OpenWeatherMap не мешают замеру, если явно не заданы в окружении
+    env.setdefault('OWM_CALLS_PER_MINUTE', str(10 ** 9))
+    env.setdefault('OWM_CALLS_PER_DAY', str(10 ** 12))
+    log = open(os.path.join(workdir, 'bot.log'), 'w', encoding='utf-8')
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'bot.py')], cwd=workdir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+
+    deadline = time.monotonic() + BOT_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"бот завершился с кодом {process.returncode}, см. {os.path.join(workdir, 'bot.log')}")
+        if telegram.methods.get('setWebhook'):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return process
+            except OSError:
+                pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"бот не запустился за {BOT_START_TIMEOUT:.0f} с")
+
+
+def stop_bot(process):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def run_levels(webhook_url, telegram, pid, args):
+    """Уровни нагрузки по возрастанию, пока p99 укладывается в цель (или все с --keep-going)"""
+    rng = random.Random(args.seed)
+    cities = ZipfCities(city_places(), args.cities, args.zipf, rng)
+    tracker = ReplyTracker(asyncio.get_running_loop())
+    telegram.listener = tracker.listener
+    limits = httpx.Limits(max_connections=max(args.levels), max_keepalive_connections=max(args.levels))
+    levels = []
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        for number, concurrency in enumerate(args.levels, 1):
+            level = LoadLevel(client, webhook_url, tracker, cities, rng, concurrency, args, chat_base=number * 10 ** 7)
+            cpu_before, _ = process_usage(pid) if pid else (None, None)
+            await level.run()
+            result = level.summary()
+            cpu_after, rss = process_usage(pid) if pid else (None, None)
+            elapsed = args.warmup + args.duration
+            result['bot_cpu_pct'] = (cpu_after - cpu_before) / elapsed * 100 if cpu_before is not None else None
+            result['bot_rss_mb'] = rss
+            result['slo_met'] = result['p99_ms'] is not None and result['p99_ms'] <= args.slo_p99 \
+                and result['error_rate'] <= args.max_error_rate
+            levels.append(result)
+            logger.info(
+                f"{concurrency} польз.: {result['throughput']:.1f} обн/с, p99 "
+                f"{result['p99_ms'] or 0:.0f} мс, ошибок {result['error_rate']:.1%}"
+            )
+            if not result['slo_met'] and not args.keep_going:
+                break
+            # Пауза, чтобы хвост ответов прошлого уровня не попал в следующий
+            await asyncio.sleep(1)
+    return levels
+
+
+def capacity(levels):
+    """Наибольший уровень, на котором выполнена цель по p99 и доле ошибок"""
+    passed = [level for level in levels if level['slo_met']]
+    if not passed:
+        return {'max_concurrency': None, 'throughput': None, 'p99_ms': None}
+    best = max(passed, key=lambda level: level['concurrency'])
+    return {'max_concurrency': best['concurrency'], 'throughput': best['throughput'], 'p99_ms': best['p99_ms']}
+
+
+def print_report(report, file=sys.stdout):
+    print(f"{'польз.':>7} {'обн/с':>8} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'макс, мс':>9} "
+          f"{'ошибки':>8} {'CPU бота':>9}", file=file)
+    for level in report['levels']:
+        cpu = f"{level['bot_cpu_pct']:.0f}%" if level['bot_cpu_pct'] is not None else '—'
+        print(f"{level['concurrency']:>7} {level['throughput']:>8.1f} {level['p50_ms'] or 0:>9.0f} "
+              f"{level['p90_ms'] or 0:>9.0f} {level['p99_ms'] or 0:>9.0f} {level['max_ms'] or 0:>9.0f} "
+              f"{level['error_rate']:>8.1%} {cpu:>9}{'' if level['slo_met'] else '  ✗'}", file=file)
+    result = report['capacity']
+    if result['max_concurrency'] is None:
+        print(f"\nЦель p99 ≤ {report['meta']['slo_p99_ms']:.0f} мс не выполнена ни на одном уровне", file=file)
+    else:
+        print(f"\nЁмкость: до {result['max_concurrency']} одновременных пользователей, "
+              f"{result['throughput']:.1f} обновлений/с при p99 {result['p99_ms']:.0f} мс "
+              f"(цель {report['meta']['slo_p99_ms']:.0f} мс)", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест вебхука бота: поток обновлений на вебхук, заглушки Telegram и OpenWeatherMap"
+    )
+    parser.add_argument('--levels', type=lambda value: [int(level) for level in value.split(',')],
+                        default=list(LOAD_LEVELS), help="число одновременных пользователей по уровням")
+    parser.add_argument('--duration', type=float, default=LOAD_DURATION, help="длительность уровня, с")
+    parser.add_argument('--warmup', type=float, default=LOAD_WARMUP, help="прогрев перед замером уровня, с")
+    parser.add_argument('--think-time', type=float, default=0.0, help="средняя пауза пользователя между действиями, с")
+    parser.add_argument('--timeout', type=float, default=LOAD_TIMEOUT, help="ожидание ответа бота, с")
+    parser.add_argument('--slo-p99', type=float, default=LOAD_SLO_P99_MS, help="цель по p99, мс")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="допустимая доля ошибок")
+    parser.add_argument('--keep-going', action='store_true', help="не останавливаться после нарушения цели")
+    parser.add_argument('--cities', type=int, default=LOAD_CITIES, help="число разных городов")
+    parser.add_argument('--zipf', type=float, default=LOAD_ZIPF_EXPONENT, help="показатель распределения Ципфа")
+    parser.add_argument('--owm-latency', type=float, default=0.15, help="задержка заглушки OpenWeatherMap, с")
+    parser.add_argument('--owm-jitter', type=float, default=0.1)
+    parser.add_argument('--owm-error-rate', type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="задержка заглушки Telegram, с")
+    parser.add_argument('--telegram-jitter', type=float, default=0.05)
+    parser.add_argument('--target', help="адрес вебхука уже запущенного бота вместо запуска bot.py")
+    parser.add_argument('--telegram-port', type=int, default=0, help="порт заглушки Telegram (для --target)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', default=os.path.join(BENCH_DIR, 'loadtest'), help="каталог бота и отчётов")
+    parser.add_argument('--output', help="файл отчёта JSON (по умолчанию <workdir>/capacity-<коммит>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    args.workdir = os.path.abspath(args.workdir)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    owm = FakeWeatherServer(latency=args.owm_latency, jitter=args.owm_jitter,
+                            error_rate=args.owm_error_rate, seed=args.seed).start()
+    telegram = FakeTelegramServer(port=args.telegram_port, latency=args.telegram_latency,
+                                  jitter=args.telegram_jitter, seed=args.seed).start()
+    process = None
+    try:
+        if args.target:
+            webhook_url = args.target
+            logger.info(f"Бот должен быть запущен с TELEGRAM_API_URL={telegram.url}")
+        else:
+            port = free_port()
+            process = spawn_bot(port, owm, telegram, args.workdir)
+            webhook_url = f'http://127.0.0.1:{port}/{LOAD_TOKEN}'
+            logger.info(f"Бот запущен (pid {process.pid}), журнал: {os.path.join(args.workdir, 'bot.log')}")
+        levels = asyncio.run(run_levels(webhook_url, telegram, process.pid if process else None, args))
+    finally:
+        if process is not None:
+            stop_bot(process)
+        owm.stop()
+        telegram.stop()
+
+    meta = environment()
+    meta.update({
+        'owm_latency': args.owm_latency,
+        'owm_jitter': args.owm_jitter,
+        'owm_error_rate': args.owm_error_rate,
+        'telegram_latency': args.telegram_latency,
+        'telegram_jitter': args.telegram_jitter,
+        'levels': args.levels,
+        'duration': args.duration,
+        'warmup': args.warmup,
+        'think_time': args.think_time,
+        'slo_p99_ms': args.slo_p99,
+        'max_error_rate': args.max_error_rate,
+        'cities': args.cities,
+        'zipf': args.zipf,
+        'mix': dict(LOAD_MIX),
+        'target': args.target or 'bot.py',
+        'owm_requests': owm.stats(),
+        'telegram_requests': telegram.stats(),
+    })
+    report = {'meta': meta, 'capacity': capacity(levels), 'levels': levels}
+    output = args.output or os.path.join(
+        args.workdir, f"capacity-{(meta['commit'] or 'local')[:12]}{'-dirty' if meta['dirty'] else ''}.json"
+    )
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    print(f"\nОтчёт: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+import functools
+import collections
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Профилирование медленных обработчиков: порог в секундах (0 — выключено) и шаг выборки
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 0))
+PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', 0.005))
+PROFILER_TOP_STACKS = 5
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счётчик с метками."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name + '_total', self.labels, values, value) for values, value in items]
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами: на наблюдение один bisect
+    и два сложения под блокировкой, накопительные суммы считаются при выгрузке.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # метки -> [счётчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        with self._lock:
+            items = [(values, list(series)) for values, series in self._series.items()]
+        samples = []
+        labels = self.labels + ('le',)
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                samples.append((self.name + '_bucket', labels, values + (_format_value(bound),), cumulative))
+            samples.append((self.name + '_sum', self.labels, values, series[-2]))
+            samples.append((self.name + '_count', self.labels, values, series[-1]))
+        return samples
+
+
+class StatsCollector:
+    """
+    Метрики из словаря stats() компонента бота, считываемые при выгрузке:
+    ключи из counters становятся счётчиками, из gauges — датчиками.
+    """
+
+    def __init__(self, prefix, help_text, stats, counters=(), gauges=()):
+        self.prefix = prefix
+        self.help = help_text
+        self.stats = stats
+        self.counters = counters
+        self.gauges = gauges
+
+    def families(self):
+        try:
+            stats = self.stats()
+        except Exception as e:
+            logger.error(f"Ошибка сбора метрик {self.prefix}: {e}")
+            return []
+        families = []
+        for keys, kind, suffix in ((self.counters, 'counter', '_total'), (self.gauges, 'gauge', '')):
+            for key in keys:
+                value = stats.get(key)
+                if value is None:
+                    continue
+                name = f'{self.prefix}_{key}{suffix}'
+                if isinstance(value, dict):
+                    # Вложенный словарь (например, по приоритетам) — одна метрика с меткой
+                    samples = [(name, ('kind',), (label,), item) for label, item in value.items()]
+                else:
+                    samples = [(name, (), (), value)]
+                families.append((name, kind, f'{self.help}: {key}', samples))
+        return families
+
+
+class Registry:
+    """Набор метрик процесса и их выгрузка в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_stats(self, prefix, help_text, stats, counters=(), gauges=()):
+        self._collectors.append(StatsCollector(prefix, help_text, stats, counters, gauges))
+
+    def render(self):
+        # Имя семейства в # HELP/# TYPE совпадает с именем отсчётов: у счётчиков это name_total
+        families = [(metric.name + ('_total' if metric.kind == 'counter' else ''),
+                     metric.kind, metric.help, metric.samples())
+                    for metric in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector.families())
+        lines = []
+        for name, kind, help_text, samples in families:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample_name, labels, values, value in samples:
+                lines.append(f'{sample_name}{_format_labels(labels, values)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    """
+    Выборочный профилировщик для медленных обработчиков. Фоновый поток
+    раз в interval снимает стек потока цикла событий, пока идёт хотя бы один
+    запрос; если запрос длился дольше threshold, в лог пишутся самые частые
+    стеки за время его выполнения. Обработчики выполняются в одном потоке,
+    поэтому в выборку попадают и соседние запросы, что видно по стекам.
+    """
+
+    def __init__(self, threshold=SLOW_REQUEST_SECONDS, interval=PROFILER_INTERVAL, max_samples=20000):
+        self.threshold = threshold
+        self.interval = interval
+        self._samples = collections.deque(maxlen=max_samples)  # (время, стек)
+        self._active = 0
+        self._thread_id = None
+        self._wake = threading.Event()
+        self._thread = None
+        self.reports = 0
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def begin(self):
+        if self._thread is None:
+            self._thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+            self._thread.start()
+        self._active += 1
+        self._wake.set()
+        return time.perf_counter()
+
+    def end(self, started, name):
+        self._active -= 1
+        if self._active == 0:
+            self._wake.clear()
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold:
+            return
+        stacks = collections.Counter(stack for ts, stack in list(self._samples) if ts >= started)
+        total = sum(stacks.values())
+        if not total:
+            return
+        self.reports += 1
+        top = '\n'.join(f"  {count / total:5.1%} {stack}" for stack, count in stacks.most_common(PROFILER_TOP_STACKS))
+        logger.warning(f"Медленный обработчик {name}: {elapsed * 1000:.0f} мс, {total} выборок\n{top}")
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._samples.append((time.perf_counter(), self._collapse(frame)))
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(frame, depth=12):
+        parts = []
+        while frame is not None and len(parts) < depth:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ' < '.join(parts)
+
+
+registry = Registry()
+profiler = SlowRequestProfiler()
+
+HANDLER_SECONDS = registry.histogram(
+    'bot_handler_seconds', 'Время выполнения обработчика обновления', ('handler',))
+HANDLER_PHASE_SECONDS = registry.histogram(
+    'bot_handler_phase_seconds', 'Время этапа обработки: погода, оценка и текст, ответ', ('handler', 'phase'))
+UPSTREAM_SECONDS = registry.histogram(
+    'weather_api_request_seconds', 'Время запроса к API погоды', ('endpoint', 'status'))
+DB_QUERY_SECONDS = registry.histogram(
+    'db_query_seconds', 'Время выполнения запроса к базе мест', ('query',))
+ERRORS = registry.counter('bot_errors', 'Ошибки по типу и месту возникновения', ('where', 'type'))
+
+
+def instrumented(name):
+    """Декоратор обработчика: гистограмма времени, счётчик ошибок и профилирование медленных."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            profiling = profiler.enabled
+            started = profiler.begin() if profiling else time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            except Exception as e:
+                ERRORS.inc(name, type(e).__name__)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+                if profiling:
+                    profiler.end(started, name)
+        return wrapper
+    return decorator
+
+
+def metrics_routes(path='/metrics'):
+    """Маршрут tornado с выгрузкой метрик; подключается к HTTP-серверу вебхука."""
+    import tornado.web
+
+    class MetricsHandler(tornado.web.RequestHandler):
+        def get(self):
+            self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.write(registry.render())
+
+    return [(path, MetricsHandler)]
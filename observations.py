@@ -0,0 +1,278 @@
+import os
+import time
+import array
+import bisect
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from cache import normalize_city
+
+logger = logging.getLogger(__name__)
+
+OBSERVATIONS_DB = os.getenv('OBSERVATIONS_DB', os.getenv('WEATHER_CACHE_DB', 'weather_cache.db'))
+OBSERVATIONS_FLUSH_INTERVAL = float(os.getenv('OBSERVATIONS_FLUSH_INTERVAL', 60))
+# Наблюдения последних 72 часов хранятся как есть, более старые сворачиваются
+# в средние по 6 часов и удаляются через 30 дней
+OBSERVATIONS_RAW_SECONDS = int(os.getenv('OBSERVATIONS_RAW_HOURS', 72)) * 3600
+OBSERVATIONS_COARSE_STEP = 6 * 3600
+OBSERVATIONS_RETENTION = int(os.getenv('OBSERVATIONS_RETENTION_DAYS', 30)) * 86400
+# Больше городов не держим: вытесняются давно не обновлявшиеся
+OBSERVATIONS_MAX_CITIES = int(os.getenv('OBSERVATIONS_MAX_CITIES', 5000))
+# Тренд давления считается, только если история покрывает хотя бы столько времени
+MIN_TREND_SPAN = 3 * 3600
+
+# Столбцы ряда и типы массивов: время (с), давление (0.1 гПа), температура (0.1 °C), ветер (0.1 м/с)
+SERIES_TYPES = (('ts', 'I'), ('pressure', 'H'), ('temp', 'h'), ('wind', 'H'))
+
+
+def observation_key(city, data):
+    """Ключ ряда: id города OpenWeatherMap, а без него — нормализованное название"""
+    return str(data['id']) if data.get('id') else normalize_city(city)
+
+
+class Series:
+    """
+    Наблюдения одного города в компактных массивах array: подробный слой (raw)
+    за последние OBSERVATIONS_RAW_SECONDS и слой средних за 6 часов (coarse)
+    со счётчиком усреднённых значений. Данные только дописываются в конец.
+    """
+
+    __slots__ = ('raw', 'coarse', 'counts')
+
+    def __init__(self):
+        self.raw = {name: array.array(code) for name, code in SERIES_TYPES}
+        self.coarse = {name: array.array(code) for name, code in SERIES_TYPES}
+        self.counts = array.array('H')
+
+    def append(self, ts, pressure, temp, wind):
+        """Новое наблюдение; повторы и данные старше последнего игнорируются"""
+        raw = self.raw
+        if raw['ts'] and ts <= raw['ts'][-1]:
+            return False
+        raw['ts'].append(ts)
+        raw['pressure'].append(round(pressure * 10))
+        raw['temp'].append(round(temp * 10))
+        raw['wind'].append(round(wind * 10))
+        self._downsample(ts)
+        return True
+
+    def _downsample(self, now):
+        """Перенос старых подробных наблюдений в средние и удаление просроченных средних"""
+        raw, coarse = self.raw, self.coarse
+        cut = bisect.bisect_left(raw['ts'], now - OBSERVATIONS_RAW_SECONDS)
+        for i in range(cut):
+            bucket = raw['ts'][i] // OBSERVATIONS_COARSE_STEP * OBSERVATIONS_COARSE_STEP
+            if coarse['ts'] and coarse['ts'][-1] == bucket and self.counts[-1] < 0xFFFF:
+                # Скользящее среднее внутри текущего 6-часового интервала
+                n = self.counts[-1]
+                for name, _ in SERIES_TYPES[1:]:
+                    coarse[name][-1] = round((coarse[name][-1] * n + raw[name][i]) / (n + 1))
+                self.counts[-1] = n + 1
+            else:
+                coarse['ts'].append(bucket)
+                for name, _ in SERIES_TYPES[1:]:
+                    coarse[name].append(raw[name][i])
+                self.counts.append(1)
+        if cut:
+            for column in raw.values():
+                del column[:cut]
+
+        expired = bisect.bisect_left(coarse['ts'], now - OBSERVATIONS_RETENTION)
+        if expired:
+            for column in coarse.values():
+                del column[:expired]
+            del self.counts[:expired]
+
+    def last_ts(self):
+        return self.raw['ts'][-1] if self.raw['ts'] else 0
+
+    def pressure_at(self, ts):
+        """(время, давление в гПа) ближайшего к ts наблюдения не позже ts, или None"""
+        for layer in (self.raw, self.coarse):
+            i = bisect.bisect_right(layer['ts'], ts)
+            if i:
+                return layer['ts'][i - 1], layer['pressure'][i - 1] / 10
+        return None
+
+    def to_bytes(self):
+        """Сериализация: длины слоёв, затем массивы подряд (порядок байтов платформы)"""
+        header = array.array('I', [len(self.raw['ts']), len(self.coarse['ts'])])
+        parts = [header.tobytes()]
+        parts += [self.raw[name].tobytes() for name, _ in SERIES_TYPES]
+        parts += [self.coarse[name].tobytes() for name, _ in SERIES_TYPES]
+        parts.append(self.counts.tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        series = cls()
+        header = array.array('I')
+        header.frombytes(blob[:header.itemsize * 2])
+        offset = header.itemsize * 2
+        for layer, length in ((series.raw, header[0]), (series.coarse, header[1])):
+            for name, _ in SERIES_TYPES:
+                column = layer[name]
+                size = column.itemsize * length
+                column.frombytes(blob[offset:offset + size])
+                offset += size
+        series.counts.frombytes(blob[offset:offset + series.counts.itemsize * header[1]])
+        return series
+
+    def nbytes(self):
+        columns = list(self.raw.values()) + list(self.coarse.values()) + [self.counts]
+        return sum(column.itemsize * len(column) for column in columns)
+
+
+class ObservationStore:
+    """
+    История фактической погоды по городам из ответов /weather, которые бот уже
+    получает: по ней считается тренд давления без дополнительных запросов к API.
+    Число городов ограничено (LRU), на диск ряды сбрасываются отложенно.
+    """
+
+    def __init__(self, db_path=OBSERVATIONS_DB, max_cities=OBSERVATIONS_MAX_CITIES,
+                 flush_interval=OBSERVATIONS_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.max_cities = max_cities
+        self.flush_interval = flush_interval
+        self._series = OrderedDict()  # ключ -> Series, от давно обновлённых к свежим
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._flush_task = None
+        self.recorded = 0
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS weather_observations (
+                    city_key TEXT PRIMARY KEY,
+                    updated_at INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def load(self):
+        """Загрузка рядов с диска (при старте бота, в потоке)"""
+        with self._lock:
+            rows = self._connect().execute(
+                '''SELECT city_key, data FROM weather_observations
+                   WHERE updated_at > ? ORDER BY updated_at DESC LIMIT ?''',
+                (int(time.time()) - OBSERVATIONS_RETENTION, self.max_cities)
+            ).fetchall()
+        for city_key, data in reversed(rows):
+            self._series.setdefault(city_key, Series.from_bytes(data))
+        logger.info(f"История наблюдений загружена: {len(rows)} городов")
+
+    def record(self, city, data):
+        """Сохраняет наблюдение из ответа /weather. Возвращает True, если оно новое."""
+        try:
+            main = data['main']
+            ts = int(data.get('dt') or time.time())
+            pressure, temp = main['pressure'], main['temp']
+            wind = data.get('wind', {}).get('speed', 0.0)
+        except (KeyError, TypeError):
+            return False
+
+        key = observation_key(city, data)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = Series()
+            while len(self._series) > self.max_cities:
+                evicted, _ = self._series.popitem(last=False)
+                self._dirty.discard(evicted)
+        else:
+            self._series.move_to_end(key)
+        if not series.append(ts, pressure, temp, wind):
+            return False
+
+        self.recorded += 1
+        self._dirty.add(key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+        return True
+
+    def pressure_trend(self, city, data, hours=24):
+        """
+        Изменение давления (гПа) за последние hours часов и фактический охват
+        истории в часах: (изменение, часы) или None, если истории мало.
+        """
+        series = self._series.get(observation_key(city, data))
+        if series is None or not series.last_ts():
+            return None
+        last_ts = series.last_ts()
+        latest = series.raw['pressure'][-1] / 10
+        past = series.pressure_at(last_ts - hours * 3600)
+        if past is None:
+            # Истории меньше окна: берём самое раннее наблюдение
+            layer = series.coarse if series.coarse['ts'] else series.raw
+            past = layer['ts'][0], layer['pressure'][0] / 10
+        span = last_ts - past[0]
+        if span < MIN_TREND_SPAN:
+            return None
+        return latest - past[1], span / 3600
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        rows = self._take_dirty()
+        await asyncio.to_thread(self._write, rows)
+
+    def _take_dirty(self):
+        """
+        Снимок изменённых рядов. Делается в потоке цикла событий, где ряды
+        дописываются, чтобы в поток записи не попал наполовину обновлённый ряд.
+        """
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for key in dirty:
+            series = self._series.get(key)
+            if series is not None:
+                rows.append((key, series.last_ts(), series.to_bytes()))
+        return rows
+
+    def _write(self, rows):
+        """Запись рядов одной транзакцией и удаление устаревших и лишних"""
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO weather_observations (city_key, updated_at, data) VALUES (?, ?, ?)',
+                    rows
+                )
+                conn.execute(
+                    '''DELETE FROM weather_observations
+                       WHERE updated_at <= ? OR city_key NOT IN (
+                           SELECT city_key FROM weather_observations ORDER BY updated_at DESC LIMIT ?
+                       )''',
+                    (int(time.time()) - OBSERVATIONS_RETENTION, self.max_cities)
+                )
+        logger.debug(f"История наблюдений: записано {len(rows)} городов")
+
+    def flush(self):
+        self._write(self._take_dirty())
+
+    async def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        rows = self._take_dirty()
+        await asyncio.to_thread(self._write, rows)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        return {
+            'cities': len(self._series),
+            'recorded': self.recorded,
+            'bytes': sum(series.nbytes() for series in self._series.values()),
+        }
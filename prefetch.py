@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+
+from cache import normalize_city
+from weather import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_INTERVAL = int(os.getenv('PREFETCH_INTERVAL', 60))
+PREFETCH_CALLS_PER_MINUTE = int(os.getenv('PREFETCH_CALLS_PER_MINUTE', 20))
+PREFETCH_TOP_CITIES = int(os.getenv('PREFETCH_TOP_CITIES', 50))
+PREFETCH_REFRESH_AHEAD = int(os.getenv('PREFETCH_REFRESH_AHEAD', 300))
+# Коэффициент затухания популярности за один проход планировщика
+PREFETCH_DECAY = 0.98
+
+FORECAST_TYPES = ('today', 'forecast')
+
+
+class PrefetchScheduler:
+    """
+    Фоновое обновление прогнозов для самых популярных городов незадолго
+    до истечения их записей в кэше. Работает через JobQueue приложения.
+    """
+
+    def __init__(self, cache, fetch,
+                 interval=PREFETCH_INTERVAL,
+                 calls_per_minute=PREFETCH_CALLS_PER_MINUTE,
+                 top_cities=PREFETCH_TOP_CITIES,
+                 refresh_ahead=PREFETCH_REFRESH_AHEAD):
+        self.cache = cache
+        self.fetch = fetch
+        self.interval = interval
+        self.calls_per_minute = calls_per_minute
+        self.top_cities = top_cities
+        self.refresh_ahead = refresh_ahead
+        self.popularity = {}  # нормализованный город -> вес запросов
+        self.city_names = {}  # нормализованный город -> название для запроса к API
+        self.refreshed = 0
+
+    def record(self, city):
+        """Учитывает пользовательский запрос города."""
+        key = normalize_city(city)
+        self.popularity[key] = self.popularity.get(key, 0.0) + 1.0
+        self.city_names[key] = city.strip()
+
+    def start(self, job_queue):
+        """Регистрирует периодическую задачу в JobQueue."""
+        job_queue.run_repeating(self.run, interval=self.interval, first=self.interval, name='weather_prefetch')
+        logger.info(f"Фоновое обновление погоды: каждые {self.interval} с, до {self.calls_per_minute} запросов/мин")
+
+    def _decay(self):
+        for key in list(self.popularity):
+            weight = self.popularity[key] * PREFETCH_DECAY
+            if weight < 0.05:
+                del self.popularity[key]
+                del self.city_names[key]
+            else:
+                self.popularity[key] = weight
+
+    def due_refreshes(self, now=None):
+        """Список (город, тип прогноза), чьи записи скоро истекают, по срочности."""
+        now = now if now is not None else time.time()
+        hot = sorted(self.popularity, key=self.popularity.get, reverse=True)[:self.top_cities]
+        due = []
+        for key in hot:
+            for url_type in FORECAST_TYPES:
+                expires_at = self.cache.expires_at((key, url_type))
+                if expires_at is None or expires_at - now <= self.refresh_ahead:
+                    due.append((expires_at or 0, -self.popularity[key], key, url_type))
+        due.sort()
+        return [(key, url_type) for _, _, key, url_type in due]
+
+    async def run(self, context=None):
+        """Один проход: обновить не больше бюджета запросов за интервал."""
+        budget = max(1, self.calls_per_minute * self.interval // 60)
+        due = self.due_refreshes()[:budget]
+        for key, url_type in due:
+            try:
+                refreshed = await self.cache.refresh(self.city_names[key], url_type, self.fetch)
+            except QuotaExceeded:
+                # Квота нужна пользователям: остаток прохода пропускаем
+                logger.info("Фоновое обновление погоды приостановлено: квота API в резерве")
+                break
+            if refreshed is not None:
+                self.refreshed += 1
+        if due:
+            logger.info(f"Фоновое обновление погоды: {len(due)} запросов")
+        self._decay()
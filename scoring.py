@@ -0,0 +1,197 @@
+from datetime import datetime, timezone, timedelta
+
+# NumPy импортируется внутри векторных функций: он нужен только прогнозу на 5 дней,
+# а его загрузка заметно удлиняет холодный старт бота
+
+# Длительность одного интервала прогноза OpenWeatherMap (3 часа)
+SLOT_SECONDS = 3 * 60 * 60
+DAY_SECONDS = 24 * 60 * 60
+HPA_TO_MMHG = 0.750062
+
+# Тренд давления за сутки (гПа): до PRESSURE_STABLE — стабильное, от PRESSURE_SHARP — резкое
+PRESSURE_STABLE = 3.0
+PRESSURE_SHARP = 6.0
+
+# Пороги оценки и советы (от лучшего к худшему)
+FISHING_VERDICTS = (
+    (4, "🟢", "Клевать будет так, что клиент позабудет обо всём на свете! *Бриллиантовая рука."),
+    (2, "🟡", "Если очень хочется и делать все равно нечего, то можно и порыбачить."),
+    (None, "🔴", "Лучше остаться дома и посмотреть сериальчик😜"),
+)
+
+
+def preload():
+    """Заблаговременная загрузка NumPy, чтобы первый прогноз на 5 дней не ждал импорта."""
+    import numpy  # noqa: F401
+
+
+def hpa_to_mmhg(hpa):
+    """Конвертирует гектопаскали в миллиметры ртутного столба."""
+    return hpa * HPA_TO_MMHG
+
+
+def fishing_scores(temp, pressure, wind_speed):
+    """
+    Оценка клёва для массивов температуры (°C), давления (гПа) и ветра (м/с)
+    за один проход без циклов Python. Правила те же, что и в fishing_score.
+    """
+    import numpy as np
+
+    temp = np.asarray(temp, dtype=float)
+    pressure_mmhg = hpa_to_mmhg(np.asarray(pressure, dtype=float))
+    wind_speed = np.asarray(wind_speed, dtype=float)
+
+    # Температура: 10–20 °C лучше всего, жара терпимо, холод плохо
+    score = np.where((temp >= 10) & (temp <= 20), 2, np.where(temp > 20, 1, -1))
+    # Давление: нормальное ~760 мм рт. ст.
+    score += np.where((pressure_mmhg >= 755) & (pressure_mmhg <= 765), 2,
+                      np.where(pressure_mmhg < 755, 1, -1))
+    # Ветер: слабый лучше
+    score += np.where(wind_speed < 5, 2, 1)
+    return score
+
+
+def pressure_trend_score(change):
+    """
+    Поправка оценки за изменение давления (гПа) за последние сутки:
+    стабильное давление улучшает клёв, резкое падение портит его сильнее роста.
+    """
+    if abs(change) <= PRESSURE_STABLE:
+        return 1
+    if change <= -PRESSURE_SHARP:
+        return -2
+    if change >= PRESSURE_SHARP:
+        return -1
+    return 0
+
+
+def pressure_trend_label(change):
+    """Описание тренда давления для ответа пользователю."""
+    if abs(change) <= PRESSURE_STABLE:
+        return "стабильное"
+    if abs(change) >= PRESSURE_SHARP:
+        return "резко падает" if change < 0 else "резко растёт"
+    return "падает" if change < 0 else "растёт"
+
+
+def fishing_score(temp, pressure, wind_speed, pressure_change=None):
+    """
+    Оценка клёва для одного набора значений (без NumPy, для прогноза на сегодня).
+    pressure_change — изменение давления за сутки в гПа, если известна история.
+    """
+    pressure_mmhg = hpa_to_mmhg(pressure)
+    score = 2 if 10 <= temp <= 20 else 1 if temp > 20 else -1
+    score += 2 if 755 <= pressure_mmhg <= 765 else 1 if pressure_mmhg < 755 else -1
+    score += 2 if wind_speed < 5 else 1
+    if pressure_change is not None:
+        score += pressure_trend_score(pressure_change)
+    return score
+
+
+def fishing_verdict(score):
+    """Иконка и совет по оценке клёва."""
+    for threshold, icon, advice in FISHING_VERDICTS:
+        if threshold is None or score >= threshold:
+            return icon, advice
+
+
+def forecast_arrays(weather_data):
+    """Столбцы прогноза /forecast в виде массивов NumPy."""
+    import numpy as np
+
+    slots = weather_data['list']
+    return {
+        'dt': np.fromiter((item['dt'] for item in slots), dtype=np.int64, count=len(slots)),
+        'temp': np.fromiter((item['main']['temp'] for item in slots), dtype=float, count=len(slots)),
+        'feels_like': np.fromiter((item['main']['feels_like'] for item in slots), dtype=float, count=len(slots)),
+        'pressure': np.fromiter((item['main']['pressure'] for item in slots), dtype=float, count=len(slots)),
+        'humidity': np.fromiter((item['main']['humidity'] for item in slots), dtype=float, count=len(slots)),
+        'wind': np.fromiter((item['wind']['speed'] for item in slots), dtype=float, count=len(slots)),
+        'clouds': np.fromiter((item['clouds']['all'] for item in slots), dtype=float, count=len(slots)),
+    }
+
+
+def _best_window(day_scores):
+    """Первый непрерывный отрезок интервалов с максимальной оценкой: (начало, конец)."""
+    import numpy as np
+
+    best = day_scores.max()
+    start = int(np.argmax(day_scores == best))
+    end = start
+    while end + 1 < len(day_scores) and day_scores[end + 1] == best:
+        end += 1
+    return start, end
+
+
+def score_forecast(weather_data):
+    """
+    Оценка всех 3-часовых интервалов прогноза и сводка по дням
+    в часовом поясе города: лучшее окно, средняя оценка, диапазон температур.
+    """
+    import numpy as np
+
+    arrays = forecast_arrays(weather_data)
+    if not len(arrays['dt']):
+        return []
+    tz = timezone(timedelta(seconds=weather_data.get('city', {}).get('timezone', 0)))
+    offset = int(tz.utcoffset(None).total_seconds())
+
+    scores = fishing_scores(arrays['temp'], arrays['pressure'], arrays['wind'])
+    day_index = (arrays['dt'] + offset) // DAY_SECONDS
+    _, starts = np.unique(day_index, return_index=True)
+    ends = np.append(starts[1:], len(scores))
+
+    best_scores = np.maximum.reduceat(scores, starts)
+    mean_scores = np.add.reduceat(scores, starts) / (ends - starts)
+    min_temps = np.minimum.reduceat(arrays['temp'], starts)
+    max_temps = np.maximum.reduceat(arrays['temp'], starts)
+    mean_winds = np.add.reduceat(arrays['wind'], starts) / (ends - starts)
+
+    days = []
+    for day, (start, end) in enumerate(zip(starts, ends)):
+        window_start, window_end = _best_window(scores[start:end])
+        best = start + window_start
+        days.append({
+            'date': datetime.fromtimestamp(int(arrays['dt'][start]), tz),
+            'window_start': datetime.fromtimestamp(int(arrays['dt'][best]), tz),
+            'window_end': datetime.fromtimestamp(int(arrays['dt'][start + window_end]) + SLOT_SECONDS, tz),
+            'best_score': int(best_scores[day]),
+            'mean_score': float(mean_scores[day]),
+            'min_temp': float(min_temps[day]),
+            'max_temp': float(max_temps[day]),
+            'mean_wind': float(mean_winds[day]),
+            'temp': float(arrays['temp'][best]),
+            'feels_like': float(arrays['feels_like'][best]),
+            'wind': float(arrays['wind'][best]),
+            'clouds': int(arrays['clouds'][best]),
+            'humidity': int(arrays['humidity'][best]),
+            'pressure': float(arrays['pressure'][best]),
+            'slots': int(end - start),
+        })
+    return days
+
+
+def rank_cities(forecasts):
+    """
+    Рейтинг городов по клёву для словаря {город: данные /forecast}.
+    Все интервалы всех городов оцениваются одним векторным вызовом.
+    Возвращает список (город, лучшая оценка, средняя оценка) от лучших к худшим.
+    """
+    import numpy as np
+
+    cities = [city for city, data in forecasts.items() if data and data.get('list')]
+    if not cities:
+        return []
+    columns = [forecast_arrays(forecasts[city]) for city in cities]
+    lengths = np.array([len(column['dt']) for column in columns])
+    scores = fishing_scores(
+        np.concatenate([column['temp'] for column in columns]),
+        np.concatenate([column['pressure'] for column in columns]),
+        np.concatenate([column['wind'] for column in columns]),
+    )
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    best_scores = np.maximum.reduceat(scores, starts)
+    mean_scores = np.add.reduceat(scores, starts) / lengths
+
+    order = np.lexsort((-mean_scores, -best_scores))
+    return [(cities[i], int(best_scores[i]), float(mean_scores[i])) for i in order]
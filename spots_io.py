@@ -0,0 +1,201 @@
+import sys
+import csv
+import json
+import math
+import time
+import logging
+
+from database import fishing_db, SPOT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Размер блока чтения GeoJSON и число сообщений об ошибках в строках, попадающих в лог
+READ_CHUNK_SIZE = 1 << 16
+MAX_LOGGED_ERRORS = 20
+
+# Тип водоёма, если в каталоге он не указан
+DEFAULT_SPOT_TYPE = 'водоём'
+
+
+def _coordinate(value, limit, name):
+    """Координата в градусах из строки или числа; ValueError вне диапазона [-limit, limit]"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}: не число ({value!r})")
+    if not math.isfinite(number) or abs(number) > limit:
+        raise ValueError(f"{name}: вне диапазона ({value!r})")
+    return number
+
+
+def validate_spot(record):
+    """
+    Проверка и нормализация записи каталога. Возвращает словарь с полями
+    SPOT_FIELDS или выбрасывает ValueError с описанием ошибки.
+    """
+    spot = {}
+    for field in SPOT_FIELDS:
+        value = record.get(field)
+        if isinstance(value, (list, tuple)):
+            value = ', '.join(str(item) for item in value)
+        spot[field] = (str(value).strip() or None) if value is not None else None
+    if not spot['name'] or not spot['city']:
+        raise ValueError("не указано название или город")
+    spot['type'] = spot['type'] or DEFAULT_SPOT_TYPE
+
+    latitude, longitude = record.get('latitude'), record.get('longitude')
+    if latitude in (None, '') and longitude in (None, ''):
+        spot['latitude'] = spot['longitude'] = None
+        return spot
+    spot['latitude'] = _coordinate(latitude, 90, 'широта')
+    spot['longitude'] = _coordinate(longitude, 180, 'долгота')
+    # Нулевая точка почти всегда означает потерянные координаты, а не водоём в Гвинейском заливе
+    if spot['latitude'] == 0 and spot['longitude'] == 0:
+        raise ValueError("координаты (0, 0)")
+    return spot
+
+
+def read_csv(path):
+    """Записи CSV-каталога по одной; столбцы как в SPOT_FIELDS (допускаются lat/lon)"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for record in csv.DictReader(f):
+            record.setdefault('latitude', record.get('lat'))
+            record.setdefault('longitude', record.get('lon'))
+            yield record
+
+
+def _iter_json_array(f, key, chunk_size=READ_CHUNK_SIZE):
+    """
+    Элементы массива под ключом key верхнего уровня JSON-файла по одному.
+    Файл читается блоками, в памяти держится только текущий элемент.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    marker = f'"{key}"'
+    eof = False
+
+    # Поиск начала массива
+    while True:
+        found = buffer.find(marker)
+        start = buffer.find('[', found + len(marker)) if found >= 0 else -1
+        if start >= 0:
+            buffer = buffer[start + 1:]
+            break
+        if eof:
+            raise ValueError(f"в файле нет массива {key}")
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Элемент не дочитан: добавляем следующий блок
+            if eof:
+                raise ValueError(f"файл оборвался внутри массива {key}")
+            buffer = buffer[position:]
+            position = 0
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        position = end
+        yield item
+
+
+def read_geojson(path):
+    """Записи каталога из GeoJSON FeatureCollection с точками (Point)"""
+    with open(path, encoding='utf-8') as f:
+        for feature in _iter_json_array(f, 'features'):
+            record = dict(feature.get('properties') or {})
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Point' and len(geometry.get('coordinates') or []) >= 2:
+                record['longitude'], record['latitude'] = geometry['coordinates'][:2]
+            yield record
+
+
+def read_spots(path):
+    """Чтение каталога по расширению файла: .csv или .geojson/.json"""
+    if path.lower().endswith('.csv'):
+        return read_csv(path)
+    return read_geojson(path)
+
+
+def valid_spots(records, errors):
+    """Только прошедшие проверку записи; отклонённые считаются в errors['rejected']"""
+    for number, record in enumerate(records, 1):
+        try:
+            yield validate_spot(record)
+        except ValueError as e:
+            errors['rejected'] += 1
+            if errors['rejected'] <= MAX_LOGGED_ERRORS:
+                logger.warning(f"Запись {number} пропущена: {e}")
+
+
+def write_csv(spots, path):
+    """Потоковая выгрузка мест в CSV. Возвращает число строк."""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SPOT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for spot in spots:
+            writer.writerow(spot)
+            count += 1
+    return count
+
+
+def write_geojson(spots, path):
+    """Потоковая выгрузка мест в GeoJSON FeatureCollection. Возвращает число объектов."""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        for spot in spots:
+            geometry = None
+            if spot['latitude'] is not None and spot['longitude'] is not None:
+                geometry = {'type': 'Point', 'coordinates': [spot['longitude'], spot['latitude']]}
+            properties = {field: spot[field] for field in SPOT_FIELDS if field not in ('latitude', 'longitude')}
+            feature = {'type': 'Feature', 'geometry': geometry, 'properties': properties}
+            f.write((',\n' if count else '') + json.dumps(feature, ensure_ascii=False))
+            count += 1
+        f.write('\n]}\n')
+    return count
+
+
+def import_file(path, db):
+    """Импорт каталога в базу: возвращает (загружено, отклонено)"""
+    errors = {'rejected': 0}
+    loaded = db.import_spots(valid_spots(read_spots(path), errors))
+    if errors['rejected']:
+        logger.warning(f"Отклонено записей: {errors['rejected']}")
+    return loaded, errors['rejected']
+
+
+def export_file(path, db):
+    """Выгрузка всех мест в .csv или .geojson; возвращает число мест"""
+    started = time.perf_counter()
+    writer = write_csv if path.lower().endswith('.csv') else write_geojson
+    count = writer(db.iter_spots(), path)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Экспорт мест: {count} строк за {elapsed:.1f} с ({count / max(elapsed, 1e-9):.0f} строк/с)")
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in ('import', 'export'):
+        print(f"Использование: python {sys.argv[0]} import|export файл.csv|файл.geojson")
+        sys.exit(1)
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        if sys.argv[1] == 'import':
+            loaded, rejected = import_file(sys.argv[2], fishing_db)
+            print(f"Загружено мест: {loaded}, отклонено: {rejected}")
+        else:
+            print(f"Выгружено мест: {export_file(sys.argv[2], fishing_db)}")
+    finally:
+        fishing_db.close()
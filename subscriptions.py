@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+
+from weather import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+# Глобальный лимит Telegram ~30 сообщений в секунду; оставляем запас
+SUBSCRIPTION_MESSAGES_PER_SECOND = float(os.getenv('SUBSCRIPTION_MESSAGES_PER_SECOND', 25))
+# Не чаще одного сообщения в секунду в один чат
+SUBSCRIPTION_CHAT_INTERVAL = 1.0
+SUBSCRIPTION_SENDERS = int(os.getenv('SUBSCRIPTION_SENDERS', 16))
+# Сколько городов рассылки одновременно ждут погоду
+SUBSCRIPTION_RENDER_CONCURRENCY = int(os.getenv('SUBSCRIPTION_RENDER_CONCURRENCY', 8))
+# Сколько минут после пропущенного времени отправки (например, сон инстанса) ещё досылать прогноз
+SUBSCRIPTION_CATCHUP_MINUTES = int(os.getenv('SUBSCRIPTION_CATCHUP_MINUTES', 120))
+SUBSCRIPTION_MAX_RETRIES = 3
+MINUTES_PER_DAY = 24 * 60
+
+TIME_PATTERN = re.compile(r'^([01]?\d|2[0-3])[:.]([0-5]\d)$')
+
+
+def parse_local_time(text):
+    """'7:30' -> минуты от полуночи или None."""
+    match = TIME_PATTERN.match(text.strip())
+    if match is None:
+        return None
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def utc_send_minute(local_minute, utc_offset_seconds):
+    """Перевод местного времени города в минуты от полуночи UTC."""
+    return (local_minute - utc_offset_seconds // 60) % MINUTES_PER_DAY
+
+
+class SendPacer:
+    """Темп отправки: общий лимит сообщений в секунду и пауза после RetryAfter."""
+
+    def __init__(self, rate=SUBSCRIPTION_MESSAGES_PER_SECOND):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds):
+        self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+
+class SubscriptionEngine:
+    """
+    Рассылка ежедневных прогнозов подписчикам. Подписки группируются по городу
+    и минуте отправки: на группу один запрос погоды и один готовый текст,
+    который затем рассылается всем чатам группы в темпе, допустимом Telegram.
+    Каждая доставка отмечается в базе, поэтому после перезапуска рассылка
+    продолжается с места остановки без повторов.
+    """
+
+    def __init__(self, db, get_weather, render,
+                 messages_per_second=SUBSCRIPTION_MESSAGES_PER_SECOND,
+                 senders=SUBSCRIPTION_SENDERS,
+                 catchup_minutes=SUBSCRIPTION_CATCHUP_MINUTES,
+                 render_concurrency=SUBSCRIPTION_RENDER_CONCURRENCY):
+        self.db = db
+        self.get_weather = get_weather
+        self.render = render
+        self.pacer = SendPacer(messages_per_second)
+        self.senders = senders
+        self.catchup_minutes = catchup_minutes
+        self.render_concurrency = render_concurrency
+        self._running = False
+        self._chat_last_sent = {}
+        self.sent = 0
+        self.failed = 0
+
+    def start(self, job_queue):
+        """Проверка подписок раз в минуту через JobQueue."""
+        job_queue.run_repeating(self.run, interval=60, first=5, name='subscriptions')
+
+    async def run(self, context):
+        # Предыдущая рассылка ещё идёт: новые подписки подхватит следующий проход
+        if self._running:
+            return
+        self._running = True
+        try:
+            await self.dispatch(context.bot, datetime.now(timezone.utc))
+        finally:
+            self._running = False
+
+    def due_windows(self, now):
+        """
+        Окна (from_minute, to_minute, send_date) для досылки к моменту now (UTC).
+        Сразу после полуночи окно продолжается концом вчерашних суток, и такие
+        подписки отправляются и отмечаются за вчерашнюю дату.
+        """
+        minute = now.hour * 60 + now.minute
+        today = now.date()
+        windows = [(max(0, minute - self.catchup_minutes), minute, today.isoformat())]
+        if minute < self.catchup_minutes:
+            yesterday = (today - timedelta(days=1)).isoformat()
+            windows.insert(0, (max(minute, minute - self.catchup_minutes + MINUTES_PER_DAY),
+                               MINUTES_PER_DAY - 1, yesterday))
+        return windows
+
+    async def dispatch(self, bot, now):
+        """Отправка всех подписок, время которых наступило к моменту now (UTC)."""
+        groups = {}
+        for from_minute, to_minute, send_date in self.due_windows(now):
+            for subscription in await self.db.get_due_subscriptions(from_minute, to_minute, send_date):
+                group = groups.setdefault(subscription['city_key'], {'city': subscription['city'], 'chats': []})
+                group['chats'].append((subscription['chat_id'], send_date))
+        if not groups:
+            return 0
+
+        # Погода для городов запрашивается параллельно, но не больше render_concurrency сразу
+        semaphore = asyncio.Semaphore(self.render_concurrency)
+
+        async def render(city):
+            async with semaphore:
+                return await self._render_group(city)
+
+        texts = await asyncio.gather(*(render(group['city']) for group in groups.values()))
+        queue = asyncio.Queue()
+        for (city_key, group), text in zip(groups.items(), texts):
+            if text is None:
+                continue
+            for chat_id, send_date in group['chats']:
+                queue.put_nowait((chat_id, city_key, send_date, text))
+
+        total = queue.qsize()
+        started = time.monotonic()
+        senders = [asyncio.ensure_future(self._sender(bot, queue))
+                   for _ in range(min(self.senders, total))]
+        await asyncio.gather(*senders)
+        self._chat_last_sent.clear()
+        logger.info(
+            f"Рассылка прогнозов: {total} сообщений по {len(groups)} городам "
+            f"за {time.monotonic() - started:.1f} с"
+        )
+        return total
+
+    async def _render_group(self, city):
+        try:
+            weather = await self.get_weather(city, url_type='today')
+        except QuotaExceeded:
+            logger.warning(f"Рассылка для {city} отложена: квота API погоды исчерпана")
+            return None
+        if not weather:
+            logger.warning(f"Рассылка для {city} отложена: нет данных о погоде")
+            return None
+        text = "☀️ Доброе утро! " + self.render(city, 'today', weather.data)
+        if weather.stale:
+            minutes = max(1, int((time.time() - weather.fetched_at) // 60))
+            text += f"\n\n⏳ Данные обновлены {minutes} мин назад: сервис погоды сейчас перегружен."
+        return text
+
+    async def _sender(self, bot, queue):
+        while not queue.empty():
+            chat_id, city_key, send_date, text = queue.get_nowait()
+            if await self._send(bot, chat_id, text):
+                await self.db.mark_subscription_sent(chat_id, city_key, send_date)
+
+    async def _send(self, bot, chat_id, text):
+        for attempt in range(SUBSCRIPTION_MAX_RETRIES):
+            last_sent = self._chat_last_sent.get(chat_id, 0.0)
+            delay = last_sent + SUBSCRIPTION_CHAT_INTERVAL - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.pacer.wait()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                self._chat_last_sent[chat_id] = time.monotonic()
+                self.sent += 1
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after
+                logger.warning(f"Telegram просит подождать {seconds} с перед отправкой")
+                self.pacer.pause(seconds)
+            except (Forbidden, BadRequest) as e:
+                # Бот заблокирован или чат удалён: подписка больше не нужна
+                if isinstance(e, Forbidden) or 'chat not found' in str(e).lower():
+                    logger.info(f"Подписки чата {chat_id} удалены: {e}")
+                    await self.db.remove_subscriptions(chat_id)
+                else:
+                    logger.error(f"Ошибка отправки прогноза в чат {chat_id}: {e}")
+                self.failed += 1
+                return False
+            except TelegramError as e:
+                logger.error(f"Ошибка отправки прогноза в чат {chat_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+        self.failed += 1
+        return False
+
+    def stats(self):
+        return {'sent': self.sent, 'failed': self.failed, 'running': self._running}
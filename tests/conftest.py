@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fishing_bot(tmp_path, monkeypatch):
+    # Кэш погоды, справочник и история наблюдений создают файлы в текущем каталоге
+    monkeypatch.chdir(tmp_path)
+    import bot
+    return bot.FishingBot()
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from database import AsyncFishingDatabase, FishingDatabase
+
+
+@pytest.fixture
+def sync_db(tmp_path):
+    database = FishingDatabase(str(tmp_path / 'spots.db'))
+    yield database
+    database.close()
+
+
+def run(sync_db, scenario, **kwargs):
+    async def main():
+        db = AsyncFishingDatabase(sync_db, commit_interval=0.01, **kwargs)
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+    return asyncio.run(main())
+
+
+def test_writer_connection_waits_for_disk(sync_db):
+    async def scenario(db):
+        await db.add_spot_rating(1, 1, 5)
+        loop = asyncio.get_running_loop()
+        writer = await loop.run_in_executor(
+            db._write_executor, lambda: sync_db.connection().execute('PRAGMA synchronous').fetchone()[0])
+        reader = await loop.run_in_executor(
+            db._read_executor, lambda: sync_db.connection().execute('PRAGMA synchronous').fetchone()[0])
+        return writer, reader
+
+    # 2 — FULL у писателя, 1 — NORMAL у читателей
+    assert run(sync_db, scenario) == (2, 1)
+
+
+def test_concurrent_writes_share_one_batch(sync_db, monkeypatch):
+    batches = []
+    commit_batch = sync_db.commit_batch
+    monkeypatch.setattr(sync_db, 'commit_batch', lambda writes: batches.append(len(writes)) or commit_batch(writes))
+
+    async def scenario(db):
+        return await asyncio.gather(
+            db.add_spot_rating(1, 1, 4),
+            db.add_fishing_report(1, 1, 'щука', '', 'воблер', 5, ''),
+            db.add_subscription(1, 'Москва', '07:00', 240),
+            db.add_subscription(2, 'Тверь', '08:00', 300),
+        )
+
+    assert run(sync_db, scenario) == [True] * 4
+    assert batches == [4]
+    assert [item['city'] for item in sync_db.get_subscriptions(1)] == ['Москва']
+
+
+def test_subscription_removal_goes_through_writer(sync_db, monkeypatch):
+    sync_db.add_subscription(1, 'Москва', '07:00', 240)
+    sync_db.add_subscription(1, 'Тверь', '08:00', 300)
+    batches = []
+    commit_batch = sync_db.commit_batch
+    monkeypatch.setattr(sync_db, 'commit_batch', lambda writes: batches.append(len(writes)) or commit_batch(writes))
+
+    async def scenario(db):
+        return await db.remove_subscriptions(1, 'Тверь'), await db.remove_subscriptions(1), \
+            await db.remove_subscriptions(1)
+
+    assert run(sync_db, scenario) == (1, 1, 0)
+    assert batches == [1, 1, 1]
+
+
+def test_failed_write_does_not_roll_back_the_batch(sync_db):
+    async def scenario(db):
+        return await asyncio.gather(
+            db.add_subscription(1, 'Москва', '07:00', 240),
+            db.add_subscription(2, 'Тверь', None, 240),
+        )
+
+    assert run(sync_db, scenario) == [True, False]
+    assert sync_db.get_subscriptions(1) == [{'city': 'Москва', 'local_time': '07:00'}]
@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import pytest
+
+from cache import WeatherCache, WeatherStore
+from weather import QuotaExceeded
+
+WEATHER = {'name': 'Москва', 'main': {'temp': 10}}
+
+
+def expired(cache, key, data=WEATHER):
+    """Запись, срок которой вышел минуту назад"""
+    cache.set(key, data, expires_at=time.time() - 60, fetched_at=time.time() - 1860)
+
+
+async def join_background_refresh(cache, outcome):
+    """Пользовательский запрос присоединяется к уже идущему фоновому обновлению"""
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def fetch(city, url_type):
+        started.set()
+        await release.wait()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    refresh = asyncio.ensure_future(cache.refresh('Москва', 'weather', fetch))
+    await started.wait()
+    interactive = asyncio.ensure_future(cache.get_or_fetch('Москва', 'weather', fetch))
+    await asyncio.sleep(0)
+    release.set()
+    return refresh, interactive
+
+
+def test_concurrent_misses_share_one_request():
+    async def scenario():
+        cache = WeatherCache(ttl=600)
+        calls = 0
+
+        async def fetch(city, url_type):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return WEATHER
+
+        results = await asyncio.gather(*(cache.get_or_fetch('Москва', 'weather', fetch) for _ in range(10)))
+        return cache, calls, results
+
+    cache, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert all(result.data == WEATHER and not result.stale for result in results)
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['coalesced'] == 9
+    assert cache.stats()['inflight'] == 0
+
+
+def test_quota_denied_interactive_miss_gets_stale():
+    async def scenario():
+        cache = WeatherCache(ttl=600)
+        expired(cache, cache.make_key('Москва', 'weather'))
+
+        async def fetch(city, url_type):
+            raise QuotaExceeded('test')
+
+        return await cache.get_or_fetch('Москва', 'weather', fetch)
+
+    result = asyncio.run(scenario())
+    assert result.data == WEATHER and result.stale
+
+
+def test_background_refresh_raises_without_stale_fallback():
+    async def scenario():
+        cache = WeatherCache(ttl=600)
+        expired(cache, cache.make_key('Москва', 'weather'))
+
+        async def fetch(city, url_type):
+            raise QuotaExceeded('test')
+
+        await cache.refresh('Москва', 'weather', fetch)
+
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('outcome', [QuotaExceeded('test'), None])
+def test_interactive_waiter_on_background_refresh_gets_stale(outcome):
+    async def scenario():
+        cache = WeatherCache(ttl=600)
+        expired(cache, cache.make_key('Москва', 'weather'))
+        refresh, interactive = await join_background_refresh(cache, outcome)
+        background = await asyncio.gather(refresh, return_exceptions=True)
+        return cache, background[0], await interactive
+
+    cache, background, result = asyncio.run(scenario())
+    assert background is outcome
+    assert result.data == WEATHER and result.stale
+    assert cache.stats()['coalesced'] == 1
+    assert cache.stats()['stale_served'] == 1
+
+
+def test_interactive_waiter_without_stale_data_sees_quota_error():
+    async def scenario():
+        cache = WeatherCache(ttl=600)
+        refresh, interactive = await join_background_refresh(cache, QuotaExceeded('test'))
+        await asyncio.gather(refresh, return_exceptions=True)
+        return await interactive
+
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(scenario())
+
+
+def test_stale_store_entry_served_after_restart(tmp_path):
+    path = str(tmp_path / 'weather.db')
+
+    async def first_run():
+        store = WeatherStore(path, flush_interval=0)
+        store.save(WeatherCache.make_key('Москва', 'weather'), WEATHER,
+                   expires_at=time.time() - 60, fetched_at=time.time() - 1860)
+        await store.close()
+
+    async def second_run():
+        cache = WeatherCache(ttl=600, store=WeatherStore(path))
+
+        async def fetch(city, url_type):
+            return None
+
+        result = await cache.get_or_fetch('москва', 'weather', fetch)
+        await cache.store.close()
+        return cache, result
+
+    asyncio.run(first_run())
+    cache, result = asyncio.run(second_run())
+    assert result.data['name'] == 'Москва' and result.stale
+    assert cache.stats()['stale_served'] == 1
+
+
+def test_background_read_uses_fresh_entry_then_stale_on_denial():
+    async def scenario():
+        cache = WeatherCache(ttl=600)
+        calls = []
+
+        async def fetch(city, url_type):
+            calls.append(city)
+            raise QuotaExceeded('test')
+
+        cache.set(cache.make_key('Москва', 'weather'), WEATHER)
+        fresh = await cache.get_background('Москва', 'weather', fetch)
+        expired(cache, cache.make_key('Тверь', 'weather'))
+        stale = await cache.get_background('Тверь', 'weather', fetch)
+        missing = await cache.get_background('Клин', 'weather', fetch)
+        return calls, fresh, stale, missing
+
+    calls, fresh, stale, missing = asyncio.run(scenario())
+    assert not fresh.stale and calls == ['Тверь', 'Клин']
+    assert stale.data == WEATHER and stale.stale
+    assert missing is None
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from database import FishingDatabase
+
+SINCE = '2000-01-01'
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FishingDatabase(str(tmp_path / 'spots.db'))
+    yield database
+    database.close()
+
+
+def spot_id(db):
+    return db.get_spots_by_city('Москва')[0]['id']
+
+
+def test_multi_species_report_counts_bait_once(db):
+    spot = spot_id(db)
+    for _ in range(7):
+        assert db.add_fishing_report(spot, 1, 'щука 3 кг, окунь 5 шт', '', 'Воблер', 4, '')
+
+    stats = db.get_spot_catch_stats(spot, SINCE)
+
+    assert stats['baits'] == [{'name': 'воблер', 'reports': 7, 'avg_rating': 4.0}]
+    assert sorted((item['name'], item['reports']) for item in stats['species']) == [
+        ('окунь', 7), ('щука', 7)]
+    assert stats['blank_reports'] == 0
+
+
+def test_blank_reports_and_reports_without_bait(db):
+    spot = spot_id(db)
+    db.add_fishing_report(spot, 1, '', '', 'опарыш', None, '')
+    db.add_fishing_report(spot, 2, 'плотва', '', '', 5, '')
+
+    stats = db.get_spot_catch_stats(spot, SINCE)
+
+    assert stats['baits'] == [{'name': 'опарыш', 'reports': 1, 'avg_rating': None}]
+    assert stats['species'] == [{'name': 'плотва', 'reports': 1, 'avg_rating': 5.0}]
+    assert stats['blank_reports'] == 1
+
+
+def test_bait_stats_backfilled_from_existing_reports(db, tmp_path):
+    spot = spot_id(db)
+    for _ in range(3):
+        db.add_fishing_report(spot, 1, 'щука, окунь, судак', '', 'джиг', 3, '')
+    db.close()
+
+    # База предыдущей версии: сводки наживок ещё нет
+    conn = sqlite3.connect(db.db_path)
+    conn.execute('DROP TABLE bait_stats')
+    conn.execute(f'PRAGMA user_version = {FishingDatabase.SCHEMA_VERSION - 1}')
+    conn.commit()
+    conn.close()
+
+    upgraded = FishingDatabase(db.db_path)
+    try:
+        stats = upgraded.get_spot_catch_stats(spot, SINCE)
+    finally:
+        upgraded.close()
+    assert stats['baits'] == [{'name': 'джиг', 'reports': 3, 'avg_rating': 3.0}]
+
+
+def test_rollups_survive_import_with_index_rebuild(db):
+    spot = spot_id(db)
+    db.add_fishing_report(spot, 1, 'щука 2 кг', '', 'Воблер', 5, '')
+    db.add_fishing_report(spot, 2, '', '', 'опарыш', None, '')
+    before = db.get_spot_catch_stats(spot, SINCE)
+
+    # Импорт больше IMPORT_REBUILD_INDEX_RATIO от базы: индексы снимаются и строятся заново
+    db.import_spots({'name': f'Место {i}', 'type': 'озеро', 'city': 'Тверь',
+                     'latitude': 56.0 + i * 1e-4, 'longitude': 35.0} for i in range(20))
+
+    assert db.get_spot_catch_stats(spot, SINCE) == before
+    assert before['baits'][0] == {'name': 'воблер', 'reports': 1, 'avg_rating': 5.0}
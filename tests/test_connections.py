@@ -0,0 +1,77 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from database import DB_BUSY_TIMEOUT_MS, AsyncFishingDatabase, ConnectionManager, FishingDatabase
+
+
+@pytest.fixture
+def connections(tmp_path):
+    manager = ConnectionManager(str(tmp_path / 'spots.db'))
+    yield manager
+    manager.close_all()
+
+
+def in_thread(function):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_thread_reuses_its_connection(connections):
+    conn = connections.get()
+
+    assert connections.get() is conn
+    other = in_thread(connections.get)
+    assert other is not conn
+    assert connections._connections == [conn, other]
+
+
+def test_connection_is_configured_once(connections):
+    conn = connections.get()
+
+    def pragma(name):
+        return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+    assert pragma('journal_mode') == 'wal'
+    assert pragma('busy_timeout') == DB_BUSY_TIMEOUT_MS
+    assert pragma('synchronous') == 1  # NORMAL
+    assert pragma('temp_store') == 2  # MEMORY
+    assert pragma('recursive_triggers') == 1
+
+
+def test_close_all_closes_every_thread_connection(connections):
+    conn = connections.get()
+    other = in_thread(connections.get)
+
+    connections.close_all()
+
+    for closed in (conn, other):
+        with pytest.raises(sqlite3.ProgrammingError):
+            closed.execute('SELECT 1')
+    # После закрытия поток получает новое соединение
+    fresh = connections.get()
+    assert fresh is not conn and fresh.execute('SELECT 1').fetchone() == (1,)
+
+
+def test_async_database_closes_connections_on_shutdown(tmp_path):
+    db = FishingDatabase(str(tmp_path / 'spots.db'))
+
+    async def scenario():
+        async_db = AsyncFishingDatabase(db, commit_interval=0.01)
+        await async_db.get_cities()
+        await async_db.add_spot_rating(1, 1, 5)
+        opened = list(db.connections._connections)
+        await async_db.close()
+        return opened
+
+    opened = asyncio.run(scenario())
+
+    assert len(opened) == 2 and db.connections._connections == []
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
@@ -0,0 +1,59 @@
+import asyncio
+
+from telegram import Update
+
+from dispatch import ChatOrderedUpdateProcessor
+from fakes import message_update
+
+update_ids = iter(range(1, 10 ** 6))
+
+
+def update(chat_id):
+    return Update.de_json(message_update(next(update_ids), chat_id, text='Москва'), None)
+
+
+def run(processor, jobs):
+    """jobs: (chat_id, длительность); возвращает журнал событий (start/end, chat, номер)"""
+    log = []
+
+    async def handler(chat_id, number, duration):
+        log.append(('start', chat_id, number))
+        await asyncio.sleep(duration)
+        log.append(('end', chat_id, number))
+
+    async def scenario():
+        await processor.initialize()
+        await asyncio.gather(*(processor.process_update(update(chat_id), handler(chat_id, number, duration))
+                               for number, (chat_id, duration) in enumerate(jobs)))
+
+    asyncio.run(scenario())
+    return log
+
+
+def test_updates_of_one_chat_run_in_arrival_order():
+    processor = ChatOrderedUpdateProcessor(max_workers=8)
+    log = run(processor, [(1, 0.03), (1, 0.01), (1, 0.0)])
+
+    assert log == [('start', 1, 0), ('end', 1, 0), ('start', 1, 1), ('end', 1, 1),
+                   ('start', 1, 2), ('end', 1, 2)]
+
+
+def test_chats_run_concurrently_up_to_worker_limit():
+    processor = ChatOrderedUpdateProcessor(max_workers=2)
+    active = peak = 0
+    log = run(processor, [(chat_id, 0.02) for chat_id in range(6)])
+    for event, _, _ in log:
+        active += 1 if event == 'start' else -1
+        peak = max(peak, active)
+
+    assert peak == 2
+    stats = processor.stats()
+    assert stats['processed'] == 6 and stats['active_chats'] == 0 and stats['waiting'] == 0
+
+
+def test_queued_chat_does_not_hold_a_worker():
+    processor = ChatOrderedUpdateProcessor(max_workers=2)
+    # Три сообщения чата 1 подряд и одно из чата 2: чату 2 не нужно ждать весь чат 1
+    log = run(processor, [(1, 0.05), (1, 0.05), (1, 0.05), (2, 0.0)])
+
+    assert log.index(('end', 2, 3)) < log.index(('end', 1, 0))
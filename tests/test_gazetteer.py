@@ -0,0 +1,64 @@
+import asyncio
+
+import httpx
+import pytest
+
+from gazetteer import Gazetteer
+from weather import WeatherClient, QuotaGovernor
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    gazetteer = Gazetteer(cache_db=str(tmp_path / 'geocode.db'))
+    gazetteer.load()
+    return gazetteer
+
+
+def test_exact_names_aliases_and_transliteration(gazetteer):
+    assert gazetteer.resolve('г. Москва').name == 'Москва'
+    assert gazetteer.resolve('Moscow').name == 'Москва'
+    assert gazetteer.resolve('питер').name == 'Санкт-Петербург'
+
+
+@pytest.mark.parametrize('city', ['Орск', 'Мценск'])
+def test_real_towns_are_not_replaced_by_similar_cities(gazetteer, city):
+    # "Орск" в одной букве от Омска, "Мценск" — в двух от Минска
+    assert gazetteer.resolve(city) is None
+
+
+def test_typo_is_only_suggested(gazetteer):
+    assert gazetteer.resolve('Омсск') is None
+    assert gazetteer.suggest('Омсск').name == 'Омск'
+    assert gazetteer.suggest('Омск') is None
+    assert gazetteer.stats()['fuzzy_hits'] == 1
+
+
+def test_unknown_town_is_requested_by_name(gazetteer):
+    requests = []
+
+    def handler(request):
+        requests.append(dict(request.url.params))
+        return httpx.Response(200, json={
+            'name': 'Орск', 'id': 515001, 'coord': {'lat': 51.2, 'lon': 58.6},
+            'main': {'temp': 10, 'pressure': 1010, 'humidity': 50}, 'wind': {'speed': 2},
+        })
+
+    async def fetch():
+        client = WeatherClient('key', governor=QuotaGovernor(per_minute=100, per_day=1000), gazetteer=gazetteer)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await client.fetch('Орск', 'today')
+        finally:
+            await client.close()
+
+    assert asyncio.run(fetch())['name'] == 'Орск'
+    assert requests[0]['q'] == 'Орск' and 'id' not in requests[0]
+    # Ответ OpenWeatherMap запомнен: следующий запрос пойдёт по id
+    assert gazetteer.resolve('Орск').owm_id == 515001
+
+
+def test_learned_places_survive_restart(gazetteer, tmp_path):
+    place = gazetteer.learn('Орск', {'name': 'Орск', 'id': 515001, 'coord': {'lat': 51.2, 'lon': 58.6}})
+    assert Gazetteer(cache_db=str(tmp_path / 'geocode.db')).resolve('Орск') is None
+    gazetteer.save_learned('Орск', place)
+    assert Gazetteer(cache_db=str(tmp_path / 'geocode.db')).resolve('орск') == place
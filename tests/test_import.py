@@ -0,0 +1,135 @@
+import io
+import json
+
+import pytest
+
+from database import FishingDatabase
+from spots_io import DEFAULT_SPOT_TYPE, _iter_json_array, export_file, import_file, validate_spot
+
+
+def spots(count, city='Тверь', species='щука, окунь', offset=0):
+    for i in range(offset, offset + count):
+        yield {'name': f'Место {i}', 'type': 'озеро', 'city': city,
+               'latitude': 56.0 + i * 1e-4, 'longitude': 35.0 + i * 1e-4, 'fish_species': species}
+
+
+def imported(spots_found):
+    """Только загруженные тестом места, без начальных данных базы"""
+    return {spot['name'] for spot in spots_found if spot['name'].startswith('Место ')}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = FishingDatabase(str(tmp_path / 'spots.db'))
+    drops = []
+    drop = database._drop_bulk_indexes
+    monkeypatch.setattr(database, '_drop_bulk_indexes', lambda cursor: drops.append(1) or drop(cursor))
+    database.drops = drops
+    yield database
+    database.close()
+
+
+def test_large_import_rebuilds_indexes(db):
+    assert db.import_spots(spots(500), batch_size=100) == 500
+
+    assert len(db.drops) == 1
+    assert len(imported(db.get_spots_by_fish('щука', limit=1000))) == 500
+    assert db.get_spots_near(56.0, 35.0, radius_km=1, limit=3)[0]['name'] == 'Место 0'
+
+
+def test_small_import_keeps_indexes(db):
+    db.import_spots(spots(500), batch_size=100)
+    db.drops.clear()
+
+    assert db.import_spots(spots(20, city='Клин', species='судак', offset=1000), batch_size=100) == 20
+    # Обновление уже загруженного места меняет и индекс видов
+    assert db.import_spots(spots(1, species='карп')) == 1
+
+    assert db.drops == []
+    assert imported(db.get_spots_by_fish('судак')) == {f'Место {i}' for i in range(1000, 1020)}
+    assert imported(db.get_spots_by_fish('карп')) == {'Место 0'}
+    assert 'Место 0' not in imported(db.get_spots_by_fish('щука', limit=1000))
+    assert db.get_spots_near(56.1, 35.1, radius_km=1, limit=1)[0]['name'] == 'Место 1000'
+
+
+def test_streamed_import_switches_to_rebuild_past_threshold(db):
+    db.import_spots(spots(500), batch_size=100)
+    db.drops.clear()
+
+    # Первая пачка укладывается в 10%, вторая уже нет
+    assert db.import_spots(spots(80, city='Клин', offset=1000), batch_size=40) == 80
+
+    assert len(db.drops) == 1
+    assert len(imported(db.get_spots_by_city('Клин'))) == 80
+    assert db.get_spots_near(56.1, 35.1, radius_km=1, limit=1)[0]['name'] == 'Место 1000'
+
+
+def test_index_rebuild_replays_only_index_steps(db, monkeypatch):
+    spot = db.get_spots_by_city('Москва')[0]['id']
+    db.add_spot_rating(spot, 1, 4)
+    db.add_fishing_report(spot, 1, 'щука', '', 'воблер', 5, '')
+    catch_stats = db.get_spot_catch_stats(spot, '2000-01-01')
+    for step in FishingDatabase.MIGRATIONS:
+        if step not in FishingDatabase.BULK_INDEX_STEPS:
+            monkeypatch.setattr(db, step, lambda cursor, step=step: pytest.fail(f'повторён шаг {step}'))
+
+    db.import_spots(spots(500), batch_size=100)
+
+    assert len(db.drops) == 1
+    assert db.get_spot_catch_stats(spot, '2000-01-01') == catch_stats
+    # Триггеры оценок и пересозданные триггеры координат и видов работают
+    db.add_spot_rating(spot, 2, 2)
+    rated = next(item for item in db.get_spots_by_city('Москва') if item['id'] == spot)
+    assert (rated['avg_rating'], rated['rating_count']) == (3.0, 2)
+    new_spot = db.add_spot({'name': 'Место новое', 'type': 'озеро', 'city': 'Тверь',
+                            'latitude': 57.0, 'longitude': 36.0, 'fish_species': 'сом'})
+    assert db.get_spots_near(57.0, 36.0, radius_km=1)[0]['id'] == new_spot
+    db.connection().execute('DELETE FROM fishing_spots WHERE id = ?', (new_spot,))
+    assert db.get_spots_by_fish('сом') == [] and db.get_spots_near(57.0, 36.0, radius_km=1) == []
+
+
+@pytest.mark.parametrize('record, error', [
+    ({'name': 'Пруд', 'city': ''}, 'название или город'),
+    ({'name': 'Пруд', 'city': 'Тверь', 'latitude': 'север', 'longitude': '35'}, 'широта: не число'),
+    ({'name': 'Пруд', 'city': 'Тверь', 'latitude': '56', 'longitude': '200'}, 'долгота: вне диапазона'),
+    ({'name': 'Пруд', 'city': 'Тверь', 'latitude': 0, 'longitude': 0}, r'координаты \(0, 0\)'),
+])
+def test_invalid_records_are_rejected(record, error):
+    with pytest.raises(ValueError, match=error):
+        validate_spot(record)
+
+
+def test_record_is_normalized():
+    spot = validate_spot({'name': ' Пруд ', 'city': 'Тверь', 'fish_species': ['карп', 'линь'],
+                          'latitude': '56.85', 'longitude': 35.9, 'description': ''})
+
+    assert spot['name'] == 'Пруд' and spot['type'] == DEFAULT_SPOT_TYPE
+    assert spot['fish_species'] == 'карп, линь' and spot['description'] is None
+    assert (spot['latitude'], spot['longitude']) == (56.85, 35.9)
+
+
+def test_geojson_array_is_streamed_across_chunk_boundaries():
+    features = [{'type': 'Feature', 'properties': {'name': f'Место {i}', 'note': 'ё' * i}} for i in range(50)]
+    text = json.dumps({'type': 'FeatureCollection', 'features': features}, ensure_ascii=False)
+
+    assert list(_iter_json_array(io.StringIO(text), 'features', chunk_size=7)) == features
+    with pytest.raises(ValueError, match='оборвался'):
+        list(_iter_json_array(io.StringIO(text[:-40]), 'features', chunk_size=7))
+
+
+def without_ids(spots_found):
+    return sorted((tuple(sorted((k, v) for k, v in spot.items() if k != 'id')) for spot in spots_found), key=repr)
+
+
+@pytest.mark.parametrize('extension', ['csv', 'geojson'])
+def test_export_then_import_round_trip(db, tmp_path, extension):
+    db.import_spots(spots(30, species='щука, окунь'))
+    path = str(tmp_path / f'spots.{extension}')
+    exported = export_file(path, db)
+
+    copy = FishingDatabase(str(tmp_path / 'copy.db'))
+    try:
+        assert import_file(path, copy) == (exported, 0)
+        assert without_ids(copy.iter_spots()) == without_ids(db.iter_spots())
+    finally:
+        copy.close()
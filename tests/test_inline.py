@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+
+WEATHER = {'name': 'Москва', 'main': {'temp': 12.0, 'pressure': 1015, 'humidity': 60},
+           'wind': {'speed': 3.0}, 'weather': [{'description': 'ясно'}], 'timezone': 10800}
+
+
+def test_inline_query_prefetches_through_application_tasks(fishing_bot):
+    fetched = []
+
+    async def background_fetch(city, url_type):
+        fetched.append(city)
+        return WEATHER
+
+    async def scenario():
+        fishing_bot.background_fetch = background_fetch
+        tasks = []
+        answers = []
+
+        def create_task(coroutine, name=None):
+            task = asyncio.ensure_future(coroutine)
+            tasks.append((name, task))
+            return task
+
+        async def answer(results, cache_time):
+            answers.append(([result.title for result in results], cache_time))
+
+        update = SimpleNamespace(inline_query=SimpleNamespace(query='москв', answer=answer))
+        context = SimpleNamespace(application=SimpleNamespace(create_task=create_task))
+        try:
+            await fishing_bot.handle_inline_query(update, context)
+            await asyncio.gather(*(task for _, task in tasks))
+            await fishing_bot.handle_inline_query(update, context)
+        finally:
+            await fishing_bot.shutdown(None)
+        return tasks, answers
+
+    tasks, answers = asyncio.run(scenario())
+    assert [name for name, _ in tasks] == ['inline_prefetch:Москва']
+    assert fetched == ['Москва']
+    assert answers[0] == (['Москва: прогноз загружается…'], 5)
+    assert answers[1][0][0].startswith('Москва: 12°C, клёв')
@@ -0,0 +1,75 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+
+import httpx
+
+from metrics import Registry, metrics_routes
+from webhook import webhook_app
+
+
+def families(text):
+    """Имена из строк # TYPE и имена отсчётов выгрузки"""
+    types = {}
+    samples = set()
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            types[name] = kind
+        elif line and not line.startswith('#'):
+            samples.add(line.split('{')[0].split(' ')[0])
+    return types, samples
+
+
+def test_counter_family_names_match_samples():
+    registry = Registry()
+    errors = registry.counter('bot_errors', 'Ошибки', ('where',))
+    errors.inc('handler')
+    registry.add_stats('weather_cache', 'Кэш', lambda: {'hits': 3, 'size': 7, 'denied': {'background': 1}},
+                       counters=('hits', 'denied'), gauges=('size',))
+
+    types, samples = families(registry.render())
+
+    assert types == {'bot_errors_total': 'counter', 'weather_cache_hits_total': 'counter',
+                     'weather_cache_denied_total': 'counter', 'weather_cache_size': 'gauge'}
+    assert samples == set(types)
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram('handler_seconds', 'Время', ('handler',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, 'start')
+
+    text = registry.render()
+
+    assert '# TYPE handler_seconds histogram' in text
+    assert 'handler_seconds_bucket{handler="start",le="0.1"} 1' in text
+    assert 'handler_seconds_bucket{handler="start",le="1.0"} 2' in text
+    assert 'handler_seconds_bucket{handler="start",le="+Inf"} 3' in text
+    assert 'handler_seconds_count{handler="start"} 3' in text
+
+
+def test_webhook_server_also_serves_metrics():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    async def scenario():
+        application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+        server = webhook_app(application, '1:token', metrics_routes()).listen(port, address='127.0.0.1')
+        try:
+            async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}') as client:
+                metrics = await client.get('/metrics')
+                accepted = await client.post('/1:token', json={'update_id': 42})
+                rejected = await client.post('/1:token', content=b'not json')
+                unknown = await client.post('/other', json={'update_id': 43})
+        finally:
+            server.stop()
+        return metrics, accepted, rejected, unknown, application.update_queue
+
+    metrics, accepted, rejected, unknown, queue = asyncio.run(scenario())
+    assert metrics.status_code == 200 and '# TYPE bot_errors_total counter' in metrics.text
+    assert metrics.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert (accepted.status_code, rejected.status_code, unknown.status_code) == (200, 400, 404)
+    assert queue.qsize() == 1 and queue.get_nowait().update_id == 42
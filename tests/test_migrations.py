@@ -0,0 +1,168 @@
+import os
+import sqlite3
+
+import pytest
+
+from database import FishingDatabase
+
+# Схема базы до миграций (версия 0), как её создавала первая версия бота
+BASELINE_SCHEMA = '''
+    CREATE TABLE fishing_spots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        city TEXT NOT NULL,
+        latitude REAL,
+        longitude REAL,
+        fish_species TEXT,
+        description TEXT,
+        best_season TEXT,
+        access_type TEXT DEFAULT 'бесплатный',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE fishing_reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        spot_id INTEGER,
+        user_id INTEGER,
+        report_date DATE,
+        fish_caught TEXT,
+        weather_conditions TEXT,
+        bait_used TEXT,
+        rating INTEGER,
+        comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (spot_id) REFERENCES fishing_spots (id)
+    );
+    CREATE TABLE spot_ratings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        spot_id INTEGER,
+        user_id INTEGER,
+        rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(spot_id, user_id),
+        FOREIGN KEY (spot_id) REFERENCES fishing_spots (id)
+    );
+'''
+
+
+@pytest.fixture
+def baseline_path(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        'INSERT INTO fishing_spots (id, name, type, city, latitude, longitude, fish_species) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(1, 'Химкинское водохранилище', 'водохранилище', 'москва', 55.8787, 37.4382, 'щука, окунь'),
+         (2, 'Озеро Ёлкино', 'озеро', 'Ёлкино', 56.1, 38.2, 'Карась, линь')])
+    conn.executemany('INSERT INTO spot_ratings (spot_id, user_id, rating) VALUES (?, ?, ?)',
+                     [(1, 10, 5), (1, 11, 3), (2, 10, 4)])
+    conn.execute('''INSERT INTO fishing_reports (spot_id, user_id, report_date, fish_caught, bait_used, rating)
+                    VALUES (1, 10, '2026-05-02', 'щука 2 кг, окунь 5 шт', 'воблер', 4)''')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def open_db(path):
+    return FishingDatabase(path)
+
+
+def create(path):
+    """База текущей версии"""
+    db = open_db(path)
+    db.connection()
+    db.close()
+
+
+def version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_new_database_is_created_lazily(tmp_path):
+    path = str(tmp_path / 'new.db')
+    db = open_db(path)
+    assert not os.path.exists(path)
+
+    try:
+        assert db.get_spots_by_city('Москва')
+    finally:
+        db.close()
+    assert version(path) == FishingDatabase.SCHEMA_VERSION
+
+
+def test_baseline_database_is_upgraded_with_backfills(baseline_path):
+    db = open_db(baseline_path)
+    try:
+        spots = db.get_spots_by_city('МОСКВА')
+        assert [(spot['name'], spot['avg_rating'], spot['rating_count']) for spot in spots] == [
+            ('Химкинское водохранилище', 4.0, 2)]
+        assert [spot['id'] for spot in db.get_spots_by_city('елкино')] == [2]
+        assert [spot['id'] for spot in db.get_spots_by_fish('караси')] == [2]
+        assert db.get_spots_near(55.88, 37.44, radius_km=5)[0]['id'] == 1
+        stats = db.get_spot_catch_stats(1, '2026-01-01')
+        assert sorted(item['name'] for item in stats['species']) == ['окунь', 'щука']
+        assert stats['baits'] == [{'name': 'воблер', 'reports': 1, 'avg_rating': 4.0}]
+        # Начальные данные в непустую базу не добавляются
+        assert db.get_spots_by_city('Новосибирск') == []
+    finally:
+        db.close()
+    assert version(baseline_path) == FishingDatabase.SCHEMA_VERSION
+
+
+def test_current_database_only_reads_user_version(tmp_path):
+    path = str(tmp_path / 'spots.db')
+    create(path)
+
+    db = open_db(path)
+    conn = db.connections.get()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        db.init_database(conn)
+    finally:
+        conn.set_trace_callback(None)
+        db.close()
+    assert statements == ['PRAGMA user_version']
+
+
+def test_failed_migration_leaves_database_untouched(baseline_path, monkeypatch):
+    def broken(self, cursor):
+        raise sqlite3.OperationalError('сбой миграции')
+
+    monkeypatch.setattr(FishingDatabase, '_create_report_feeds', broken)
+    db = open_db(baseline_path)
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            db.get_spots_by_city('Москва')
+    finally:
+        db.close()
+
+    conn = sqlite3.connect(baseline_path)
+    try:
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(fishing_spots)')}
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+    assert version(baseline_path) == 0
+    assert 'city_key' not in columns and 'rating_sum' not in columns
+    assert 'spot_species' not in tables
+
+
+def test_newer_schema_is_left_alone(tmp_path, caplog):
+    path = str(tmp_path / 'spots.db')
+    create(path)
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA user_version = {FishingDatabase.SCHEMA_VERSION + 1}')
+    conn.close()
+
+    db = open_db(path)
+    try:
+        assert db.get_spots_by_city('Москва')
+    finally:
+        db.close()
+    assert version(path) == FishingDatabase.SCHEMA_VERSION + 1
+    assert 'новее ожидаемой' in caplog.text
@@ -0,0 +1,76 @@
+import pytest
+
+from database import FishingDatabase, bounding_boxes, haversine_km
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FishingDatabase(str(tmp_path / 'spots.db'))
+    yield database
+    database.close()
+
+
+def add(db, name, latitude, longitude):
+    return db.add_spot({'name': name, 'type': 'озеро', 'city': 'Тест',
+                        'latitude': latitude, 'longitude': longitude, 'fish_species': 'щука'})
+
+
+def test_haversine_distance():
+    # Москва — Санкт-Петербург
+    assert haversine_km(55.7558, 37.6173, 59.9343, 30.3351) == pytest.approx(634, abs=2)
+    assert haversine_km(60.0, 179.9, 60.0, -179.9) == pytest.approx(11.1, abs=0.1)
+
+
+def test_box_covers_the_circle():
+    (min_lat, max_lat, min_lon, max_lon), = bounding_boxes(56.0, 35.0, 10)
+
+    assert haversine_km(56.0, 35.0, max_lat, 35.0) == pytest.approx(10, rel=0.01)
+    assert haversine_km(56.0, 35.0, 56.0, max_lon) >= 10
+    assert min_lat < 56.0 < max_lat and min_lon < 35.0 < max_lon
+
+
+@pytest.mark.parametrize('longitude', [179.9, -179.9])
+def test_box_is_split_at_the_antimeridian(longitude):
+    boxes = bounding_boxes(60.0, longitude, 20)
+
+    assert len(boxes) == 2
+    assert any(box[2] <= 179.9 <= box[3] for box in boxes)
+    assert any(box[2] <= -179.9 <= box[3] for box in boxes)
+    assert all(-180.0 <= box[2] <= box[3] <= 180.0 for box in boxes)
+
+
+def test_box_near_the_pole_spans_all_longitudes():
+    assert bounding_boxes(89.99, 10.0, 50) == [(pytest.approx(89.54, abs=0.01), 90.0, -180.0, 180.0)]
+
+
+def test_nearest_spots_within_radius_by_distance(db):
+    near = add(db, 'Место 1 км', 56.009, 35.0)
+    nearer = add(db, 'Место рядом', 56.001, 35.0)
+    far = add(db, 'Место 30 км', 56.27, 35.0)
+
+    spots = db.get_spots_near(56.0, 35.0, radius_km=10)
+    assert [spot['id'] for spot in spots] == [nearer, near]
+    assert spots[0]['distance_km'] == 0.1 and spots[1]['distance_km'] == 1.0
+
+    assert [spot['id'] for spot in db.get_spots_near(56.0, 35.0, radius_km=50, limit=3)] == [nearer, near, far]
+    assert [spot['id'] for spot in db.get_spots_near(56.0, 35.0, radius_km=50, limit=1)] == [nearer]
+    assert db.get_spots_near(0.5, 0.5, radius_km=10) == []
+
+
+def test_spot_across_the_antimeridian_is_found(db):
+    east = add(db, 'Место восток', 60.0, 179.9)
+    west = add(db, 'Место запад', 60.0, -179.9)
+
+    assert [spot['id'] for spot in db.get_spots_near(60.0, 179.9, radius_km=20)] == [east, west]
+    assert [spot['id'] for spot in db.get_spots_near(60.0, -179.9, radius_km=20)] == [west, east]
+    assert db.get_spots_near(60.0, 179.9, radius_km=20)[1]['distance_km'] == pytest.approx(11.1, abs=0.1)
+
+
+def test_moved_spot_is_found_at_its_new_place(db):
+    spot = add(db, 'Место', 56.0, 35.0)
+    conn = db.connection()
+    with conn:
+        conn.execute('UPDATE fishing_spots SET latitude = 57.0 WHERE id = ?', (spot,))
+
+    assert db.get_spots_near(56.0, 35.0, radius_km=10) == []
+    assert db.get_spots_near(57.0, 35.0, radius_km=10)[0]['id'] == spot
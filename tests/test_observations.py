@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from observations import OBSERVATIONS_COARSE_STEP, OBSERVATIONS_RAW_SECONDS, ObservationStore, Series
+
+HOUR = 3600
+NOW = int(time.time()) // HOUR * HOUR
+
+
+def weather(dt, pressure, city_id=524901, temp=12.0):
+    return {'id': city_id, 'dt': dt, 'main': {'pressure': pressure, 'temp': temp}, 'wind': {'speed': 3.0}}
+
+
+def record_all(store, observations):
+    """record() планирует отложенную запись на диск, поэтому вызывается в цикле событий"""
+    async def scenario():
+        results = [store.record('Москва', data) for data in observations]
+        store._flush_task.cancel()
+        return results
+    return asyncio.run(scenario())
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ObservationStore(str(tmp_path / 'observations.db'), flush_interval=3600)
+
+
+def test_pressure_trend_over_a_day(store):
+    # Давление падает на 0.5 гПа в час последние 30 часов
+    record_all(store, [weather(NOW - hours * HOUR, 1000 + hours * 0.5) for hours in range(30, -1, -1)])
+
+    change, span = store.pressure_trend('Москва', weather(NOW, 1000))
+    assert change == pytest.approx(-12.0) and span == 24
+
+
+def test_short_history_has_no_trend(store):
+    record_all(store, [weather(NOW - HOUR, 1010), weather(NOW, 1008)])
+
+    assert store.pressure_trend('Москва', weather(NOW, 1008)) is None
+    assert store.pressure_trend('Тверь', weather(NOW, 1008, city_id=480060)) is None
+
+
+def test_repeated_and_older_observations_are_ignored(store):
+    assert record_all(store, [weather(NOW, 1010), weather(NOW, 1010), weather(NOW - HOUR, 1011)]) == [
+        True, False, False]
+    assert store.stats()['recorded'] == 1
+
+
+def test_old_observations_are_averaged_into_coarse_layer():
+    series = Series()
+    start = NOW // OBSERVATIONS_COARSE_STEP * OBSERVATIONS_COARSE_STEP - OBSERVATIONS_RAW_SECONDS - 12 * HOUR
+    for hour in range(0, 84 + 1):
+        series.append(start + hour * HOUR, 1000 + hour % 6, 10.0, 2.0)
+
+    assert series.raw['ts'][0] >= series.last_ts() - OBSERVATIONS_RAW_SECONDS
+    # Первые 6 часов свернулись в одно среднее: давление 1000…1005 → 1002.5
+    assert series.coarse['ts'][0] == start and series.counts[0] == 6
+    assert series.pressure_at(start + HOUR) == (start, 1002.5)
+    assert Series.from_bytes(series.to_bytes()).to_bytes() == series.to_bytes()
+
+
+def test_history_survives_restart_and_evicts_least_recent(tmp_path):
+    path = str(tmp_path / 'observations.db')
+    store = ObservationStore(path, max_cities=2)
+
+    async def first_run():
+        for city_id in (1, 2, 3):
+            for hours in (6, 0):
+                store.record(f'Город {city_id}', weather(NOW - hours * HOUR, 1000 + hours, city_id=city_id))
+        await store.close()
+
+    asyncio.run(first_run())
+    restored = ObservationStore(path, max_cities=2)
+    restored.load()
+
+    assert restored.stats()['cities'] == 2
+    assert restored.pressure_trend('Город 1', weather(NOW, 1000, city_id=1)) is None
+    assert restored.pressure_trend('Город 3', weather(NOW, 1000, city_id=3)) == (-6.0, 6.0)
@@ -0,0 +1,99 @@
+import asyncio
+
+from prefetch import PrefetchScheduler
+from weather import BACKGROUND, INTERACTIVE, QuotaGovernor
+
+NOW = 1_000_000.0
+
+
+class FakeCache:
+    def __init__(self, expires=None):
+        self.expires = expires or {}
+        self.refreshed = []
+
+    def expires_at(self, key):
+        return self.expires.get(key)
+
+    async def refresh(self, city, url_type, fetch):
+        data = await fetch(city, url_type)
+        self.refreshed.append((city, url_type))
+        return data
+
+
+async def fetch(city, url_type):
+    return {'name': city}
+
+
+def scheduler(cache, **kwargs):
+    return PrefetchScheduler(cache, fetch, **kwargs)
+
+
+def test_due_refreshes_by_expiry_then_popularity():
+    cache = FakeCache({
+        ('москва', 'today'): NOW + 100, ('москва', 'forecast'): NOW + 3600,
+        ('тверь', 'today'): NOW + 100, ('тверь', 'forecast'): NOW + 250,
+        ('клин', 'today'): NOW + 3600, ('клин', 'forecast'): NOW + 3600,
+    })
+    prefetch = scheduler(cache, refresh_ahead=300)
+    for city in ['Москва'] * 3 + ['Тверь'] + ['Клин'] * 5:
+        prefetch.record(city)
+    prefetch.record('Омск')
+
+    # Записи без кэша первыми, затем по сроку истечения, при равенстве — популярные раньше
+    assert prefetch.due_refreshes(NOW) == [
+        ('омск', 'forecast'), ('омск', 'today'),
+        ('москва', 'today'), ('тверь', 'today'), ('тверь', 'forecast'),
+    ]
+
+
+def test_only_top_cities_are_refreshed():
+    prefetch = scheduler(FakeCache(), top_cities=2)
+    for city in ['Тверь', 'Москва', 'Москва', 'Клин', 'Клин', 'Клин']:
+        prefetch.record(city)
+
+    assert {key for key, _ in prefetch.due_refreshes(NOW)} == {'клин', 'москва'}
+
+
+def test_run_stays_within_the_cycle_budget():
+    cache = FakeCache()
+    prefetch = scheduler(cache, interval=60, calls_per_minute=3)
+    for city in ['Москва', 'Тверь', 'Клин']:
+        prefetch.record(city)
+
+    asyncio.run(prefetch.run())
+
+    assert len(cache.refreshed) == 3
+    assert prefetch.refreshed == 3
+    # Запрос к API идёт по названию, которое ввёл пользователь
+    assert {city for city, _ in cache.refreshed} <= {'Москва', 'Тверь', 'Клин'}
+
+
+def test_background_reserve_stops_the_cycle():
+    governor = QuotaGovernor(per_minute=10, per_day=1000, background_reserve=0.5)
+
+    async def governed_fetch(city, url_type):
+        await governor.acquire(BACKGROUND)
+        return {'name': city}
+
+    cache = FakeCache()
+    prefetch = PrefetchScheduler(cache, governed_fetch, interval=60, calls_per_minute=100)
+    for i in range(10):
+        prefetch.record(f'Город {i}')
+
+    asyncio.run(prefetch.run())
+
+    # Фоновые запросы берут только токены сверх резерва, остальное остаётся пользователям
+    assert len(cache.refreshed) == 5
+    assert governor.stats()['denied'][BACKGROUND] == 1
+    asyncio.run(governor.acquire(INTERACTIVE))
+    assert governor.stats()['granted'][INTERACTIVE] == 1
+
+
+def test_popularity_decays_and_cold_cities_are_forgotten():
+    prefetch = scheduler(FakeCache(), calls_per_minute=0)
+    prefetch.record('Тверь')
+
+    for _ in range(200):
+        asyncio.run(prefetch.run())
+
+    assert prefetch.popularity == {} and prefetch.city_names == {}
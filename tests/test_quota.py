@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from weather import BACKGROUND, INTERACTIVE, QuotaExceeded, QuotaGovernor
+
+
+def take(governor, priority, count):
+    """Сколько из count запросов получили разрешение"""
+    async def scenario():
+        granted = 0
+        for _ in range(count):
+            try:
+                await governor.acquire(priority)
+                granted += 1
+            except QuotaExceeded:
+                pass
+        return granted
+    return asyncio.run(scenario())
+
+
+def test_background_stops_at_reserve_interactive_uses_it():
+    governor = QuotaGovernor(per_minute=10, per_day=1000, background_reserve=0.2, max_wait=0)
+
+    assert take(governor, BACKGROUND, 20) == 8
+    assert take(governor, INTERACTIVE, 20) == 2
+    stats = governor.stats()
+    assert stats['granted'] == {INTERACTIVE: 2, BACKGROUND: 8}
+    assert stats['denied'] == {INTERACTIVE: 18, BACKGROUND: 12}
+
+
+def test_daily_limit_keeps_reserve_for_interactive():
+    governor = QuotaGovernor(per_minute=100, per_day=10, background_reserve=0.5, max_wait=0)
+
+    assert take(governor, BACKGROUND, 10) == 5
+    assert take(governor, INTERACTIVE, 10) == 5
+    assert governor.stats()['day_used'] == 10
+
+
+def test_interactive_waits_for_refill():
+    governor = QuotaGovernor(per_minute=600, per_day=1000, background_reserve=0, max_wait=1)
+    governor.tokens = 0.0
+
+    assert take(governor, INTERACTIVE, 1) == 1
+
+
+def test_penalize_blocks_every_priority():
+    governor = QuotaGovernor(per_minute=100, per_day=1000, max_wait=0.05)
+    governor.penalize(60)
+
+    assert take(governor, INTERACTIVE, 1) == 0
+    assert take(governor, BACKGROUND, 1) == 0
+    assert governor.stats()['tokens'] < 1
@@ -0,0 +1,78 @@
+import pytest
+
+from database import FishingDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FishingDatabase(str(tmp_path / 'spots.db'))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def spot(db):
+    return db.get_spots_by_city('Москва')[0]['id']
+
+
+def aggregates(db, spot):
+    return db.connection().execute(
+        'SELECT rating_sum, rating_count, avg_rating FROM fishing_spots WHERE id = ?', (spot,)
+    ).fetchone()
+
+
+def test_new_ratings_update_aggregates(db, spot):
+    db.add_spot_rating(spot, 1, 5)
+    db.add_spot_rating(spot, 2, 2)
+
+    assert aggregates(db, spot) == (7, 2, 3.5)
+
+
+def test_rerating_through_upsert_replaces_the_old_rating(db, spot):
+    db.add_spot_rating(spot, 1, 5)
+    db.add_spot_rating(spot, 2, 2)
+    db.add_spot_rating(spot, 1, 1)
+
+    assert aggregates(db, spot) == (3, 2, 1.5)
+
+
+def test_rerating_through_insert_or_replace(db, spot):
+    db.add_spot_rating(spot, 1, 5)
+    conn = db.connection()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO spot_ratings (spot_id, user_id, rating) VALUES (?, ?, ?)',
+                     (spot, 1, 3))
+
+    assert aggregates(db, spot) == (3, 1, 3.0)
+
+
+def test_deleting_ratings_updates_aggregates(db, spot):
+    db.add_spot_rating(spot, 1, 5)
+    db.add_spot_rating(spot, 2, 2)
+    conn = db.connection()
+    with conn:
+        conn.execute('DELETE FROM spot_ratings WHERE spot_id = ? AND user_id = ?', (spot, 1))
+    assert aggregates(db, spot) == (2, 1, 2.0)
+
+    with conn:
+        conn.execute('DELETE FROM spot_ratings WHERE spot_id = ?', (spot,))
+    assert aggregates(db, spot) == (0, 0, 0)
+
+
+def test_moving_a_rating_to_another_spot(db, spot):
+    other = db.get_spots_by_city('Москва')[1]['id']
+    db.add_spot_rating(spot, 1, 4)
+    conn = db.connection()
+    with conn:
+        conn.execute('UPDATE spot_ratings SET spot_id = ? WHERE spot_id = ?', (other, spot))
+
+    assert aggregates(db, spot) == (0, 0, 0)
+    assert aggregates(db, other) == (4, 1, 4.0)
+
+
+def test_invalid_rating_is_rejected_without_touching_aggregates(db, spot):
+    db.add_spot_rating(spot, 1, 4)
+
+    assert db.add_spot_rating(spot, 1, 6) is False
+    assert aggregates(db, spot) == (4, 1, 4.0)
+    assert db.get_spots_by_city('Москва')[0]['rating_count'] == 1
@@ -0,0 +1,57 @@
+import itertools
+
+from scoring import fishing_score, fishing_scores, rank_cities, score_forecast
+
+# Полночь UTC 1 мая 2026
+MIDNIGHT = 1777593600
+
+
+def slot(dt, temp, pressure=1013, wind=3.0):
+    return {'dt': dt, 'main': {'temp': temp, 'feels_like': temp, 'pressure': pressure, 'humidity': 70},
+            'wind': {'speed': wind}, 'clouds': {'all': 20}}
+
+
+def forecast(*temps, timezone=0, wind=3.0):
+    """Прогноз /forecast с интервалами по 3 часа от полуночи UTC"""
+    return {'city': {'timezone': timezone},
+            'list': [slot(MIDNIGHT + i * 10800, temp, wind=wind) for i, temp in enumerate(temps)]}
+
+
+def test_vector_scores_match_scalar_rules():
+    cases = list(itertools.product((-5, 10, 15, 20, 25), (990, 1007, 1013, 1020, 1030), (0, 4.9, 5, 12)))
+    temps, pressures, winds = zip(*cases)
+
+    assert list(fishing_scores(temps, pressures, winds)) == [fishing_score(*case) for case in cases]
+
+
+def test_best_window_is_found_inside_the_day():
+    # Утро холодное, вечер тёплый: первый интервал дня говорит о плохом клёве
+    days = score_forecast(forecast(2, 3, 5, 8, 14, 16, 15, 9, 12))
+
+    assert [day['slots'] for day in days] == [8, 1]
+    assert days[0]['best_score'] == 6
+    assert (days[0]['window_start'].hour, days[0]['window_end'].hour) == (12, 21)
+    assert (days[0]['min_temp'], days[0]['max_temp']) == (2, 16)
+
+
+def test_days_follow_city_timezone():
+    days = score_forecast(forecast(15, 15, 15, 15, timezone=-4 * 3600))
+
+    # В UTC-4 интервалы 00:00 и 03:00 UTC приходятся ещё на 30 апреля
+    assert [(day['date'].day, day['slots']) for day in days] == [(30, 2), (1, 2)]
+
+
+def test_rank_cities_orders_by_best_then_mean():
+    ranking = rank_cities({
+        'Тверь': forecast(15, 15, 15),
+        'Клин': forecast(15, -5, -5),
+        'Омск': forecast(-5, -5, -5),
+        'Орск': forecast(15, 15, 15, wind=8),
+        'Пустой': {'list': []},
+        'Нет данных': None,
+    })
+
+    assert [city for city, _, _ in ranking] == ['Тверь', 'Клин', 'Орск', 'Омск']
+    assert ranking[0] == ('Тверь', 6, 6.0)
+    assert ranking[1][1] == 6 and ranking[1][2] == 4.0
+    assert rank_cities({}) == []
@@ -0,0 +1,61 @@
+import pytest
+
+from database import FishingDatabase, catch_species, species_key, split_species
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FishingDatabase(str(tmp_path / 'spots.db'))
+    yield database
+    database.close()
+
+
+@pytest.mark.parametrize('name, same_as', [
+    ('щуку', 'щука'),
+    ('Щуки', 'щука'),
+    ('караси', 'карась'),
+    ('карасей', 'карась'),
+    ('окуней', 'окунь'),
+    ('леща', 'лещ'),
+    ('судаков', 'судак'),
+    ('Налима', 'налим'),
+    ('сазаном', 'сазан'),
+    ('ёрш', 'ерш'),
+])
+def test_case_forms_share_one_key(name, same_as):
+    assert species_key(name) == species_key(same_as)
+
+
+def test_short_names_keep_their_stem():
+    # Окончание не отрезается, если от слова остаётся меньше двух букв
+    assert species_key('язь') == 'яз'
+    assert species_key('язи') == 'яз'
+    assert species_key('уклея') != species_key('уклейка')
+
+
+def test_species_lists_and_catch_text():
+    assert split_species('щука, окунь,, Щуки ') == {species_key('щука'), species_key('окунь')}
+    assert catch_species('щука 3 кг, окуни 5 шт, 2 x лещ') == {
+        species_key('щука'): 'щука', species_key('окунь'): 'окуни', species_key('лещ'): 'лещ'}
+    assert catch_species('') == {}
+
+
+def test_spots_are_found_by_any_case_form(db):
+    by_nominative = {spot['id'] for spot in db.get_spots_by_fish('щука')}
+
+    assert by_nominative
+    assert {spot['id'] for spot in db.get_spots_by_fish('щуку')} == by_nominative
+    assert {spot['id'] for spot in db.get_spots_by_fish('Щук')} == by_nominative
+    assert db.get_spots_by_fish('караси') == db.get_spots_by_fish('карась') != []
+
+
+def test_spots_by_fish_are_limited_to_best_rated(db):
+    spots = db.get_spots_by_fish('щука')
+    best = spots[-1]['id']
+    db.add_spot_rating(best, 1, 5)
+
+    top = db.get_spots_by_fish('щука', limit=2)
+
+    assert len(top) == 2
+    assert top[0]['id'] == best
+    assert [spot['id'] for spot in top[1:]] == [spot['id'] for spot in spots if spot['id'] != best][:1]
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+import pytest
+
+from cache import CachedWeather
+from database import AsyncFishingDatabase, FishingDatabase
+from subscriptions import SubscriptionEngine, parse_local_time, utc_send_minute
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+def at(day, hour, minute):
+    return datetime(2026, 5, day, hour, minute, tzinfo=timezone.utc)
+
+
+async def current_weather(city, url_type='today'):
+    return CachedWeather({'name': city}, time.time(), False)
+
+
+def render(city, url_type, data):
+    return f"Погода: {city}"
+
+
+@pytest.fixture
+def sync_db(tmp_path):
+    database = FishingDatabase(str(tmp_path / 'spots.db'))
+    yield database
+    database.close()
+
+
+def dispatch(sync_db, *moments, get_weather=current_weather, **kwargs):
+    """Проходы рассылки в указанные моменты; сообщения каждого прохода отдельно"""
+    async def scenario():
+        db = AsyncFishingDatabase(sync_db, commit_interval=0)
+        engine = SubscriptionEngine(db, get_weather, render, messages_per_second=1000, **kwargs)
+        rounds = []
+        try:
+            for now in moments:
+                bot = FakeBot()
+                await engine.dispatch(bot, now)
+                rounds.append(bot.sent)
+        finally:
+            await db.close()
+        return rounds
+    return asyncio.run(scenario())
+
+
+def test_parse_and_convert_local_time():
+    assert parse_local_time('7:30') == 450
+    assert parse_local_time('24:00') is None
+    # 6:00 в Москве (UTC+3) — 3:00 UTC, 1:00 в Москве — 22:00 UTC
+    assert utc_send_minute(360, 3 * 3600) == 180
+    assert utc_send_minute(60, 3 * 3600) == 22 * 60
+
+
+def test_catchup_window_wraps_past_midnight():
+    engine = SubscriptionEngine(None, current_weather, render, catchup_minutes=120)
+
+    assert engine.due_windows(at(2, 10, 0)) == [(480, 600, '2026-05-02')]
+    assert engine.due_windows(at(2, 0, 30)) == [
+        (1350, 1439, '2026-05-01'), (0, 30, '2026-05-02')]
+
+
+def test_missed_send_before_midnight_is_caught_up_once(sync_db):
+    sync_db.add_subscription(1, 'Москва', '02:50', 23 * 60 + 50, '2026-04-30')
+
+    rounds = dispatch(sync_db, at(2, 0, 30), at(2, 0, 31), at(2, 23, 50))
+
+    # Досылка за 1 мая после полуночи, затем обычная отправка 2 мая
+    assert [len(sent) for sent in rounds] == [1, 0, 1]
+    assert sync_db.get_due_subscriptions(0, 1439, '2026-05-03')[0]['chat_id'] == 1
+
+
+def test_already_sent_subscription_is_not_repeated_after_midnight(sync_db):
+    sync_db.add_subscription(1, 'Москва', '02:50', 23 * 60 + 50, '2026-05-01')
+
+    assert dispatch(sync_db, at(2, 0, 30)) == [[]]
+
+
+def test_cities_are_rendered_concurrently_within_limit(sync_db):
+    cities = ['Москва', 'Тверь', 'Клин', 'Омск', 'Орск']
+    for chat_id, city in enumerate(cities, 1):
+        sync_db.add_subscription(chat_id, city, '10:00', 600)
+    active = 0
+    peak = 0
+
+    async def slow_weather(city, url_type='today'):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return await current_weather(city)
+
+    rounds = dispatch(sync_db, at(2, 10, 0), get_weather=slow_weather, render_concurrency=2)
+
+    assert sorted(chat_id for chat_id, _ in rounds[0]) == [1, 2, 3, 4, 5]
+    assert peak == 2
+
+
+def test_stale_weather_is_sent_with_a_note(sync_db):
+    sync_db.add_subscription(1, 'Москва', '10:00', 600)
+
+    async def stale_weather(city, url_type='today'):
+        return CachedWeather({'name': city}, time.time() - 3600, True)
+
+    async def no_weather(city, url_type='today'):
+        return None
+
+    [[(_, text)]] = dispatch(sync_db, at(2, 10, 0), get_weather=stale_weather)
+    assert text.startswith('☀️ Доброе утро! Погода: Москва') and '60 мин назад' in text
+    # Без данных рассылка откладывается до следующего прохода
+    assert dispatch(sync_db, at(3, 10, 0), get_weather=no_weather) == [[]]
+
+
+@pytest.mark.parametrize('saved, reply', [
+    (True, 'Готово! Прогноз для города Москва будет приходить каждый день в 07:00.'),
+    (False, '⚠️ Не удалось сохранить подписку. Попробуйте позже.'),
+])
+def test_subscribe_command_reports_whether_subscription_was_saved(fishing_bot, saved, reply):
+    replies = []
+
+    async def add_subscription(*args):
+        return saved
+
+    async def reply_text(text):
+        replies.append(text)
+
+    async def scenario():
+        fishing_bot.get_weather_data = current_weather
+        fishing_bot.db.add_subscription = add_subscription
+        update = SimpleNamespace(effective_chat=SimpleNamespace(id=1),
+                                 message=SimpleNamespace(reply_text=reply_text))
+        try:
+            await fishing_bot.subscribe(update, SimpleNamespace(args=['Москва', '7:00']))
+        finally:
+            await fishing_bot.shutdown(None)
+
+    asyncio.run(scenario())
+    assert replies == [reply]
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+
+import httpx
+import pytest
+
+from weather import QuotaExceeded, QuotaGovernor, WeatherClient
+
+WEATHER = {'name': 'Тверь', 'main': {'temp': 10}}
+
+
+def make_client(handler, **kwargs):
+    client = WeatherClient('key', governor=QuotaGovernor(per_minute=1000, per_day=10000), **kwargs)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_retry_after_is_capped_by_read_timeout():
+    client = WeatherClient('key', read_timeout=5)
+    response = httpx.Response(503, headers={'Retry-After': '3600'})
+
+    assert client._backoff_delay(0, response) == 5
+    assert client._backoff_delay(0, httpx.Response(503, headers={'Retry-After': '2'})) == 2
+
+
+def test_server_error_is_retried_after_capped_delay():
+    statuses = [503, 200]
+
+    def handler(request):
+        status = statuses.pop(0)
+        if status == 503:
+            return httpx.Response(503, headers={'Retry-After': '3600'})
+        return httpx.Response(200, json=WEATHER)
+
+    async def scenario():
+        client = make_client(handler, read_timeout=0.05)
+        try:
+            return await client.fetch('Тверь', 'today')
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    assert asyncio.run(scenario()) == WEATHER
+    assert time.perf_counter() - started < 1
+
+
+def test_backoff_does_not_hold_the_concurrency_slot():
+    failed = set()
+
+    def handler(request):
+        city = request.url.params['q']
+        if city == 'Тверь' and city not in failed:
+            failed.add(city)
+            return httpx.Response(503, headers={'Retry-After': '1'})
+        return httpx.Response(200, json={'name': city})
+
+    async def scenario():
+        client = make_client(handler, max_concurrency=1, read_timeout=0.5)
+        finished = []
+
+        async def fetch(city):
+            await client.fetch(city, 'today')
+            finished.append(city)
+
+        try:
+            first = asyncio.ensure_future(fetch('Тверь'))
+            await asyncio.sleep(0.05)
+            await asyncio.gather(first, fetch('Клин'))
+        finally:
+            await client.close()
+        return finished
+
+    # Клин получает слот, пока Тверь ждёт повтора
+    assert asyncio.run(scenario()) == ['Клин', 'Тверь']
+
+
+def test_rate_limit_response_pauses_the_governor():
+    def handler(request):
+        return httpx.Response(429, headers={'Retry-After': '30'})
+
+    async def scenario():
+        client = make_client(handler)
+        try:
+            with pytest.raises(QuotaExceeded):
+                await client.fetch('Тверь', 'today')
+            assert client.governor.blocked_until > time.monotonic() + 20
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_quota_wait_does_not_hold_the_concurrency_slot():
+    class SlowGovernor(QuotaGovernor):
+        async def acquire(self, priority):
+            # Первому запросу квота достаётся только после второго
+            if not self.granted['interactive']:
+                self.granted['interactive'] += 1
+                await asyncio.sleep(0.2)
+
+    def handler(request):
+        return httpx.Response(200, json={'name': request.url.params['q']})
+
+    async def scenario():
+        client = make_client(handler, max_concurrency=1)
+        client.governor = SlowGovernor()
+        finished = []
+
+        async def fetch(city):
+            await client.fetch(city, 'today')
+            finished.append(city)
+
+        try:
+            first = asyncio.ensure_future(fetch('Тверь'))
+            await asyncio.sleep(0.05)
+            await asyncio.gather(first, fetch('Клин'))
+        finally:
+            await client.close()
+        return finished
+
+    assert asyncio.run(scenario()) == ['Клин', 'Тверь']
+
+
+def test_malformed_body_is_an_upstream_error():
+    def handler(request):
+        return httpx.Response(200, text='<html>502 Bad Gateway</html>')
+
+    async def scenario():
+        client = make_client(handler)
+        try:
+            return await client.fetch('Тверь', 'today')
+        finally:
+            await client.close()
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_request_urls_with_api_key_are_not_logged(fishing_bot, caplog):
+    def handler(request):
+        return httpx.Response(200, json=WEATHER)
+
+    async def scenario():
+        client = WeatherClient('secret-key', governor=QuotaGovernor(per_minute=1000, per_day=10000))
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await client.fetch('Тверь', 'today')
+        finally:
+            await client.close()
+            await fishing_bot.shutdown(None)
+
+    with caplog.at_level(logging.INFO):
+        assert asyncio.run(scenario()) == WEATHER
+    assert 'secret-key' not in caplog.text
@@ -0,0 +1,51 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Замер холодного старта по фазам: импорт, сборка приложения, подготовка
+    кэша, справочника и базы. Фазы могут выполняться параллельно в разных
+    потоках, поэтому их длительности считаются независимо, а итог — по часам
+    от создания таймера.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self._lock = threading.Lock()
+        self.phases = []  # (фаза, секунды) в порядке завершения
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self.phases.append((phase, seconds))
+
+    def mark(self, phase):
+        """Завершение последовательной фазы: время с предыдущей отметки."""
+        now = time.perf_counter()
+        self.record(phase, now - self._last_mark)
+        self._last_mark = now
+
+    @contextmanager
+    def measure(self, phase):
+        """Замер блока кода, в том числе выполняемого в другом потоке."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        """Сводка в лог: общее время и длительность каждой фазы."""
+        with self._lock:
+            phases = list(self.phases)
+        details = ', '.join(f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in phases)
+        logger.info(f"Холодный старт: {self.elapsed() * 1000:.0f} мс ({details})")
+        return {'total': self.elapsed(), 'phases': dict(phases)}
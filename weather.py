@@ -0,0 +1,237 @@
+import os
+import time
+import asyncio
+import logging
+import random
+from datetime import datetime, timezone
+
+import httpx
+
+from metrics import UPSTREAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Адрес API можно заменить, например на локальную заглушку при нагрузочных замерах
+WEATHER_API_BASE = os.getenv('WEATHER_API_BASE', "http://api.openweathermap.org/data/2.5").rstrip('/')
+WEATHER_API_URL_TODAY = f"{WEATHER_API_BASE}/weather"
+WEATHER_API_URL_FORECAST = f"{WEATHER_API_BASE}/forecast"
+
+# Настройки HTTP-клиента погоды (можно переопределить через переменные окружения)
+WEATHER_CONNECT_TIMEOUT = float(os.getenv('WEATHER_CONNECT_TIMEOUT', 3.0))
+WEATHER_READ_TIMEOUT = float(os.getenv('WEATHER_READ_TIMEOUT', 10.0))
+WEATHER_MAX_RETRIES = int(os.getenv('WEATHER_MAX_RETRIES', 2))
+WEATHER_BACKOFF_BASE = float(os.getenv('WEATHER_BACKOFF_BASE', 0.5))
+WEATHER_MAX_CONCURRENCY = int(os.getenv('WEATHER_MAX_CONCURRENCY', 10))
+
+# Коды ответа, при которых имеет смысл повторить запрос
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+
+# Лимиты тарифа OpenWeatherMap (бесплатный: 60 запросов в минуту, 1 000 000 в месяц)
+OWM_CALLS_PER_MINUTE = int(os.getenv('OWM_CALLS_PER_MINUTE', 60))
+OWM_CALLS_PER_DAY = int(os.getenv('OWM_CALLS_PER_DAY', 30000))
+# Доля квоты, которую фоновые запросы не трогают и оставляют пользователям
+OWM_BACKGROUND_RESERVE = float(os.getenv('OWM_BACKGROUND_RESERVE', 0.3))
+# Сколько пользовательский запрос может ждать освобождения квоты, секунд
+OWM_MAX_QUOTA_WAIT = float(os.getenv('OWM_MAX_QUOTA_WAIT', 2.0))
+
+# Приоритеты запросов к API
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+
+class QuotaExceeded(Exception):
+    """Квота запросов к API погоды исчерпана."""
+
+
+class QuotaGovernor:
+    """
+    Ограничитель запросов к OpenWeatherMap: ведро токенов под минутный лимит
+    и дневной счётчик. Пользовательские запросы могут подождать пополнения
+    ведра, фоновые получают токен только сверх резерва и никогда не ждут.
+    """
+
+    def __init__(self, per_minute=OWM_CALLS_PER_MINUTE, per_day=OWM_CALLS_PER_DAY,
+                 background_reserve=OWM_BACKGROUND_RESERVE, max_wait=OWM_MAX_QUOTA_WAIT):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.per_day = per_day
+        self.background_reserve = background_reserve
+        self.max_wait = max_wait
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.day = None
+        self.day_used = 0
+        self.granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.denied = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        today = datetime.now(timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.day_used = 0
+
+    def _try_take(self, priority):
+        self._refill()
+        if time.monotonic() < self.blocked_until:
+            return False
+        reserve = self.background_reserve if priority == BACKGROUND else 0.0
+        if self.day_used >= self.per_day * (1 - reserve):
+            return False
+        if self.tokens - 1 < self.capacity * reserve:
+            return False
+        self.tokens -= 1
+        self.day_used += 1
+        self.granted[priority] += 1
+        return True
+
+    async def acquire(self, priority=INTERACTIVE):
+        """Получить разрешение на один запрос или выбросить QuotaExceeded."""
+        if self._try_take(priority):
+            return
+        if priority == INTERACTIVE:
+            deadline = time.monotonic() + self.max_wait
+            while self.day_used < self.per_day:
+                now = time.monotonic()
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0.01)
+                if now + wait > deadline:
+                    break
+                await asyncio.sleep(wait)
+                if self._try_take(priority):
+                    return
+        self.denied[priority] += 1
+        raise QuotaExceeded(f"квота API погоды исчерпана ({priority})")
+
+    def penalize(self, retry_after):
+        """Источник ответил 429: не отправлять запросы retry_after секунд."""
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        self._refill()
+        return {
+            'tokens': round(self.tokens, 2),
+            'day_used': self.day_used,
+            'day_limit': self.per_day,
+            'granted': dict(self.granted),
+            'denied': dict(self.denied),
+        }
+
+
+class WeatherClient:
+    """Асинхронный клиент OpenWeatherMap с пулом соединений, таймаутами и повторами."""
+
+    def __init__(self, api_key,
+                 connect_timeout=WEATHER_CONNECT_TIMEOUT,
+                 read_timeout=WEATHER_READ_TIMEOUT,
+                 max_retries=WEATHER_MAX_RETRIES,
+                 backoff_base=WEATHER_BACKOFF_BASE,
+                 max_concurrency=WEATHER_MAX_CONCURRENCY,
+                 governor=None,
+                 gazetteer=None):
+        self.api_key = api_key
+        self.governor = governor or QuotaGovernor()
+        self.gazetteer = gazetteer
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_concurrency,
+            max_keepalive_connections=max_concurrency,
+            keepalive_expiry=60
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+
+    def _get_client(self):
+        """Ленивое создание клиента внутри работающего цикла событий."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    def _backoff_delay(self, attempt, response=None):
+        """
+        Задержка перед повтором: Retry-After от сервера, но не дольше таймаута
+        чтения, или экспонента с джиттером.
+        """
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.timeout.read)
+        return self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+
+    async def fetch(self, city, url_type='forecast', priority=INTERACTIVE):
+        """
+        Получение данных о погоде. Возвращает dict или None при ошибке.
+        Каждая попытка расходует квоту; при её нехватке выбрасывается QuotaExceeded.
+        """
+        params = {
+            'appid': self.api_key,
+            'units': 'metric',
+            'lang': 'ru'
+        }
+        # Известный город запрашиваем по id или координатам, а не по строке
+        place = self.gazetteer.resolve(city) if self.gazetteer is not None else None
+        if place is not None and place.owm_id:
+            params['id'] = place.owm_id
+        elif place is not None:
+            params['lat'] = place.lat
+            params['lon'] = place.lon
+        else:
+            params['q'] = city
+        api_url = WEATHER_API_URL_FORECAST if url_type == 'forecast' else WEATHER_API_URL_TODAY
+        endpoint = 'forecast' if url_type == 'forecast' else 'today'
+        client = self._get_client()
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            # Семафор занят только на время самого запроса: ожидание квоты и
+            # ожидание перед повтором не мешают запросам других пользователей
+            await self.governor.acquire(priority)
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(api_url, params=params)
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, str(response.status_code))
+                    if response.status_code == 429:
+                        retry_after = response.headers.get('Retry-After', '')
+                        self.governor.penalize(float(retry_after) if retry_after.isdigit() else 60.0)
+                        logger.warning("API погоды ответил 429, запросы приостановлены")
+                        raise QuotaExceeded("API погоды ответил 429")
+                    if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                        logger.warning(f"API погоды ответил {response.status_code}, повтор #{attempt + 1}")
+                    else:
+                        response.raise_for_status()
+                        try:
+                            data = response.json()
+                        except ValueError as e:
+                            logger.error(f"Некорректный ответ API погоды: {e}")
+                            return None
+                        if place is None and self.gazetteer is not None:
+                            # Индекс справочника обновляется здесь, в потоке цикла событий,
+                            # а в отдельный поток уходит только запись на диск
+                            learned = self.gazetteer.learn(city, data)
+                            if learned is not None:
+                                await asyncio.to_thread(self.gazetteer.save_learned, city, learned)
+                        return data
+                except httpx.HTTPStatusError as e:
+                    logger.error(f"Ошибка запроса к API погоды: {e}")
+                    return None
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    status = 'timeout' if isinstance(e, httpx.TimeoutException) else 'error'
+                    UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, status)
+                    if attempt >= self.max_retries:
+                        logger.error(f"Ошибка запроса к API погоды: {e!r}")
+                        return None
+                    logger.warning(f"Сбой соединения с API погоды ({e!r}), повтор #{attempt + 1}")
+            await asyncio.sleep(self._backoff_delay(attempt, response))
+        return None
+
+    async def close(self):
+        """Закрытие пула соединений."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
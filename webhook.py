@@ -0,0 +1,76 @@
+import re
+import json
+import signal
+import asyncio
+import logging
+
+import tornado.web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    """Приём обновления от Telegram и постановка его в очередь приложения бота."""
+
+    def initialize(self, telegram_app):
+        self.telegram_app = telegram_app
+
+    async def post(self):
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.telegram_app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректное обновление на вебхуке: {e!r}")
+            raise tornado.web.HTTPError(400)
+        await self.telegram_app.update_queue.put(update)
+
+
+def _log_request(handler):
+    # Строка журнала tornado на каждое обновление нужна только при отладке
+    logger.debug(f"{handler.get_status()} {handler.request.method} {handler.request.path} "
+                 f"{handler.request.request_time() * 1000:.1f} мс")
+
+
+def webhook_app(application, url_path, routes=()):
+    """tornado-приложение: обновления Telegram на /url_path и дополнительные маршруты"""
+    return tornado.web.Application([
+        (rf'/{re.escape(url_path)}/?', TelegramWebhookHandler, {'telegram_app': application}),
+        *routes,
+    ], log_function=_log_request)
+
+
+async def serve_webhook(application, listen, port, url_path, webhook_url, routes=()):
+    """
+    Замена Application.run_webhook: тот же жизненный цикл приложения (post_init,
+    старт, post_stop, post_shutdown), но HTTP-сервер свой, и на том же порту
+    он обслуживает дополнительные маршруты routes, например /metrics.
+    Работает до SIGINT или SIGTERM.
+    """
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    web_app = webhook_app(application, url_path, routes)
+    server = None
+    started = False
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        server = web_app.listen(port, address=listen)
+        await application.bot.set_webhook(url=webhook_url)
+        await application.start()
+        started = True
+        logger.info(f"Вебхук принимает обновления на {listen}:{port}")
+        await stopping.wait()
+    finally:
+        if server is not None:
+            server.stop()
+        if started:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)